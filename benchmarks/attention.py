@@ -0,0 +1,159 @@
+"""
+channel attention of models.attentions against a naive implementation, on random windows, fully offline :
+
+python -m benchmarks.attention
+python -m benchmarks.attention --channels 735 --windows 1,8 --batch-sizes 256,1024 --output attention.json
+
+cases, every combination of :
+grouped      the gates of the channels, or of the 8 modifications of the Epigenomics tracks
+windows      windows of an item, (batch, window, channels) inputs
+batch_size   items of a batch
+
+The naive implementation is the usual squeeze-excitation of the images, on (batch, channels, window) : the
+input is transposed, the gates are expanded to the size of the input, and the groups are pooled one by one.
+Both have the same weights and give the same output. Per case and implementation :
+forward_ms      milliseconds of a forward pass, the best of --repeat
+backward_ms     milliseconds of a forward and backward pass, the best of --repeat
+allocated_mb    MB of the tensors allocated by a forward pass
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+
+import torch
+
+from torch import nn
+from torch.utils._pytree import tree_flatten
+from torch.utils._python_dispatch import TorchDispatchMode
+from logging import Logger
+from itertools import product
+from typing import Callable, Dict, List, Optional
+
+from models.attentions import ChannelAttention
+
+from .conversion import machine
+
+MODIFICATIONS = ['DNase', 'H3K27ac', 'H3K27me3', 'H3K36me3', 'H3K4me1', 'H3K4me3', 'H3K9ac', 'H3K9me3']
+
+
+class NaiveChannelAttention(nn.Module):
+
+    """
+    squeeze-excitation as written for images, with the weights of a ChannelAttention
+    """
+
+    def __init__(self, attention: ChannelAttention) -> None:
+        super().__init__()
+        self.excitation = attention.excitation
+        self.groups = attention.groups
+        self.n_groups = attention.n_groups
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        x = x.transpose(1, 2).contiguous()
+        s = nn.functional.adaptive_avg_pool1d(x, 1).squeeze(-1)
+        if self.groups is not None:
+            s = torch.stack([ s[:, self.groups == g].mean(dim = 1) for g in range(self.n_groups) ], dim = 1)
+            g = self.excitation(s)
+            gates = torch.empty_like(x)
+            for i in range(self.n_groups):
+                gates[:, self.groups == i, :] = g[:, i, None, None].expand(-1, int((self.groups == i).sum()), x.shape[2])
+        else:
+            gates = self.excitation(s).unsqueeze(-1).expand_as(x).contiguous()
+        return (x * gates).transpose(1, 2).contiguous()
+
+def _best_ms(fn: Callable, repeat: int) -> float:
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1e3 * min(times)
+
+class _Allocations(TorchDispatchMode):
+
+    """
+    the bytes of the new storages created by the ops, the views of a tensor are not counted
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.bytes = 0
+        self.storages = set()
+
+    def __torch_dispatch__(self, func, types, args = (), kwargs = None):
+        out = func(*args, **(kwargs or {}))
+        for t in tree_flatten(out)[0]:
+            if isinstance(t, torch.Tensor):
+                storage = t.untyped_storage()
+                if storage.data_ptr() not in self.storages:
+                    self.storages.add(storage.data_ptr())
+                    self.bytes += storage.nbytes()
+        return out
+
+def _allocated_mb(module: nn.Module, x: torch.Tensor) -> float:
+    allocations = _Allocations()
+    # the input and the weights are not allocated by the forward pass
+    allocations.storages.update([ t.untyped_storage().data_ptr() for t in [x] + list(module.parameters()) + list(module.buffers()) ])
+    with torch.no_grad(), allocations:
+        module(x)
+    return allocations.bytes / 2**20
+
+def bench_attention(module: nn.Module, x: torch.Tensor, repeat: int) -> Dict[str, float]:
+    def forward():
+        with torch.no_grad():
+            module(x)
+
+    def backward():
+        module.zero_grad(set_to_none = True)
+        module(x).sum().backward()
+
+    return {'forward_ms': _best_ms(forward, repeat), 'backward_ms': _best_ms(backward, repeat), 'allocated_mb': _allocated_mb(module, x)}
+
+def run_benchmarks(channels: int = 735, windows: List[int] = [1, 8], batch_sizes: List[int] = [256, 1024],
+                   grouped: List[bool] = [False, True], repeat: int = 5, seed: int = 0,
+                   logger: Logger = logging.getLogger()) -> Dict:
+    torch.manual_seed(seed)
+    config = {'channels': channels, 'repeat': repeat, 'threads': torch.get_num_threads()}
+    results = {'machine': machine(), 'config': config, 'results': {}}
+    # the channels of the modifications one after the other, as in the Epigenomics summary
+    groups = torch.arange(channels) * len(MODIFICATIONS) // channels
+
+    for group, w, bs in product(grouped, windows, batch_sizes):
+        attention = ChannelAttention(channels, groups = groups if group else None)
+        naive = NaiveChannelAttention(attention)
+        x = torch.rand(bs, w, channels)
+        with torch.no_grad():
+            if not torch.allclose(attention(x), naive(x), atol = 1e-6):
+                raise RuntimeError('the implementations give different outputs')
+
+        name = f"{'grouped' if group else 'channels'}/w{w}/b{bs}"
+        r = {'fused': bench_attention(attention, x, repeat), 'naive': bench_attention(naive, x, repeat)}
+        r['speedup'] = r['naive']['backward_ms'] / r['fused']['backward_ms'] if r['fused']['backward_ms'] > 0 else None
+        results['results'][name] = r
+        logger.info(f"{name:<20} fused {r['fused']['forward_ms']:8.2f} / {r['fused']['backward_ms']:8.2f} ms {r['fused']['allocated_mb']:8.1f} MB  "
+                    f"naive {r['naive']['forward_ms']:8.2f} / {r['naive']['backward_ms']:8.2f} ms {r['naive']['allocated_mb']:8.1f} MB  "
+                    f"x{r['speedup'] or 0:.1f}")
+    return results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog = 'python -m benchmarks.attention', description = 'channel attention against a naive implementation')
+    parser.add_argument('--channels', type = int, default = 735)
+    parser.add_argument('--windows', type = lambda v: [ int(w) for w in v.split(',') ], default = [1, 8])
+    parser.add_argument('--batch-sizes', type = lambda v: [ int(b) for b in v.split(',') ], default = [256, 1024])
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--output', default = None, help = 'JSON file of the results')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level = logging.INFO, format = '%(message)s')
+    results = run_benchmarks(args.channels, args.windows, args.batch_sizes, repeat = args.repeat, logger = logging.getLogger('benchmarks'))
+    if args.output is not None:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent = 1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
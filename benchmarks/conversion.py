@@ -0,0 +1,194 @@
+"""
+throughput of the conversion pipeline on synthetic inputs, fully offline :
+
+python -m benchmarks.conversion --scales tiny,small,medium
+python -m benchmarks.conversion --scales small,medium --save-baseline
+python -m benchmarks.conversion --scales small,medium --baseline ci-baseline.json
+
+benchmarks, per scale of benchmarks.synthetic.SCALES :
+bigwig_build_h5       BioBigWigDataset.build_h5 of every track, rows = windows x tracks
+concat_summary        BioBigWigDataset._concat_summary_table of every chromosome, rows = windows
+bigwig_summary        BioBigWigDataset.build_h5_summary, rows = windows
+maf_build_h5          BioMafDataset.build_h5 of one PCAWG MAF file, rows = mutations
+
+The best of --repeat runs is kept. Against a baseline, a benchmark is a regression if its rows/s are lower
+than (1 - tolerance) x the baseline, and the command exits with 1. The baselines depend on the class of the
+machine, its processor, CPUs and python, not on its host name : there is one baseline per class,
+benchmarks/baselines/conversion-{processor}-{cpus}cpu-py{python}.json by default. The reference baseline of the
+CI runners (x86_64, 1 CPU) is committed there, the slowest of three runs of the small scale : the runs of the
+tiny scale are too short to be compared. A baseline is compared only to the results of its class, a baseline given with
+--baseline which is missing or of another class is an error (exit 2). --save-baseline adds the scales to the
+baseline of the same class, and replaces the baseline of another class.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+
+from logging import Logger
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from datasets import MappabilityDataset, PCAWGDataset
+
+from .synthetic import SCALES, write_bigwig, write_maf
+
+BASELINES = Path(__file__).parent.joinpath('baselines')
+
+def machine() -> Dict[str, str]:
+    return {'node': platform.node(), 'processor': platform.processor() or platform.machine(),
+            'cpus': os.cpu_count(), 'python': platform.python_version()}
+
+def machine_class(machine: Dict[str, str]) -> Dict[str, str]:
+    # the machines running the same baseline, the host names of CI runners change at every run
+    return { k: machine[k] for k in ['processor', 'cpus', 'python'] }
+
+def baseline_fname(machine: Dict[str, str]) -> Path:
+    name = f"{machine['processor']}-{machine['cpus']}cpu-py{machine['python']}"
+    return BASELINES.joinpath(f"conversion-{re.sub(r'[^A-Za-z0-9._-]', '_', name)}.json")
+
+def _best(runs: List[Dict]) -> Dict:
+    best = min(runs, key = lambda r: r['seconds'])
+    best['rows_per_sec'] = best['rows'] / best['seconds'] if best['seconds'] > 0 else None
+    return best
+
+def bench_bigwig(workdir: Path, scale: Dict[str, int], repeat: int, logger: Logger) -> Dict[str, Dict]:
+    raw_path = workdir.joinpath('raw')
+    raw_path.mkdir(parents = True, exist_ok = True)
+    mers = [24, 36, 40, 50, 75, 100][:scale['bigwig_tracks']]
+    for i, mer in enumerate(mers):
+        write_bigwig(raw_path.joinpath(f"wgEncodeCrgMapabilityAlign{mer}mer.bigWig"), density = scale['bigwig_density'], value = i, seed = i)
+
+    rslt = scale['bigwig_resolution']
+    # opened without building, the stages are called one by one
+    dataset = MappabilityDataset(h5_path = workdir.joinpath('h5'), raw_path = raw_path, resolutions = [rslt],
+                                 design_mers = mers, logger = logger, dry_run = True)
+    # every run computes again, the checkpoints are ignored
+    dataset.rebuild_h5 = True
+
+    runs = {'bigwig_build_h5': [], 'concat_summary': [], 'bigwig_summary': []}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for bigwig, h5 in zip(dataset.bigwig_list, dataset.h5_list):
+            dataset.build_h5(bigwig = bigwig, h5 = h5, resolutions = [rslt], summary = dataset.summary)
+        records = dataset.telemetry.records()
+        runs['bigwig_build_h5'].append({'seconds': time.perf_counter() - start,
+                                        'rows': sum([ r['rows'] for r in records if r['stage'] == 'bigwig2df' ])})
+
+        start = time.perf_counter()
+        dataset.build_h5_summary(rslt)
+        seconds = time.perf_counter() - start
+        concat = [ r for r in dataset.telemetry.records() if r['stage'] == 'concat_summary' ]
+        runs['bigwig_summary'].append({'seconds': seconds, 'rows': sum([ r['rows'] for r in concat ])})
+        runs['concat_summary'].append({'seconds': sum([ r['wall'] for r in concat ]), 'rows': sum([ r['rows'] for r in concat ])})
+        # a new sink for the next run
+        dataset.telemetry.report(workdir.joinpath('telemetry.json'))
+    return { k: _best(v) for k, v in runs.items() }
+
+def bench_maf(workdir: Path, scale: Dict[str, int], repeat: int, logger: Logger) -> Dict[str, Dict]:
+    raw_path = workdir.joinpath('raw')
+    raw_path.mkdir(parents = True, exist_ok = True)
+    maf = raw_path.joinpath('Lymph-CLL_SNV_MNV_INDEL.ICGC.annot.txt.gz')
+    write_maf(maf, scale['maf_rows'], scale['maf_samples'], cohort = 'Lymph-CLL')
+
+    dataset = PCAWGDataset(h5_path = workdir.joinpath('h5'), raw_path = raw_path, designed_subsets = ['Lymph-CLL'],
+                           logger = logger, dry_run = True)
+    runs = []
+    for i in range(repeat):
+        h5 = workdir.joinpath('h5', f"maf-{i}.h5")
+        start = time.perf_counter()
+        rows = dataset.build_h5(maf = maf, h5 = h5)
+        runs.append({'seconds': time.perf_counter() - start, 'rows': rows})
+        os.remove(h5)
+    return {'maf_build_h5': _best(runs)}
+
+def run_benchmarks(scales: List[str], workdir: Optional[Path] = None, repeat: int = 3,
+                   logger: Logger = logging.getLogger()) -> Dict:
+    results = {'machine': machine(), 'results': {}}
+    # the datasets log every chromosome
+    quiet = logging.getLogger(f"{logger.name}.datasets")
+    quiet.setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory(dir = workdir) as tmp:
+        for name in scales:
+            scale_dir = Path(tmp).joinpath(name)
+            results['results'][name] = {}
+            results['results'][name].update(bench_bigwig(scale_dir.joinpath('bigwig'), SCALES[name], repeat, quiet))
+            results['results'][name].update(bench_maf(scale_dir.joinpath('maf'), SCALES[name], repeat, quiet))
+            for bench, r in results['results'][name].items():
+                logger.info(f"{name:<8} {bench:<16} {r['rows']:>10} rows {r['seconds']:>9.3f}s {r['rows_per_sec'] or 0:>12.0f} rows/s")
+    return results
+
+def compare(results: Dict, baseline: Dict, tolerance: float = 0.25, metric: str = 'rows_per_sec') -> List[str]:
+    """
+    the benchmarks slower than the baseline by more than tolerance, the throughputs are results[scale][bench][metric]
+    """
+    regressions = []
+    for name, benches in results['results'].items():
+        for bench, r in benches.items():
+            base = baseline['results'].get(name, {}).get(bench)
+            if base is None or base[metric] is None or r[metric] is None:
+                continue
+            if r[metric] < (1 - tolerance) * base[metric]:
+                regressions.append(f"{name} {bench}: {metric} {r[metric]:.0f}, baseline {base[metric]:.0f}")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog = 'python -m benchmarks.conversion', description = 'conversion throughput')
+    parser.add_argument('--scales', type = lambda v: v.split(','), default = ['tiny', 'small'], help = f"comma separated {list(SCALES)}")
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--baseline', type = Path, default = None, help = 'baseline of the class of this machine by default, see baseline_fname')
+    parser.add_argument('--save-baseline', action = 'store_true', help = 'store the results as the baseline')
+    parser.add_argument('--tolerance', type = float, default = 0.25, help = 'slowdown allowed against the baseline')
+    parser.add_argument('--output', type = Path, default = None, help = 'JSON file of the results')
+    parser.add_argument('--workdir', type = Path, default = None, help = 'directory of the synthetic inputs')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level = logging.INFO, format = '%(message)s')
+    logger = logging.getLogger('benchmarks')
+
+    results = run_benchmarks(args.scales, args.workdir, args.repeat, logger)
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent = 1))
+
+    fname = baseline_fname(results['machine']) if args.baseline is None else args.baseline
+    if args.save_baseline:
+        baseline = json.loads(fname.read_text()) if fname.is_file() else None
+        # the results of two classes of machines are never mixed in a baseline
+        if baseline is None or machine_class(baseline['machine']) != machine_class(results['machine']):
+            if baseline is not None:
+                logger.warning(f"baseline of another machine {baseline['machine']} replaced")
+            baseline = {'machine': results['machine'], 'results': {}}
+        baseline['machine'] = results['machine']
+        baseline['results'].update(results['results'])
+        fname.parent.mkdir(parents = True, exist_ok = True)
+        fname.write_text(json.dumps(baseline, indent = 1))
+        logger.info(f"baseline saved to {fname}")
+        return 0
+
+    # the baseline requested explicitly must be compared, the default one only if the machine has one
+    if not fname.is_file():
+        if args.baseline is not None:
+            logger.error(f"no baseline {fname}")
+            return 2
+        logger.warning(f"no baseline {fname} of this class of machine, not compared, record one with --save-baseline")
+        return 0
+    baseline = json.loads(fname.read_text())
+    if machine_class(baseline['machine']) != machine_class(results['machine']):
+        if args.baseline is not None:
+            logger.error(f"baseline of another machine {baseline['machine']}, can't be compared")
+            return 2
+        logger.warning(f"baseline of another machine {baseline['machine']}, not compared")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for r in regressions:
+        logger.error(f"regression: {r}")
+    return 1 if len(regressions) > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
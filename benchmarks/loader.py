@@ -0,0 +1,225 @@
+"""
+throughput and latency of the DataLoader of the window datasets on synthetic summaries, fully offline :
+
+python -m benchmarks.loader
+python -m benchmarks.loader --workers 0,2,4 --batch-sizes 128,1024 --chunk-sizes 100,1000 --caching default,core
+python -m benchmarks.loader --output loader.json --baseline loader-main.json
+
+cases, every combination of :
+kind         features     the window features only, as the BioBigWigDataset summaries feed them
+             mutations    the features and the mutation counts of each cohort, PCAWGDataset items
+backend      storage of the feature summary, benchmarks.synthetic.SUMMARY_BACKENDS
+chunk_size   windows in a h5 chunk of the feature summary, the h5_chunk_size of BioBigWigDataset
+caching      h5py.File arguments of the reads, CACHING
+workers      num_workers of the DataLoader
+batch_size   windows in a batch
+
+Each case reads --batches shuffled batches after the first one, which also waits for the workers to start and
+is reported apart :
+samples_per_sec     windows per second seen by the training loop
+p50, p99            seconds waited by the training loop for a batch
+bytes_per_sample    bytes read by the processes loading the batches (/proc/self/io) per window
+
+The results carry the commit and the machine, the results of two commits on the same machine are compared case
+by case with --baseline, and the command exits with 1 on a regression.
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+import numpy as np
+import torch
+
+from logging import Logger
+from pathlib import Path
+from itertools import product
+from typing import Any, Dict, List, Optional
+
+from torch.utils.data import DataLoader, Dataset
+
+from datasets import BioDigDriverfDataset, PCAWGDataset
+from mini_utils.telemetry import io_counters
+
+from .conversion import compare, machine
+from .synthetic import SUMMARY_BACKENDS, write_maf, write_summary
+
+KINDS = ['features', 'mutations']
+
+# keyword arguments of h5py.File, BioDigDriverfDataset.h5_open_kwargs
+CACHING: Dict[str, Dict[str, Any]] = {
+    'default': {},
+    'nocache': {'rdcc_nbytes': 0},
+    'large':   {'rdcc_nbytes': 64 * 2**20, 'rdcc_nslots': 100003},
+    'core':    {'driver': 'core', 'backing_store': False},
+}
+
+def commit() -> Optional[str]:
+    try:
+        root = Path(__file__).parent.parent
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = root, capture_output = True, text = True, check = True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd = root, capture_output = True, text = True).stdout.strip()
+        return rev + ('-dirty' if dirty != '' else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class _Measured(Dataset):
+
+    """
+    the batches of the dataset, counting the windows and the bytes read by the processes loading them
+    """
+
+    def __init__(self, dataset: BioDigDriverfDataset) -> None:
+        self.dataset = dataset
+        # shared with the DataLoader workers
+        self.samples = multiprocessing.Value('q', 0)
+        self.bytes_read = multiprocessing.Value('q', 0)
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    def __getitems__(self, indices: List[int]):
+        before = io_counters()
+        batch = self.dataset.__getitems__(indices)
+        after = io_counters()
+        with self.samples.get_lock():
+            self.samples.value += len(indices)
+        if before is not None:
+            with self.bytes_read.get_lock():
+                self.bytes_read.value += after['read'] - before['read']
+        return batch
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    return float(np.percentile(values, q)) if len(values) > 0 else None
+
+def bench_loader(dataset: BioDigDriverfDataset, workers: int, batch_size: int, batches: int,
+                 shuffle: bool = True, seed: int = 0) -> Dict[str, Any]:
+    measured = _Measured(dataset)
+    loader = DataLoader(measured, batch_size = batch_size, shuffle = shuffle, num_workers = workers,
+                        generator = torch.Generator().manual_seed(seed))
+    # the first batch is not timed, none of them when the windows fill less than two batches
+    batches = max(0, min(batches, len(measured) // batch_size - 1))
+
+    iterator = iter(loader)
+    start = time.perf_counter()
+    next(iterator)
+    first = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(batches):
+        start = time.perf_counter()
+        next(iterator)
+        latencies.append(time.perf_counter() - start)
+    # the workers stop, their reads of the prefetched batches are counted
+    del iterator
+
+    samples = measured.samples.value
+    return {'first_batch': first,
+            'batches': len(latencies),
+            'samples_per_sec': batch_size * len(latencies) / sum(latencies) if sum(latencies) > 0 else None,
+            'p50': _percentile(latencies, 50),
+            'p99': _percentile(latencies, 99),
+            'bytes_per_sample': measured.bytes_read.value / samples if io_counters() is not None and samples > 0 else None}
+
+def _case(backend: str, chunk_size: int, caching: str, workers: int, batch_size: int) -> str:
+    return f"{backend}/chunk{chunk_size}/{caching}/w{workers}/b{batch_size}"
+
+def run_benchmarks(workdir: Optional[Path] = None, kinds: List[str] = KINDS, backends: List[str] = ['chunked', 'gzip'],
+                   chunk_sizes: List[int] = [100, 1000], caching: List[str] = ['default', 'core'],
+                   workers: List[int] = [0, 2], batch_sizes: List[int] = [128, 1024], batches: int = 10,
+                   resolution: int = 10000, n_columns: int = 8, cohorts: List[str] = ['Breast-AdenoCa', 'Lymph-CLL'],
+                   maf_rows: int = 10000, shuffle: bool = True, logger: Logger = logging.getLogger()) -> Dict:
+    config = {'resolution': resolution, 'n_columns': n_columns, 'cohorts': cohorts, 'maf_rows': maf_rows,
+              'batches': batches, 'shuffle': shuffle}
+    results = {'machine': machine(), 'commit': commit(), 'config': config, 'results': { k: {} for k in kinds }}
+    # the datasets log every cohort
+    quiet = logging.getLogger(f"{logger.name}.datasets")
+    quiet.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(dir = workdir) as tmp:
+        raw_path = Path(tmp).joinpath('raw')
+        raw_path.mkdir()
+        for i, cohort in enumerate(cohorts):
+            write_maf(raw_path.joinpath(f"{cohort}_SNV_MNV_INDEL.ICGC.annot.txt.gz"), maf_rows, cohort = cohort, seed = i)
+        dataset = PCAWGDataset(h5_path = Path(tmp).joinpath('h5'), raw_path = raw_path, designed_subsets = cohorts,
+                               resolutions = [resolution], logger = quiet)
+
+        for backend, chunk_size in product(backends, chunk_sizes):
+            summary = Path(tmp).joinpath(f"summary.{backend}.{chunk_size}.h5")
+            write_summary(summary, resolution, n_columns, chunk_rows = chunk_size, backend = backend)
+            for kind, cache, w, bs in product(kinds, caching, workers, batch_sizes):
+                # new file handles for the next case, opened by the workers
+                dataset.close_window_reader()
+                dataset.features = [summary]
+                dataset.heads = [] if kind == 'features' else cohorts
+                dataset.h5_open_kwargs = CACHING[cache]
+
+                name = _case(backend, chunk_size, cache, w, bs)
+                r = bench_loader(dataset, w, bs, batches, shuffle = shuffle)
+                results['results'][kind][name] = r
+                if r['batches'] == 0:
+                    logger.warning(f"{kind:<10} {name:<32} no timed batch, {len(dataset)} windows for batches of {bs}, "
+                                   f"first {r['first_batch']:.2f}s")
+                    continue
+                logger.info(f"{kind:<10} {name:<32} {r['samples_per_sec'] or 0:>10.0f} samples/s  p50 {r['p50'] * 1e3:8.1f} ms  "
+                            f"p99 {r['p99'] * 1e3:8.1f} ms  {r['bytes_per_sample'] or 0:>9.0f} B/sample  first {r['first_batch']:.2f}s")
+            summary.unlink()
+        dataset.close_window_reader()
+    return results
+
+def _csv(value: str) -> List[str]:
+    return [ v.strip() for v in value.split(',') if v.strip() != '' ]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog = 'python -m benchmarks.loader', description = 'DataLoader throughput and latency')
+    parser.add_argument('--kinds', type = _csv, default = KINDS, help = f"comma separated {KINDS}")
+    parser.add_argument('--backends', type = _csv, default = ['chunked', 'gzip'], help = f"comma separated {list(SUMMARY_BACKENDS)}")
+    parser.add_argument('--chunk-sizes', type = lambda v: [ int(c) for c in _csv(v) ], default = [100, 1000])
+    parser.add_argument('--caching', type = _csv, default = ['default', 'core'], help = f"comma separated {list(CACHING)}")
+    parser.add_argument('--workers', type = lambda v: [ int(w) for w in _csv(v) ], default = [0, 2])
+    parser.add_argument('--batch-sizes', type = lambda v: [ int(b) for b in _csv(v) ], default = [128, 1024])
+    parser.add_argument('--batches', type = int, default = 10, help = 'batches timed per case')
+    parser.add_argument('--resolution', type = int, default = 10000)
+    parser.add_argument('--columns', type = int, default = 8, help = 'features of the summary')
+    parser.add_argument('--maf-rows', type = int, default = 10000, help = 'mutations per cohort')
+    parser.add_argument('--sequential', action = 'store_true', help = 'read the windows in order')
+    parser.add_argument('--baseline', type = Path, default = None, help = 'JSON results of another commit')
+    parser.add_argument('--tolerance', type = float, default = 0.25, help = 'slowdown allowed against the baseline')
+    parser.add_argument('--output', type = Path, default = None, help = 'JSON file of the results')
+    parser.add_argument('--workdir', type = Path, default = None, help = 'directory of the synthetic inputs')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level = logging.INFO, format = '%(message)s')
+    logger = logging.getLogger('benchmarks')
+
+    unknown = [ b for b in args.backends if b not in SUMMARY_BACKENDS ] + [ c for c in args.caching if c not in CACHING ] \
+            + [ k for k in args.kinds if k not in KINDS ]
+    if len(unknown) > 0:
+        parser.error(f"unknown {unknown}")
+
+    results = run_benchmarks(args.workdir, args.kinds, args.backends, args.chunk_sizes, args.caching, args.workers,
+                             args.batch_sizes, args.batches, args.resolution, args.columns, maf_rows = args.maf_rows,
+                             shuffle = not args.sequential, logger = logger)
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent = 1))
+        logger.info(f"results saved to {args.output}")
+
+    if args.baseline is None:
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    if baseline['machine'] != results['machine'] or baseline['config'] != results['config']:
+        logger.warning(f"baseline {baseline['commit']} of another machine or configuration, not compared")
+        return 0
+    regressions = compare(results, baseline, args.tolerance, metric = 'samples_per_sec')
+    for r in regressions:
+        logger.error(f"regression against {baseline['commit']}: {r}")
+    return 1 if len(regressions) > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
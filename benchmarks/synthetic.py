@@ -0,0 +1,117 @@
+"""
+synthetic inputs of the conversion pipeline, generated offline :
+
+write_bigwig   bigWig track on the hg19 chromosomes of BigWigChromSizesDict, with `density` intervals per Mb
+write_maf      PCAWG MAF (CHROM START END REF ALT SAMPLE GENE ANNOT MUT CONTEXT, no header, gzip), with
+               the mutations spread over the chromosomes by their size
+write_summary  BioBigWigDataset summary h5, one table of n_columns features per chromosome on the windows
+               of WindowGrid, stored as one of SUMMARY_BACKENDS
+
+SCALES are the sizes of the benchmarks, from the test size to a small real dataset.
+"""
+
+import gzip
+import h5py
+
+import numpy as np
+import pandas as pd
+import pyBigWig
+
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from mini_utils.bio import BigWigChromSizesDict, MUT_ANNOT
+from datasets import WindowGrid
+
+# bigwig_tracks x (genome / bigwig_resolution) windows, maf_rows mutations
+SCALES: Dict[str, Dict[str, int]] = {
+    'tiny':   {'bigwig_tracks': 2, 'bigwig_resolution': 10000000, 'bigwig_density': 1,    'maf_rows': 1000,   'maf_samples': 10},
+    'small':  {'bigwig_tracks': 2, 'bigwig_resolution': 1000000,  'bigwig_density': 10,   'maf_rows': 10000,  'maf_samples': 50},
+    'medium': {'bigwig_tracks': 4, 'bigwig_resolution': 100000,   'bigwig_density': 100,  'maf_rows': 100000, 'maf_samples': 200},
+    'large':  {'bigwig_tracks': 4, 'bigwig_resolution': 10000,    'bigwig_density': 1000, 'maf_rows': 1000000, 'maf_samples': 500},
+}
+
+NUCLEOTIDES = np.array(list('ACGT'))
+SUBSTITUTIONS = np.array(['C>A', 'C>G', 'C>T', 'T>A', 'T>C', 'T>G'])
+GENES = np.array(['.', 'TP53', 'KRAS', 'PIK3CA', 'PTEN', 'APC', 'EGFR', 'BRAF', 'NRAS', 'CDKN2A', 'ARID1A'])
+ANNOTATIONS = np.array([ a.name for a in MUT_ANNOT if a != MUT_ANNOT.INDEL ])
+
+# keyword arguments of create_dataset, given the rows of a chunk
+SUMMARY_BACKENDS = {
+    'chunked':    lambda rows, cols: {'chunks': (rows, cols)},
+    'contiguous': lambda rows, cols: {},
+    'gzip':       lambda rows, cols: {'chunks': (rows, cols), 'compression': 'gzip', 'compression_opts': 4},
+    'lzf':        lambda rows, cols: {'chunks': (rows, cols), 'compression': 'lzf'},
+}
+
+def write_bigwig(fname: Union[str, Path], density: float = 10, interval: int = 500, value: float = 0.,
+                 seed: int = 0, chrom_sizes: Optional[Dict[str, int]] = None) -> int:
+    """
+    write `density` intervals of `interval` bases per Mb, with values in [value, value + 1).
+    Return the number of intervals.
+    """
+    rng = np.random.default_rng(seed)
+    if chrom_sizes is None:
+        chrom_sizes = { chr.name: size for chr, size in BigWigChromSizesDict.items() }
+
+    bw = pyBigWig.open(str(fname), 'w')
+    bw.addHeader(list(chrom_sizes.items()))
+    total = 0
+    for chr, size in chrom_sizes.items():
+        # intervals on a grid of `interval` bases, they never overlap
+        n_slots = size // interval - 1
+        n = min(n_slots, max(1, int(density * size / 1e6)))
+        starts = np.sort(rng.choice(n_slots, n, replace = False)) * interval
+        bw.addEntries([chr] * n, starts.tolist(), ends = (starts + interval).tolist(),
+                      values = (value + rng.random(n)).tolist())
+        total += n
+    bw.close()
+    return total
+
+def write_maf(fname: Union[str, Path], n_rows: int, n_samples: int = 10, cohort: str = 'Synthetic',
+              chroms: Optional[List[str]] = None, seed: int = 0) -> pd.DataFrame:
+    """
+    write n_rows single base substitutions of n_samples samples {cohort}-s{i}, return the table
+    """
+    rng = np.random.default_rng(seed)
+    sizes = { chr.name: size for chr, size in BigWigChromSizesDict.items() }
+    chroms = list(sizes.keys()) if chroms is None else chroms
+    weights = np.array([ sizes[c] for c in chroms ], dtype = float)
+
+    chrom = rng.choice(len(chroms), n_rows, p = weights / weights.sum())
+    start = (rng.random(n_rows) * np.array([ sizes[c] for c in chroms ])[chrom]).astype(np.int64)
+    mut   = rng.choice(SUBSTITUTIONS, n_rows)
+    ref   = np.array([ m[0] for m in mut ])
+    context = np.char.add(np.char.add(rng.choice(NUCLEOTIDES, n_rows), ref), rng.choice(NUCLEOTIDES, n_rows))
+
+    maf_df = pd.DataFrame({
+        'CHROM':   np.array([ c.removeprefix('chr') for c in chroms ])[chrom],
+        'START':   start,
+        'END':     start + 1,
+        'REF':     ref,
+        'ALT':     [ m[2] for m in mut ],
+        'SAMPLE':  rng.choice([ f"{cohort}-s{i}" for i in range(n_samples) ], n_rows),
+        'GENE':    rng.choice(GENES, n_rows, p = [0.9] + [0.1 / (len(GENES) - 1)] * (len(GENES) - 1)),
+        'ANNOT':   rng.choice(ANNOTATIONS, n_rows),
+        'MUT':     mut,
+        'CONTEXT': context,
+    })
+    with gzip.open(fname, 'wt') as fd:
+        maf_df.to_csv(fd, sep = '\t', header = False, index = False)
+    return maf_df
+
+def write_summary(fname: Union[str, Path], resolution: int, n_columns: int = 8, chunk_rows: int = 100,
+                  backend: str = 'chunked', overlap: int = 0, seed: int = 0) -> WindowGrid:
+    """
+    write a summary of n_columns random features with chunks of chunk_rows windows, as _concat_summary_table
+    does for the 'chunked' backend. Return the grid of the windows.
+    """
+    rng = np.random.default_rng(seed)
+    grid = WindowGrid(resolution, overlap)
+    with h5py.File(fname, 'w') as h5fd:
+        h5fd.attrs['columns'] = [ f"track{i}_mean" for i in range(n_columns) ]
+        for c, chr in enumerate(grid.chroms):
+            n = int(grid.n_windows[c])
+            h5fd.create_dataset(grid.dataset_name(chr), data = rng.random((n, n_columns)),
+                                **SUMMARY_BACKENDS[backend](max(1, min(chunk_rows, n)), n_columns))
+    return grid
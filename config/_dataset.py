@@ -2,6 +2,7 @@ import yaml
 from pathlib import Path
 
 from mini_utils.singleton import Singleton
+from mini_utils.bio import Genome
 
 @Singleton
 class DatasetConfig(object):
@@ -23,3 +24,12 @@ class DatasetConfig(object):
     def getDatasetNames(self):
         return list(self.config.keys())
 
+    def getGenome(self, **overrides) -> Genome:
+        """
+        the genome section, the assembly, its chrom_sizes (chrom.sizes or bigWig file) and the chromosomes built,
+        the arguments which are not None override it
+        """
+        genome = dict(self.config.get('genome') or {})
+        genome.update({ k: v for k, v in overrides.items() if v is not None })
+        return Genome(**genome)
+
@@ -1,5 +1,6 @@
 import os
 import re
+import json
 import sys
 import bbi
 import h5py
@@ -14,19 +15,28 @@ import pandas as pd
 from enum import Enum
 from pathlib import Path
 from abc import abstractmethod
+from functools import partial
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 from torch.utils.data import Dataset
 
-from mini_utils.bio import Chm, BigWigChromSizesDict, build_N_gram_nucl_enum
+from mini_utils.bio import Chm, Genome
 from mini_utils import bio
+from mini_utils.build_graph import BuildGraph
+from mini_utils import h5io
+from mini_utils.telemetry import Telemetry
+
+from ._WindowGrid import WindowGrid
+from ._FeatureStats import load_stats, update_stats, write_stats
+from ._Quantization import AFFINE, affine_params, encode, encoding_error, read_decoded, storage_dtype, table_storage
 
 class BioDataset(Dataset):
 
     class H5Attrs(Enum):
         COLUMNS   = 'columns'
         INDEX     = 'index'
+        LENGTH    = 'length'
 
     source_list = ["https://hgdownload-test.gi.ucsc.edu/goldenPath/hg19/encodeDCC/wgEncodeUwRepliSeq/wgEncodeUwRepliSeqBg02esWaveSignalRep1.bigWig",
                    "https://hgdownload-test.gi.ucsc.edu/goldenPath/hg19/encodeDCC/wgEncodeUwRepliSeq/wgEncodeUwRepliSeqBjWaveSignalRep2.bigWig"]
@@ -37,6 +47,8 @@ class BioDataset(Dataset):
         logger: Union[str, Logger] = logging.getLogger(), 
         force_download: bool = False, 
         concurrent_download: int = 0, 
+        dry_run: bool = False,
+        genome: Optional[Genome] = None,
     ) -> None:
         
 
@@ -49,6 +61,12 @@ class BioDataset(Dataset):
         
         self.force_download = force_download
         self.concurrent_download = concurrent_download
+        # only report what would be downloaded and built
+        self.dry_run = dry_run
+        # the chromosomes built and read, all the hg19 chromosomes of Chm by default
+        self.genome = Genome() if genome is None else genome
+        # per stage timings of the build, see mini_utils.telemetry
+        self.telemetry = Telemetry(self.logger)
         self.download_rawdata()
 
         self.logger.debug("init BioDataset end.")
@@ -62,12 +80,15 @@ class BioDataset(Dataset):
                 self.logger.info(f"Starting download {fname}")
                 self.logger.info(f"{src}")
                 # out = subprocess.run(['wget', '-c', '--no-check-certificate', src, '-P', self.raw_path], check=True, shell=False)
-                out = subprocess.run(
-                    ['wget', '-c', '--no-check-certificate', src, '-P', self.raw_path], 
-                    check=True, 
-                    shell=False, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.PIPE)
+                with self.telemetry.stage('download', unit = fname) as record:
+                    out = subprocess.run(
+                        ['wget', '-c', '--no-check-certificate', src, '-P', self.raw_path], 
+                        check=True, 
+                        shell=False, 
+                        stdout=subprocess.PIPE, 
+                        stderr=subprocess.PIPE)
+                    # wget runs in its own process
+                    record['bytes_written'] = os.path.getsize(tgt_f)
                 
                 self.logger.info(out.stdout)
 
@@ -78,8 +99,9 @@ class BioDataset(Dataset):
         
         except Exception as e:
             self.logger.error(f"Download Failed: {src}")
-            self.logger.info(out.stdout)
-            self.logger.error(out.stderr)
+            if isinstance(e, subprocess.CalledProcessError):
+                self.logger.info(e.stdout)
+                self.logger.error(e.stderr)
             self.logger.error(e)
 
             return fname, False, str(e)
@@ -88,9 +110,16 @@ class BioDataset(Dataset):
         """
         download rawdata listed in self.source_list to the directory self.raw_path
         """
+        self.download_results = []
+        if self.dry_run:
+            missing = [ url for url in self.source_list if self.force_download or not os.path.isfile(self.raw_path.joinpath(url.split('/')[-1])) ]
+            self.logger.info(f"{len(missing)} of {len(self.source_list)} files to download in {self.raw_path}")
+            for url in missing:
+                self.logger.info(f"  {url}")
+            return
+
         pathlib.Path.mkdir(self.raw_path, exist_ok=True, parents=True)
         self.logger.info(f"Initialize download directory: {self.raw_path}")
-        self.download_results = []
 
         if self.concurrent_download <= 1 :
             for url in self.source_list:
@@ -99,7 +128,7 @@ class BioDataset(Dataset):
 
         else :
             with ThreadPoolExecutor(max_workers = self.concurrent_download) as executor:
-                future_to_url = {executor.submit(url): url for url in self.source_list}
+                future_to_url = {executor.submit(self._download, url): url for url in self.source_list}
                 for future in as_completed(future_to_url): 
                     url = future_to_url[future]
                     try:
@@ -132,6 +161,9 @@ class BioBigWigDataset(BioDataset):
     2. build h5 file for each sample file
     3. in each h5 sample file, each chromosome is present as group which contains different resolutions
 
+    The h5 datasets and the summaries are the nodes of a BuildGraph, one node per (sample file, resolution)
+    and one summary node per resolution, so adding a resolution or a sample file only builds the new nodes.
+
     So that the h5 path layout should be like this : 
     \{h5_path}
     |- datafile1.h5
@@ -181,13 +213,18 @@ class BioBigWigDataset(BioDataset):
         rebuild_h5:bool = False,
         preprocess: Optional[Callable] = None, 
         transform:  Optional[Callable] = None, 
-        lazy_load: bool = True
+        lazy_load: bool = True,
+        dry_run: bool = False,
+        genome: Optional[Genome] = None,
+        storage: str = 'float64'
         ) -> None:
 
         if not hasattr(self, 'dataset_name') or self.dataset_name is None:
             self.dataset_name = "BioBigWig"
     
-        super().__init__(raw_path = raw_path, logger = logger, force_download = force_download, concurrent = concurrent)
+        super().__init__(raw_path = raw_path, logger = logger, force_download = force_download, concurrent_download = concurrent, dry_run = dry_run, genome = genome)
+        # number of processes building the tracks
+        self.concurrent = concurrent
 
         self.logger.debug("init BioBigWigDataset start")
         self.resolutions = resolutions
@@ -196,6 +233,9 @@ class BioBigWigDataset(BioDataset):
 
         # will raise exception if summary function name is not in enum
         self.summary = [ self.BigWigSummary(s) for s in np.array([summary]).reshape(-1).tolist() ]
+        # dtype of the values of the summary tables, see datasets._Quantization
+        storage_dtype(storage)
+        self.storage = storage
 
         self.h5_path = Path(h5_path)
         self.h5_list = []
@@ -205,26 +245,30 @@ class BioBigWigDataset(BioDataset):
         self.transform  = transform
         self.lazy_load  = lazy_load
 
-        self.Chm = Chm
-
         list.sort(self.resolutions)
-        chromsizes = np.array([BigWigChromSizesDict[chr] for chr in BigWigChromSizesDict.keys()])
+        chromsizes = np.array(list(self.genome.chrom_sizes.values()))
 
         self.sample_nums = np.ceil(chromsizes/(self.resolutions[0] - self.overlap)/self.h5_chunk_size)
         self.sample_cum_nums = np.cumsum(self.sample_nums)
 
+        self.bigwig_list = []
         for bigwig_src in self.source_list:
             bigwig_fname = Path(bigwig_src).name
             bigwig_fname = self.raw_path.joinpath(bigwig_fname)
-            h5_fname     = self._h5_fname(bigwig_fname.name)
-            self.h5_list.append(h5_fname)
-            self.build_h5(bigwig = bigwig_fname, 
-                          h5 = h5_fname, 
-                          resolutions = self.resolutions, 
-                          summary=self.summary) 
-            
+            self.bigwig_list.append(bigwig_fname)
+            self.h5_list.append(self._h5_fname(bigwig_fname.name))
+
         self.summary_h5_fname = self.h5_path.joinpath(f"{self.dataset_name}.h5")
-        self.build_h5_summary()
+        graph = self.make_build_graph()
+        if self.dry_run:
+            self.build_plan = graph.plan(force = self.rebuild_h5)
+            graph.log_plan(self.build_plan)
+            self.summary_h5_fd = None
+            return
+        with self.telemetry.stage('build', unit = self.dataset_name):
+            self.build_report = graph.run(force = self.rebuild_h5, concurrent = self.concurrent)
+        self.telemetry.report(self.h5_path.joinpath(f"{self.dataset_name}.telemetry.json"),
+                              dataset = self.dataset_name, resolutions = self.resolutions, concurrent = self.concurrent)
 
         if self.preprocess is not None:
             self.preprocess(self.summary_h5_fname)
@@ -236,30 +280,35 @@ class BioBigWigDataset(BioDataset):
 
         self.logger.debug("init BioBigWigDataset end.")
 
+    def __getstate__(self):
+        # sent to the build processes, which only need the parameters of build_h5
+        state = self.__dict__.copy()
+        for k in ['preprocess', 'transform', 'summary_h5_fd']:
+            state.pop(k, None)
+        return state
+
     def _h5_fname(self, bigwig_fname: str) -> Path:
         # replace bigwig by ignoring cases
         h5_fname = re.compile('bigwig', re.IGNORECASE).sub('h5', bigwig_fname)
         return self.h5_path.joinpath(h5_fname)
 
-    def _best_cover(self, start_position: int, end_position: int, chm_size: int, resolution: int):
+    def _best_cover(self, start_position: int, end_position: int, chm_size: int, resolution: int) -> Tuple[int, int]:
         """
-        return the best centralized chunked region which cover the given interval
+        return the rows of the h5_chunk_size windows of the resolution centred on the given interval, within the chromosome
         """
-        mid = np.mean([start_position, end_position])
-        start = mid - resolution*self.h5_chunk_size /2 
-        start = max(0,start)
-        end   = start + resolution
-        end_position   = int(np.rint(min(chm_size, end)))
-        start_position = end_position - resolution
-        return start_position, end_position
-
-    def _build_position_encoding(self, chm: int, start_position: int, end_position: int, rslt: int, df_len: int):
-        # add position encoding (chrom, start, end)
-        assert (start_position-end_position)/rslt == df_len
-        position_df = pd.DataFrame(np.zeros((df_len, 3)), columns=[self.BigWigSummary(i).name for i in range(3)])
-        position_df[self.BigWigSummary.chrom.name] = chm
-        position_df[self.BigWigSummary.start.name] = np.arange(start_position, end_position, rslt)
-        position_df[self.BigWigSummary.end.name]   = np.arange(start_position + rslt, end_position + rslt, rslt)
+        step = resolution - self.overlap
+        n_rows = int(np.ceil(chm_size / step))
+        k = min(self.h5_chunk_size, n_rows)
+        mid = (start_position + end_position) / 2
+        start_row = int(np.clip(mid // step - k // 2, 0, n_rows - k))
+        return start_row, start_row + k
+
+    def _build_position_encoding(self, chm: int, start_row: int, end_row: int, rslt: int) -> pd.DataFrame:
+        # add position encoding (chrom, start, end) of the windows of the rows
+        starts = np.arange(start_row, end_row, dtype=np.int64) * (rslt - self.overlap)
+        return pd.DataFrame({self.BigWigSummary.chrom.name: np.full(len(starts), chm),
+                             self.BigWigSummary.start.name: starts,
+                             self.BigWigSummary.end.name:   starts + rslt})
 
     def _bigwig2df(self, 
                    bigwig_fd, 
@@ -269,7 +318,7 @@ class BioBigWigDataset(BioDataset):
         ) -> pd.DataFrame:
 
         # chr_size = epig_fd.chromsizes[chr]
-        chr_size = BigWigChromSizesDict[chr]
+        chr_size = self.genome.size(chr)
         self.logger.info(f"{chr.name}, length {chr_size}")
         starts = np.arange(0, chr_size, resolution - self.overlap)
         ends   = starts + resolution
@@ -286,6 +335,44 @@ class BioBigWigDataset(BioDataset):
     def _h5_dataset_name(self, rslt: int, overlap: int) -> str:
         return f"{rslt}_{overlap}"
 
+    def _track_node(self, h5: Path, rslt: int) -> str:
+        return f"track:{Path(h5).stem}:{self._h5_dataset_name(rslt, self.overlap)}"
+
+    def _summary_sources(self) -> Dict[str, Path]:
+        """
+        the h5 files concatenated in the summary, the keys prefix the column names
+        """
+        return { Path(h5).stem: h5 for h5 in self.h5_list }
+
+    def make_build_graph(self) -> BuildGraph:
+        """
+        the build graph of the dataset, the fingerprints of the built nodes are kept in {dataset_name}.build.json
+        """
+        graph = BuildGraph(self.h5_path.joinpath(f"{self.dataset_name}.build.json"), logger = self.logger)
+        for bigwig_fname, h5_fname in zip(self.bigwig_list, self.h5_list):
+            for rslt in self.resolutions:
+                graph.add(self._track_node(h5_fname, rslt),
+                          fn = partial(self.build_h5, bigwig = bigwig_fname, h5 = h5_fname, resolutions = [rslt], summary = self.summary),
+                          params = {'resolution': rslt, 'overlap': self.overlap, 'summary': [ s.value for s in self.summary ],
+                                    'chrom_sizes': self.genome.chrom_sizes},
+                          sources = [bigwig_fname],
+                          outputs = [(h5_fname, self._h5_dataset_fullname(self.genome.chroms[0], rslt, self.overlap))],
+                          resource = str(h5_fname))
+        self.add_summary_nodes(graph)
+        return graph
+
+    def add_summary_nodes(self, graph: BuildGraph):
+        sources = self._summary_sources()
+        for rslt in self.resolutions:
+            graph.add(f"summary:{self._h5_dataset_name(rslt, self.overlap)}",
+                      fn = partial(self.build_h5_summary, rslt),
+                      deps = [ self._track_node(h5, rslt) for h5 in sources.values() ],
+                      # the summaries built before the storages are float64
+                      params = dict({'sources': list(sources.keys()), 'h5_chunk_size': self.h5_chunk_size, 'chroms': self.genome.chroms},
+                                    **({} if self.storage == 'float64' else {'storage': self.storage})),
+                      outputs = [(self.summary_h5_fname, self._h5_dataset_fullname(self.genome.chroms[0], rslt, self.overlap))],
+                      parallel = False)
+
     def _h5_dataset_fullname(self, chr: str, rslt: int, overlap: int) -> str:
         dataset_name = self._h5_dataset_name(rslt=rslt, overlap=overlap)
         return f"{chr}/{dataset_name}"
@@ -297,35 +384,84 @@ class BioBigWigDataset(BioDataset):
                  summary: List[BigWigSummary]
         ) -> None:
 
-        mode = 'a'
-        if not os.path.isfile(h5) or self.rebuild_h5:
-            pathlib.Path.mkdir(h5.parent, exist_ok=True, parents=True)
-            mode = 'w'
-
+        # the build graph decides which resolutions are (re)built, the other datasets of the file are kept.
+        # Each (chromosome, resolution) is committed with a checkpoint, the complete ones are kept
+        # when the build resumes, see mini_utils.h5io
         self.logger.debug(f"open h5 file {h5}")
         self.logger.debug(f"Open BigWig file: {bigwig}")
-        with h5py.File(h5, mode) as h5fd, bbi.open(str(bigwig)) as bigwig_fd :
+        with self.telemetry.stage('build_h5', unit = f"{Path(h5).stem}:{resolutions}") as build_record, \
+             h5io.open_h5(h5, 'a', self.logger) as h5fd, bbi.open(str(bigwig)) as bigwig_fd :
             for rslt in resolutions:
-                dataset_name = self._h5_dataset_name(rslt=rslt, overlap=self.overlap)
-                for chr in self.Chm:
+                for chr in self.genome.chms:
+                    key = self._unit_key(bigwig, chr.name, rslt, summary)
+                    dataset_fullname = self._h5_dataset_fullname(chr=chr.name, rslt=rslt, overlap=self.overlap)
+                    if not self.rebuild_h5 and h5io.is_complete(h5fd, dataset_fullname, key):
+                        self.logger.debug(f"{dataset_fullname} is complete in {h5}")
+                        continue
+                    # built by a node of the cluster, see build_unit
+                    unit = self._unit_h5_fname(h5, chr.name, rslt)
+                    if h5io.adopt_unit(h5fd, unit, dataset_fullname, key):
+                        self.logger.debug(f"{dataset_fullname} is copied from {unit}")
+                        os.remove(unit)
+                        continue
                     self.logger.debug(f"Building {chr.name} at resolution {rslt}. ")
-                    if self.rebuild_h5 or chr.name not in h5fd.keys() or dataset_name not in h5fd[chr.name].keys() :
-                        dataset_fullname = self._h5_dataset_fullname(chr=chr.name, rslt=rslt, overlap=self.overlap)
-                        self.logger.debug(f"create dataset {dataset_fullname} in the h5 file")
+                    with self.telemetry.stage('bigwig2df', unit = f"{Path(bigwig).stem}:{dataset_fullname}") as record:
                         data_df = self._bigwig2df(bigwig_fd, chr, rslt, summary)
-                        h5fd.create_dataset(name = dataset_fullname, data = data_df)
-                        h5fd[dataset_fullname].attrs[self.H5Attrs.COLUMNS.value] = data_df.columns.to_list()
+                        record['rows'] = len(data_df)
+                    h5io.write_unit(h5fd, dataset_fullname, key, data = data_df.to_numpy(),
+                                    attrs = {self.H5Attrs.COLUMNS.value: data_df.columns.to_list()})
+                    build_record['rows'] = (build_record['rows'] or 0) + len(data_df)
+
+    def _unit_key(self, bigwig: Path, chr: str, rslt: int, summary: List[BigWigSummary]) -> str:
+        return h5io.checkpoint_key(source = Path(bigwig), chrom_size = self.genome.size(chr), resolution = rslt,
+                                   overlap = self.overlap, summary = [ s.value for s in summary ])
+
+    def _unit_h5_fname(self, h5: Path, chr: str, rslt: int) -> Path:
+        # a (track, chromosome, resolution) unit built alone
+        return self.h5_path.joinpath('units', f"{Path(h5).stem}.{chr}.{self._h5_dataset_name(rslt, self.overlap)}.h5")
+
+    def work_units(self) -> List[Dict]:
+        """
+        the (source, chromosome, resolution) units of the tracks to build, to share the build between the
+        nodes of a cluster. The units are built by build_unit in their own files, and copied in the tracks
+        by build_h5.
+        """
+        plan = dict(self.make_build_graph().plan(force = self.rebuild_h5))
+        units = []
+        for bigwig_fname, h5_fname in zip(self.bigwig_list, self.h5_list):
+            for rslt in self.resolutions:
+                if plan[self._track_node(h5_fname, rslt)] != BuildGraph.FRESH:
+                    units += [ {'source': bigwig_fname.name, 'chrom': chr, 'resolution': rslt} for chr in self.genome.chroms ]
+        return units
+
+    def build_unit(self, source: str, chrom: str, resolution: int) -> str:
+        bigwig = self.raw_path.joinpath(source)
+        unit = self._unit_h5_fname(self._h5_fname(source), chrom, resolution)
+        dataset_fullname = self._h5_dataset_fullname(chrom, resolution, self.overlap)
+        key = self._unit_key(bigwig, chrom, resolution, self.summary)
+        with h5io.open_h5(unit, 'a', self.logger) as h5fd, bbi.open(str(bigwig)) as bigwig_fd:
+            if self.rebuild_h5 or not h5io.is_complete(h5fd, dataset_fullname, key):
+                with self.telemetry.stage('bigwig2df', unit = f"{Path(source).stem}:{dataset_fullname}") as record:
+                    data_df = self._bigwig2df(bigwig_fd, Chm[chrom], resolution, self.summary)
+                    record['rows'] = len(data_df)
+                h5io.write_unit(h5fd, dataset_fullname, key, data = data_df.to_numpy(),
+                                attrs = {self.H5Attrs.COLUMNS.value: data_df.columns.to_list()})
+        return str(unit)
 
     def _concat_summary_table(self, 
                               tgt_h5fd: h5py.File, 
                               src_h5fd_dict: Dict[str, h5py.File], 
                               chr: Chm, 
                               rslt: int, 
-                              overlap: int
+                              overlap: int,
+                              affine: Optional[Tuple[np.ndarray, np.ndarray]] = None
         ) -> h5py.File :
 
         L = -1
         columns_count = 0
+        column_names  = []
+        checkpoints   = {}
+        dataset_fullname = self._h5_dataset_fullname(chr.name, rslt, overlap)
 
         self.logger.debug(f"{src_h5fd_dict}")
 
@@ -340,63 +476,143 @@ class BioBigWigDataset(BioDataset):
             else :
                 assert L == ds.shape[0]
             columns_count += ds.shape[1]
+            column_names  += [ f"{k}_{s}" for s in ds.attrs[self.H5Attrs.COLUMNS.value] ]
+            checkpoints[k] = ds.attrs.get(h5io.CHECKPOINT)
+
+        tgt_h5fd.attrs[self.H5Attrs.COLUMNS.value] = column_names
+
+        # the summary of a chromosome is complete if it was built from the same versions of the sources
+        key = h5io.checkpoint_key(sources = checkpoints, h5_chunk_size = self.h5_chunk_size)
+        if self.storage != 'float64':
+            # the codes of int8 and uint16 depend on the range of the columns over all the chromosomes
+            key = h5io.checkpoint_key(summary = key, storage = self.storage, affine = None if affine is None else [ a.tolist() for a in affine ])
+        if not self.rebuild_h5 and h5io.is_complete(tgt_h5fd, dataset_fullname, key):
+            self.logger.debug(f"{dataset_fullname} is complete in the summary")
+            return tgt_h5fd
 
         self.logger.debug(f"estimate the shape of entire dataset : {(L, columns_count)}")
-        self.logger.debug(f"set the chunk size : {(self.h5_chunk_size, columns_count)}")
+        # a chunk can't be larger than the dataset, at a coarse resolution for instance
+        chunk_size = max(1, min(self.h5_chunk_size, L))
+        self.logger.debug(f"set the chunk size : {(chunk_size, columns_count)}")
 
         # create chunked dataset
-        tgt_h5fd.create_dataset(name = self._h5_dataset_fullname(chr.name, rslt, overlap), 
-                                shape = (L, columns_count), 
-                                chunks= (self.h5_chunk_size, columns_count), 
-                                dtype = float)
+        staged = h5io.create_staged(tgt_h5fd, dataset_fullname,
+                                    shape = (L, columns_count), 
+                                    chunks= (chunk_size, columns_count), 
+                                    dtype = storage_dtype(self.storage))
+        scale, offset = affine if affine is not None else (None, None)
 
         # update to tgt_h5fd dataset one by one, since each one can be very large
-        column_names = []
-        columns_idx  = 0
-        for k, fd in src_h5fd_dict.items():
-            ds = fd[self._h5_dataset_fullname(chr.name, rslt, overlap)]
-            attrs = ds.attrs[self.H5Attrs.COLUMNS.value]
-            self.logger.debug(f"attributes of dataset: {attrs}")
-            column_names += [ f"{k}_{s}" for s in attrs ]
-            self.logger.debug(f"column names: {column_names}")
-            tgt_h5fd[self._h5_dataset_fullname(chr.name,rslt,overlap)][:,columns_idx: columns_idx + ds.shape[1]] = ds[:]
-            columns_idx += ds.shape[1]
-
-        tgt_h5fd.attrs[self.H5Attrs.COLUMNS.value] = column_names
+        with self.telemetry.stage('concat_summary', unit = dataset_fullname, rows = L):
+            columns_idx  = 0
+            attrs = {} if self.storage == 'float64' else \
+                    {'storage': self.storage, 'abs_error_max': np.zeros(columns_count), 'abs_error_sum': np.zeros(columns_count),
+                     'abs_error_count': np.zeros(columns_count, dtype=np.int64)}
+            for k, fd in src_h5fd_dict.items():
+                ds = fd[dataset_fullname]
+                cols = slice(columns_idx, columns_idx + ds.shape[1])
+                if self.storage == 'float64':
+                    staged[:, cols] = ds[:]
+                else:
+                    # the error of the stored values versus the float64 values of the source
+                    values = ds[:]
+                    codes = encode(values, self.storage, None if scale is None else scale[cols], None if offset is None else offset[cols])
+                    staged[:, cols] = codes
+                    error_max, error_sum, count = encoding_error(values, codes, self.storage, None if scale is None else scale[cols],
+                                                                 None if offset is None else offset[cols])
+                    attrs['abs_error_max'][cols], attrs['abs_error_sum'][cols], attrs['abs_error_count'][cols] = error_max, error_sum, count
+                columns_idx += ds.shape[1]
+            if affine is not None:
+                attrs.update(scale = scale, offset = offset)
+
+            h5io.commit_staged(tgt_h5fd, dataset_fullname, key, attrs)
         return tgt_h5fd
+
+    def _column_ranges(self, src_h5fd_dict: Dict[str, h5py.File], rslt: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        the minimum and the maximum of the columns of the summary over all the chromosomes, NaN ignored
+        """
+        vmin, vmax = [], []
+        for k, fd in src_h5fd_dict.items():
+            lo, hi = None, None
+            for chr in self.genome.chms:
+                values = fd[self._h5_dataset_fullname(chr.name, rslt, self.overlap)][:]
+                valid = ~np.isnan(values)
+                chr_lo = np.where(valid, values, np.inf).min(axis=0, initial=np.inf)
+                chr_hi = np.where(valid, values, -np.inf).max(axis=0, initial=-np.inf)
+                lo, hi = (chr_lo, chr_hi) if lo is None else (np.minimum(lo, chr_lo), np.maximum(hi, chr_hi))
+            vmin.append(lo)
+            vmax.append(hi)
+        return np.concatenate(vmin), np.concatenate(vmax)
+
+    def quantization_report(self, h5fd: h5py.File, rslt: int) -> Dict[str, Any]:
+        """
+        the maximum and the mean absolute error of each column of the summary at the resolution rslt versus float64
+        """
+        tables = [ h5fd[self._h5_dataset_fullname(chr.name, rslt, self.overlap)] for chr in self.genome.chms ]
+        error_max = np.max([ ds.attrs['abs_error_max'] for ds in tables ], axis=0)
+        count = np.sum([ ds.attrs['abs_error_count'] for ds in tables ], axis=0)
+        error_mean = np.sum([ ds.attrs['abs_error_sum'] for ds in tables ], axis=0) / np.maximum(count, 1)
+        return {'storage': self.storage, 'resolution': rslt, 'overlap': self.overlap,
+                'bytes_per_value': storage_dtype(self.storage).itemsize,
+                'columns': list(h5fd.attrs[self.H5Attrs.COLUMNS.value]),
+                'max_abs_error': error_max.tolist(), 'mean_abs_error': error_mean.tolist()}
     
-    def build_h5_summary(self):
-        print("You should implement the function: build_h5_summary")
+    def build_h5_summary(self, rslt: int):
+        """
+        concatenate the tables of the summary sources at the resolution rslt, chromosome by chromosome
+        """
+        h5fd_dict = { k: h5py.File(h5, 'r') for k, h5 in self._summary_sources().items() }
+
+        self.logger.info(f"start building summary: {self.summary_h5_fname} at resolution {rslt}")
+        try:
+            affine = affine_params(*self._column_ranges(h5fd_dict, rslt), self.storage) if self.storage in AFFINE else None
+            with h5io.open_h5(self.summary_h5_fname, 'a', self.logger) as h5fd:
+                for chr in self.genome.chms:
+                    self._concat_summary_table(h5fd, h5fd_dict, chr, rslt, self.overlap, affine)
+                if self.storage != 'float64':
+                    report = self.quantization_report(h5fd, rslt)
+                    fname = self.h5_path.joinpath(f"{self.dataset_name}.{self._h5_dataset_name(rslt, self.overlap)}.quantization.json")
+                    fname.write_text(json.dumps(report, indent = 2))
+                    worst = int(np.argmax(report['max_abs_error']))
+                    self.logger.info(f"summary stored as {self.storage}, largest error {report['max_abs_error'][worst]:.3g} "
+                                     f"on {report['columns'][worst]}, see {fname}")
+                # the normalization statistics of the columns, kept until the tables change
+                with self.telemetry.stage('summary_stats', unit = self._h5_dataset_name(rslt, self.overlap)):
+                    write_stats(h5fd, WindowGrid(rslt, self.overlap, self.genome.chrom_sizes), self.logger, force = self.rebuild_h5)
+        finally:
+            for k in h5fd_dict:
+                h5fd_dict[k].close()
     
     def __getitem__(self, index) -> Any:
         """
-        index iterate over chunked dataframe
+        index iterate over chunked dataframe, the chunks of h5_chunk_size windows of the minimum resolution
+        of the chromosomes of the genome, with the windows of every resolution covering the chunk
         """
+        if not 0 <= index < len(self):
+            raise IndexError(f"index {index} out of range of {len(self)} chunks")
         # find the index for the minimum resolution
-        chm_idx = sum(self.sample_cum_nums < index)
-        chm = self.Chm(chm_idx+1)
-        idx = index - self.sample_cum_nums[chm]
-        start_position = idx * min(self.resolutions) * self.h5_chunk_size
-        end_position   = (idx+1) * min(self.resolutions) * self.h5_chunk_size
+        chm_idx = int(np.searchsorted(self.sample_cum_nums, index, side='right'))
+        chm = self.genome.chms[chm_idx]
+        idx = index - (int(self.sample_cum_nums[chm_idx - 1]) if chm_idx > 0 else 0)
+        step = min(self.resolutions) - self.overlap
+        start_position = idx * step * self.h5_chunk_size
+        end_position   = min(self.genome.size(chm), (idx+1) * step * self.h5_chunk_size)
 
         summary_list = []
 
         for rslt in self.resolutions:
-            ds = self.summary_h5_fd[self._h5_dataset_fullname(chm,rslt,self.overlap)]
-            coll  = len(ds.attrs[self.H5Attrs.COLUMNS.value])
-            start_position, end_position = self._best_cover(start_position, 
-                                                            end_position,
-                                                            BigWigChromSizesDict[chm.name],
-                                                            rslt)
-            
-            values_df = pd.DataFrame(ds[(slice(int(start_position/rslt), int(end_position/rslt), 1),slice(0,coll,1))], 
-                                     columns = ds.attrs[self.H5Attrs.COLUMNS.value])
-            position_df = self._build_position_encoding(chm.value, start_position, end_position, rslt, values_df.shape[0])
+            dataset_fullname = self._h5_dataset_fullname(chm.name, rslt, self.overlap)
+            ds = self.summary_h5_fd[dataset_fullname]
+            columns = WindowGrid.columns(self.summary_h5_fd, dataset_fullname)
+            start_row, end_row = self._best_cover(start_position, end_position, self.genome.size(chm), rslt)
+            values_df = pd.DataFrame(read_decoded(ds, slice(start_row, end_row)), columns = columns)
+            position_df = self._build_position_encoding(chm.value, start_row, end_row, rslt)
             summary_df = pd.concat([position_df, values_df], axis=1)
             summary_list.append(summary_df)
 
         # 2. concat all the resolutions
-        df = pd.concat(summary_list, axis=0)
+        df = pd.concat(summary_list, axis=0, ignore_index=True)
 
         if self.transform is not None:
             df = self.transform(df)
@@ -405,10 +621,10 @@ class BioBigWigDataset(BioDataset):
     
     def __len__(self):
         # regarding to the minimum resolution
-        return np.sum(self.sample_nums)
+        return int(np.sum(self.sample_nums))
     
     def __del__(self):
-        if self.summary_h5_fd is not None:
+        if getattr(self, 'summary_h5_fd', None) is not None:
             self.summary_h5_fd.close()
 
 
@@ -461,7 +677,11 @@ class BioMafDataset(BioDataset):
         rebuild_h5:bool = False,
         preprocess: Optional[Callable] = None, 
         transform:  Optional[Callable] = None, 
-        lazy_load: bool = True
+        lazy_load: bool = True,
+        reference_genome: Optional[BioDataset] = None,
+        concurrent: int = 0,
+        dry_run: bool = False,
+        genome: Optional[Genome] = None
         ) -> None:
 
         logger.debug("init BioMafDataset start")
@@ -469,33 +689,54 @@ class BioMafDataset(BioDataset):
         if not hasattr(self, 'dataset_name') or self.dataset_name is None:
             self.dataset_name = "BioMAF"
     
-        super().__init__(raw_path = raw_path, logger = logger, force_download = force_download, concurrent_download = concurrent_download)
+        super().__init__(raw_path = raw_path, logger = logger, force_download = force_download, concurrent_download = concurrent_download, dry_run = dry_run, genome = genome)
+
+        # contexts are packed to base-4 integers column by column, see bio.encode_context_strings
+        self.N_grams = [ int(n) for n in np.array([N_grams]).reshape(-1) ]
+        for n in self.N_grams:
+            if n > bio.MAX_N_GRAM:
+                raise ValueError(f"N-gram size {n} is larger than {bio.MAX_N_GRAM}")
 
-        self.N_grams = dict([(n,build_N_gram_nucl_enum(n)) for n in np.array([N_grams]).reshape(-1)])
+        # ReferenceGenomeDataset, to fill the contexts missing in the MAF files
+        self.reference_genome = reference_genome
 
         self.h5_path = Path(h5_path) 
         self.h5_list = [] 
+        self.cohort_list = []
         self.rebuild_h5 = rebuild_h5 
+        # number of processes converting the MAF files
+        self.concurrent = concurrent
 
         self.preprocess = preprocess
         self.transform  = transform
         self.lazy_load  = lazy_load
 
         list.sort(self.resolutions)
-        chromsizes = np.array([BigWigChromSizesDict[chr] for chr in BigWigChromSizesDict.keys()])
+        chromsizes = np.array(list(self.genome.chrom_sizes.values()))
         self.sample_nums = np.ceil(chromsizes/(self.resolutions[0] - self.overlap)/self.h5_chunk_size)
         self.sample_cum_nums = np.cumsum(self.sample_nums)
 
+        shards = []
         for maf_src in self.source_list:
             maf_fname = Path(maf_src).name
             maf_fname = self.raw_path.joinpath(maf_fname)
             h5_fname  = self._h5_fname(maf_fname.name)
             self.h5_list.append(h5_fname)
-            self.build_h5(maf = maf_fname, 
-                          h5 = h5_fname)
-            
+            self.cohort_list.append(self._cohort_name(maf_fname.name))
+            shards.append((maf_fname, h5_fname))
+
+        self.shards = shards
         self.summary_h5_fname = self.h5_path.joinpath(f"{self.dataset_name}.h5")
-        self.build_h5_summary()
+        if self.dry_run:
+            graph = self.make_build_graph()
+            self.build_plan = graph.plan(force = self.rebuild_h5)
+            graph.log_plan(self.build_plan)
+            self.summary_h5_fd = None
+            return
+        with self.telemetry.stage('build', unit = self.dataset_name):
+            self.build_report = self.build()
+        self.telemetry.report(self.h5_path.joinpath(f"{self.dataset_name}.telemetry.json"),
+                              dataset = self.dataset_name, resolutions = self.resolutions, concurrent = self.concurrent)
 
         if self.preprocess is not None:
             self.preprocess(self.summary_h5_fname)
@@ -509,21 +750,147 @@ class BioMafDataset(BioDataset):
         logger.debug("init BioMafDataset end.")
 
 
-    def build_h5(self, maf: Path, h5: Path):
+    def __getstate__(self):
+        # sent to the conversion processes, which only need the parameters of build_h5
+        state = self.__dict__.copy()
+        for k in ['preprocess', 'transform', 'summary_h5_fd', 'window_fds']:
+            state.pop(k, None)
+        return state
+
+    def build_h5(self, maf: Path, h5: Path) -> int:
         pass
-            
-    def build_h5_summary(self):
+
+    def _shard_params(self) -> Dict[str, Any]:
+        # the parameters of build_h5, a shard is converted again when they change
+        return {'columns': self.MAF_COLUMNS if hasattr(self, 'MAF_COLUMNS') else None,
+                'N_grams': self.N_grams,
+                'chroms': self.genome.chroms,
+                'reference_genome': None if self.reference_genome is None else str(self.reference_genome.h5_path)}
+
+    def make_build_graph(self) -> BuildGraph:
+        """
+        the build graph of the dataset, the fingerprints of the built nodes are kept in {dataset_name}.build.json
+        """
+        graph = BuildGraph(self.h5_path.joinpath(f"{self.dataset_name}.build.json"), logger = self.logger)
+        # cohort -> node building the shard of the cohort
+        self.shard_nodes = {}
+        self.add_shard_nodes(graph, self.shards)
+        self.add_summary_nodes(graph)
+        return graph
+
+    def add_shard_nodes(self, graph: BuildGraph, shards: List[Tuple[Path, Path]]):
+        """
+        one node per MAF file, converting it to its own h5 shard
+        """
+        for maf, h5 in shards:
+            cohort = self._cohort_name(maf.name)
+            self.shard_nodes[cohort] = graph.add(f"shard:{cohort}",
+                                                 fn = partial(_build_maf_shard, self, maf, h5),
+                                                 params = self._shard_params(),
+                                                 sources = [maf],
+                                                 outputs = [h5])
+
+    def add_summary_nodes(self, graph: BuildGraph):
         pass
 
+    def work_units(self) -> List[Dict]:
+        """
+        the MAF files to convert, to share the conversion between the nodes of a cluster
+        """
+        plan = dict(self.make_build_graph().plan(force = self.rebuild_h5))
+        return [ {'source': maf.name} for maf, _ in self.shards if plan[self.shard_nodes[self._cohort_name(maf.name)]] != BuildGraph.FRESH ]
+
+    def build_unit(self, source: str) -> int:
+        maf, h5 = [ (maf, h5) for maf, h5 in self.shards if maf.name == source ][0]
+        return _build_maf_shard(self, maf, h5)
+
+    def build(self) -> List[Dict]:
+        """
+        build the stale nodes of the build graph, the shards in a process pool if self.concurrent > 1.
+        Return the conversion report, one record per cohort shard.
+        """
+        graph_report = self.make_build_graph().run(force = self.rebuild_h5, concurrent = self.concurrent)
+        nodes = { r['node']: r for r in graph_report }
+
+        report = []
+        for cohort, h5 in zip(self.cohort_list, self.h5_list):
+            r = nodes[self.shard_nodes[cohort]]
+            status = {'fresh': 'cached', 'skipped': 'failed'}.get(r['status'], r['status'])
+            if status == 'built' and cohort in getattr(self, 'designed_supersets', []):
+                status = 'merged'
+            report.append({'cohort': cohort, 'shard': str(h5), 'rows': r['result'], 'seconds': r['seconds'], 'status': status})
+
+        self.logger.info("MAF conversion report:")
+        for r in report:
+            rows = '-' if r['rows'] is None else r['rows']
+            self.logger.info(f"{r['cohort']:<36} {r['status']:<7} {rows:>10} rows {r['seconds']:>9.1f}s")
+        built = [ r for r in graph_report if r['status'] == 'built' ]
+        self.logger.info(f"{len(built)} build nodes done in {sum([ r['seconds'] for r in built ]):.1f}s (cumulated)")
+
+        return report
+
     def _h5_fname(self, maf_fname: str) -> Path:
         # replace bigwig by ignoring cases
         h5_fname = maf_fname.split('.')[0] + '.h5'
         return self.h5_path.joinpath(h5_fname)
 
+    def _cohort_name(self, maf_fname: str) -> str:
+        return maf_fname.split('.')[0]
+
+    def __del__(self):
+        if getattr(self, 'summary_h5_fd', None) is not None:
+            self.summary_h5_fd.close()
+
+def _build_maf_shard(dataset: BioMafDataset, maf: Path, h5: Path) -> int:
+    """
+    convert one MAF file, in the calling process or in a worker of the build graph.
+    The shard is renamed from a temporary file once complete, so an existing shard is never partial.
+    A shard converted from the same file with the same parameters, by a node of the cluster, is kept.
+    """
+    key = h5io.checkpoint_key(maf = Path(maf), **dataset._shard_params())
+    if not dataset.rebuild_h5 and os.path.isfile(h5):
+        with h5py.File(h5, 'r') as h5fd:
+            if h5fd.attrs.get(h5io.CHECKPOINT) == key:
+                return int(h5fd.attrs['rows'])
+
+    tmp = h5.with_name(h5.name + '.tmp')
+    if os.path.isfile(tmp):
+        os.remove(tmp)
+    try:
+        with dataset.telemetry.stage('maf_encode', unit = Path(maf).name, bytes_read = os.path.getsize(maf)) as record:
+            rows = dataset.build_h5(maf = maf, h5 = tmp)
+            record['rows'] = rows
+    except Exception:
+        dataset.logger.error(f"Conversion Failed: {maf}")
+        raise
+    with h5py.File(tmp, 'a') as h5fd:
+        h5fd.attrs['rows'] = rows
+        h5fd.attrs[h5io.CHECKPOINT] = key
+    os.replace(tmp, h5)
+    return rows
+
 class BioDigDriverfDataset(BioMafDataset):
 
+    """
+    BioDigDriverfDataset yields the pairs (window features, window mutation counts) at the smallest resolution.
+    The features are read from the summary h5 files of the window datasets (BioBigWigDataset summaries,
+    ContextComposition.h5) by the index of the windows, see WindowGrid, and each cohort of self.heads is
+    an output head :
+
+    x, y = dataset[i]           x : features of the window i, y : { cohort: mutations in the window i }
+    x, y = dataset.read_batch(indices)
+    """
+
     MAF_COLUMNS = ['CHROM', 'START', 'END', 'REF', 'ALT', 'SAMPLE', 'GENE', 'ANNOT', 'MUT', 'CONTEXT']
 
+    # summary h5 files of the window features, and the cohorts used as targets (all the cohorts if None)
+    features: List[Union[str, Path]] = []
+    heads: Optional[List[str]] = None
+    # keyword arguments of h5py.File for the window reads, the chunk cache (rdcc_nbytes) or the core driver for instance
+    h5_open_kwargs: Dict[str, Any] = {}
+    # standardize the features by the statistics of their summary, see FeatureStats and prepare_normalization
+    normalize: bool = False
+
     # def __init__(self, h5_path: str | Path, raw_path: str | Path, N_grams: List[int] | int = 3, logger: str | Logger = logging.getLogger(), force_download: bool = False, concurrent_download: int = 0, rebuild_h5: bool = False, preprocess: Callable[..., Any] | None = None, transform: Callable[..., Any] | None = None, lazy_load: bool = True) -> None:
     #     super().__init__(h5_path, raw_path, N_grams, logger, force_download, concurrent_download, rebuild_h5, preprocess, transform, lazy_load)
 
@@ -532,6 +899,20 @@ class BioDigDriverfDataset(BioMafDataset):
         # _sid = _sid.strip().replace('-', '')
         return f"{chr}/{_sid}"
 
+    def _cohort_name(self, maf_fname: str) -> str:
+        # {cohort}_SNV_MNV_INDEL.ICGC.annot.txt.gz, {cohort}_SNV.DEDUP.no_hypermut.annot.txt.gz, ...
+        return maf_fname.split('.')[0].split('_SNV')[0]
+
+    def _shard_chroms(self, h5fd: h5py.File) -> List[str]:
+        # the chromosome groups of a shard, next to the GENES dataset
+        return [ k for k in h5fd.keys() if isinstance(h5fd[k], h5py.Group) ]
+
+    def _chrom_value(self, chr) -> Optional[int]:
+        # MAF files name chromosomes as '1', ..., 'X'
+        chr = str(chr)
+        chr = chr if chr.startswith('chr') else f"chr{chr}"
+        return Chm[chr].value if chr in Chm.__members__ else None
+
     def build_h5(self, maf: Path, h5: Path):
         mode = 'a'
         if not os.path.isfile(h5) or self.rebuild_h5:
@@ -547,6 +928,17 @@ class BioDigDriverfDataset(BioMafDataset):
         with h5py.File(h5, mode) as h5fd:
             self.logger.debug(f"Open MAF file: {maf}")
             maf_df = pd.read_table(maf, names= self.MAF_COLUMNS, sep='\t', skipinitialspace=True, comment='#')
+            n_rows = len(maf_df)
+            # only the mutations on the chromosomes of the genome are converted
+            chroms = maf_df['CHROM'].astype(str)
+            maf_df = maf_df[chroms.isin([ c for c in chroms.unique() if c in self.genome ])]
+            # encode the contexts of the whole file at once
+            context_colnames = [ f"CONTEXT_{n}" for n in self.N_grams ]
+            for n, col in zip(self.N_grams, context_colnames):
+                maf_df[col] = self._encode_context_column(maf_df, n)
+            # gene symbols are interned once per file, the tables keep the index in GENES
+            maf_df['GENE_ID'], genes = self._encode_gene_column(maf_df)
+            h5fd.create_dataset('GENES', data = genes, dtype = h5py.string_dtype())
             for chr, grp in maf_df.groupby("CHROM"):
                 for sid, chr_grp in grp.groupby('SAMPLE'):
                     dataset_fullname = self._h5_dataset_fullname(chr = chr, sid = sid)
@@ -554,8 +946,290 @@ class BioDigDriverfDataset(BioMafDataset):
                     # self.logger.debug(f"{chr_grp[colnames]}")
                     data = chr_grp[colnames].apply(self.encode, axis=1).apply(pd.Series)
                     data.columns = self.dataset_colnames
+                    data['GENE'] = chr_grp['GENE_ID'].to_numpy()
+                    data[context_colnames] = chr_grp[context_colnames].to_numpy()
                     h5fd.create_dataset(name = dataset_fullname, data = data)
-                    h5fd[dataset_fullname].attrs[self.H5Attrs.COLUMNS.value] = self.dataset_colnames
+                    h5fd[dataset_fullname].attrs[self.H5Attrs.COLUMNS.value] = data.columns.to_list()
+
+        return n_rows
+
+    def merge_cohort_shards(self, cohort: str, leaf_shards: List[Path], h5: Path) -> int:
+        """
+        assemble the shard of a cohort from the shards of its leaf cohorts, without decoding the MAF files again.
+        The (chromosome, sample) datasets are copied, a sample in several leaves is kept once, and the GENE
+        column is mapped to the union of the leaf gene symbols. Return the number of mutations.
+        """
+        leaf_shards = [ l for l in leaf_shards if os.path.isfile(l) ]
+        self.logger.info(f"merge {len(leaf_shards)} leaf shards to {cohort}")
+        tmp = h5.with_name(h5.name + '.tmp')
+        # a sample is taken from the first leaf it is found in
+        rows, owner, duplicated = 0, {}, set()
+        leaf_genes = {}
+        for leaf in leaf_shards:
+            with h5py.File(leaf, 'r') as src:
+                leaf_genes[leaf] = src['GENES'].asstr()[:].astype(str)
+        genes = np.unique(np.concatenate([ g for g in leaf_genes.values() ] + [ np.array([], dtype=str) ]))
+
+        with h5py.File(tmp, 'w') as h5fd:
+            h5fd.create_dataset('GENES', data = genes.astype(object), dtype = h5py.string_dtype())
+            for leaf in leaf_shards:
+                remap = np.searchsorted(genes, leaf_genes[leaf])
+                with h5py.File(leaf, 'r') as src:
+                    for chr in self._shard_chroms(src):
+                        grp = h5fd.require_group(chr)
+                        for sid in src[chr].keys():
+                            if owner.setdefault(sid, leaf) != leaf:
+                                duplicated.add(sid)
+                                continue
+                            ds = src[chr][sid]
+                            columns = list(ds.attrs[self.H5Attrs.COLUMNS.value])
+                            data = ds[:]
+                            gene = data[:, columns.index('GENE')]
+                            data[:, columns.index('GENE')] = np.where(gene >= 0, remap[np.maximum(gene, 0)], -1)
+                            grp.create_dataset(sid, data = data)
+                            grp[sid].attrs[self.H5Attrs.COLUMNS.value] = columns
+                            rows += data.shape[0]
+        os.replace(tmp, h5)
+
+        if len(duplicated) > 0:
+            self.logger.warning(f"{len(duplicated)} samples of {cohort} are in several leaf cohorts, kept once")
+        return rows
+
+    def add_summary_nodes(self, graph: BuildGraph):
+        """
+        one node per cohort merging its shard in the summary h5 file, and one node per resolution counting the
+        mutations in the windows, the summary has one table of all the mutations per cohort :
+        \\{h5_path}/{dataset_name}.h5
+        |- Breast-AdenoCa
+         |- mutations      CHROM, SAMPLE, START, END, ... sorted by CHROM then START
+         |- chrom_indptr   mutations on Chm(v) are the rows [chrom_indptr[v-1], chrom_indptr[v])
+         |- samples        sample ids, SAMPLE is the index in this list
+         |- genes          gene symbols, GENE is the index in this list (-1 if no gene)
+         |- gene_indptr    mutations in genes[g] are the rows gene_rows[gene_indptr[g]:gene_indptr[g+1]]
+         |- gene_rows
+         |- counts
+          |- chr1
+           |- 10000_0      number of mutations in each window of chr1, the windows of WindowGrid
+           |- 100000_0
+          ....
+        |- Breast-DCIS
+        ....
+        """
+        for cohort, shard in zip(self.cohort_list, self.h5_list):
+            summary_node = graph.add(f"summary:{cohort}",
+                                     fn = partial(self.build_cohort_summary, cohort, shard),
+                                     deps = [self.shard_nodes[cohort]],
+                                     params = {'chroms': self.genome.chroms},
+                                     outputs = [(self.summary_h5_fname, f"{cohort}/mutations")],
+                                     parallel = False)
+            for rslt in self.resolutions:
+                grid = WindowGrid(rslt, self.overlap, self.genome.chrom_sizes)
+                graph.add(f"counts:{cohort}:{rslt}_{self.overlap}",
+                          fn = partial(self.build_window_counts, cohort, rslt),
+                          deps = [summary_node],
+                          params = {'resolution': rslt, 'overlap': self.overlap, 'chroms': grid.chroms},
+                          outputs = [(self.summary_h5_fname, f"{cohort}/counts/{grid.dataset_name(grid.chroms[0])}")],
+                          parallel = False)
+
+    def build_cohort_summary(self, cohort: str, shard: Path):
+        key = h5io.checkpoint_key(shard = Path(shard), N_grams = self.N_grams)
+        self.logger.info(f"start building summary of {cohort}: {self.summary_h5_fname}")
+        with h5io.open_h5(self.summary_h5_fname, 'a', self.logger) as h5fd:
+            if not self.rebuild_h5 and h5io.is_complete(h5fd, cohort, key):
+                self.logger.debug(f"{cohort} is complete in the summary")
+                return
+            self._merge_shard(h5fd, cohort, shard, key)
+
+    def build_window_counts(self, cohort: str, rslt: int):
+        grid = WindowGrid(rslt, self.overlap, self.genome.chrom_sizes)
+        with h5io.open_h5(self.summary_h5_fname, 'a', self.logger) as h5fd:
+            grp = h5fd[cohort]
+            key = h5io.checkpoint_key(cohort = grp.attrs.get(h5io.CHECKPOINT), resolution = rslt, overlap = self.overlap)
+            columns = list(grp['mutations'].attrs[self.H5Attrs.COLUMNS.value])
+            starts  = grp['mutations'][:, columns.index('START')] if len(grp['mutations']) > 0 else np.zeros(0, dtype=np.int64)
+            indptr  = grp['chrom_indptr'][:]
+            for c, chr in enumerate(grid.chroms):
+                dataset_name = f"{cohort}/counts/{grid.dataset_name(chr)}"
+                if not self.rebuild_h5 and h5io.is_complete(h5fd, dataset_name, key):
+                    continue
+                # the mutations of a chromosome are sorted by START, the windows may overlap
+                v = Chm[chr].value
+                chr_starts = starts[indptr[v-1]:indptr[v]]
+                w = grid.window_starts(grid.chrom_sizes[c])
+                counts = np.searchsorted(chr_starts, w + rslt) - np.searchsorted(chr_starts, w)
+                h5io.write_unit(h5fd, dataset_name, key, data = counts.astype(np.int32))
+
+    def _merge_shard(self, h5fd: h5py.File, cohort: str, shard: Path, key: str):
+        self.logger.debug(f"merge {shard} to {cohort}")
+        tables  = []
+        columns = ['START', 'END', 'ANNOT', 'del_length', 'insert_length', 'subs_type', 'subs_class', 'GENE'] + [ f"CONTEXT_{n}" for n in self.N_grams ]
+        with h5py.File(shard, 'r') as src:
+            genes = src['GENES'].asstr()[:].astype(object)
+            samples = sorted({ sid for chr in self._shard_chroms(src) for sid in src[chr].keys() })
+            sample_idx = { sid: i for i, sid in enumerate(samples) }
+            for chr in self._shard_chroms(src):
+                chm = self._chrom_value(chr)
+                if chm is None:
+                    self.logger.warning(f"skip the mutations on chromosome {chr} in {shard}")
+                    continue
+                for sid in src[chr].keys():
+                    ds = src[chr][sid]
+                    columns = list(ds.attrs[self.H5Attrs.COLUMNS.value])
+                    data = ds[:]
+                    tables.append(np.column_stack([np.full(len(data), chm), np.full(len(data), sample_idx[sid]), data]))
+
+        columns = ['CHROM', 'SAMPLE'] + columns
+        table = np.concatenate(tables).astype(np.int64) if len(tables) > 0 else np.zeros((0, len(columns)), dtype=np.int64)
+        table = table[np.lexsort((table[:, columns.index('START')], table[:, 0]))]
+        chrom_indptr = np.searchsorted(table[:, 0], np.arange(1, len(Chm) + 2))
+
+        # rows grouped by gene, the burden of a gene is a slice of gene_rows
+        gene = table[:, columns.index('GENE')]
+        in_gene   = np.flatnonzero(gene >= 0)
+        gene_rows = in_gene[np.argsort(gene[in_gene], kind='stable')]
+        gene_indptr = np.searchsorted(gene[gene_rows], np.arange(len(genes) + 1))
+
+        # the cohort is written to a temporary group, then moved in place, see mini_utils.h5io
+        tmp = f".{cohort}.tmp"
+        if tmp in h5fd:
+            del h5fd[tmp]
+        grp = h5fd.create_group(tmp)
+        grp.create_dataset('mutations', data = table, chunks = (min(len(table), 1 << 16), len(columns)) if len(table) > 0 else None)
+        grp['mutations'].attrs[self.H5Attrs.COLUMNS.value] = columns
+        grp.create_dataset('chrom_indptr', data = chrom_indptr)
+        grp.create_dataset('samples', data = np.array(samples, dtype = object), dtype = h5py.string_dtype())
+        grp.create_dataset('genes', data = genes, dtype = h5py.string_dtype())
+        grp.create_dataset('gene_indptr', data = gene_indptr)
+        grp.create_dataset('gene_rows', data = gene_rows)
+
+        if cohort in h5fd:
+            del h5fd[cohort]
+        h5fd.move(tmp, cohort)
+        h5fd[cohort].attrs[h5io.CHECKPOINT] = key
+        h5fd.flush()
+
+    def _window_reader(self) -> Tuple[WindowGrid, List[h5py.File], h5py.File]:
+        # opened on the first read, so that each DataLoader worker has its own file handles
+        if getattr(self, 'window_fds', None) is None:
+            self.grid = WindowGrid(self.resolutions[0], self.overlap, self.genome.chrom_sizes)
+            self.window_fds = ([ h5py.File(f, 'r', **self.h5_open_kwargs) for f in self.features ],
+                               h5py.File(self.summary_h5_fname, 'r', **self.h5_open_kwargs))
+            if self.heads is None:
+                self.heads = [ c for c in self.cohort_list if c in self.window_fds[1] ]
+            tables = [ fd[self.grid.dataset_name(self.grid.chroms[0])] for fd in self.window_fds[0] ]
+            self.window_widths = [ int(np.prod(ds.shape[1:])) for ds in tables ]
+            # the storages of the tables are the same on every chromosome, see BioBigWigDataset.build_h5_summary
+            self.window_storages = [ table_storage(ds)[0] for ds in tables ]
+            self.window_affine = self._feature_affine(tables)
+        return self.grid, self.window_fds[0], self.window_fds[1]
+
+    def _feature_affine(self, tables: List[h5py.Dataset]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        the multiplier and the bias of the columns, x * multiplier + bias, which dequantize the affine codes of the
+        tables and standardize the features at once, None if the values are read as they are
+        """
+        muls, biases = [], []
+        for f, fd, ds, width in zip(self.features, self.window_fds[0], tables, self.window_widths):
+            _, mul, bias = table_storage(ds)
+            mul, bias = (np.ones(width), np.zeros(width)) if mul is None else (mul, bias)
+            if self.normalize:
+                stats = load_stats(fd, self.grid)
+                if stats is None:
+                    raise ValueError(f"no statistics of {f} at {self.grid.resolution}_{self.grid.overlap}, or the summary changed, "
+                                     f"see prepare_normalization")
+                shift, scale = stats.affine()
+                mul, bias = mul * scale, (bias - shift) * scale
+            muls.append(mul)
+            biases.append(bias)
+        if not self.normalize and all([ s not in AFFINE for s in self.window_storages ]):
+            return None
+        return np.concatenate(muls).astype(np.float32), np.concatenate(biases).astype(np.float32)
+
+    def prepare_normalization(self):
+        """
+        compute the statistics of the feature summaries which are missing or out of date, before the readers open them
+        """
+        grid = WindowGrid(self.resolutions[0], self.overlap, self.genome.chrom_sizes)
+        for f in self.features:
+            update_stats(f, grid, self.logger)
+
+    def feature_columns(self) -> List[str]:
+        grid, feature_fds, _ = self._window_reader()
+        return [ c for fd in feature_fds for c in WindowGrid.columns(fd, grid.dataset_name(grid.chroms[0])) ]
+
+    def read_batch(self, indices) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        return the features (len(indices), n_features) and the mutation counts of each head (len(indices),)
+        """
+        grid, feature_fds, summary_fd = self._window_reader()
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+
+        # the tables are cast into their columns of x, then dequantized and standardized in place
+        x = np.empty((len(indices), sum(self.window_widths)), dtype=np.float32)
+        start = 0
+        for fd, width, storage in zip(feature_fds, self.window_widths, self.window_storages):
+            block = grid.read(fd, indices).reshape(len(indices), -1)
+            columns = x[:, start: start + width]
+            if storage == 'bfloat16':
+                columns[:] = (block.astype(np.uint32) << 16).view(np.float32)
+            else:
+                columns[:] = block
+                if storage in AFFINE:
+                    columns[block == AFFINE[storage][3]] = np.nan
+            start += width
+        if self.window_affine is not None:
+            np.multiply(x, self.window_affine[0], out=x)
+            np.add(x, self.window_affine[1], out=x)
+        y = { cohort: grid.read(summary_fd, indices, prefix = f"{cohort}/counts/") for cohort in self.heads }
+
+        if self.transform is not None:
+            x = self.transform(x)
+
+        return x, y
+
+    def __getitem__(self, index) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        x, y = self.read_batch([index])
+        return x[0], { k: v[0] for k, v in y.items() }
+
+    def __getitems__(self, indices: List[int]) -> List[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        # DataLoader reads a whole batch at once, then the default collate stacks the samples again
+        x, y = self.read_batch(indices)
+        return [ (x[i], { k: v[i] for k, v in y.items() }) for i in range(len(x)) ]
+
+    def __len__(self) -> int:
+        # without opening the files, DataLoader calls it before starting the workers
+        return len(WindowGrid(self.resolutions[0], self.overlap, self.genome.chrom_sizes))
+
+    def close_window_reader(self):
+        if getattr(self, 'window_fds', None) is not None:
+            for fd in self.window_fds[0]:
+                fd.close()
+            self.window_fds[1].close()
+            self.window_fds = None
+
+    def __del__(self):
+        self.close_window_reader()
+        super().__del__()
+
+    def gene_burden(self, cohort: str) -> pd.Series:
+        """
+        number of mutations in each gene, over all the samples of a cohort
+        """
+        grp = self.summary_h5_fd[cohort]
+        return pd.Series(np.diff(grp['gene_indptr'][:]), index = grp['genes'].asstr()[:])
+
+    def gene_mutations(self, cohort: str, gene: str) -> pd.DataFrame:
+        """
+        the mutations of a cohort in a gene, sorted by position
+        """
+        grp = self.summary_h5_fd[cohort]
+        genes = grp['genes'].asstr()[:].astype(str)
+        g = np.searchsorted(genes, gene)
+        columns = list(grp['mutations'].attrs[self.H5Attrs.COLUMNS.value])
+        if g >= len(genes) or genes[g] != gene:
+            return pd.DataFrame(np.zeros((0, len(columns)), dtype=np.int64), columns = columns)
+        rows = grp['gene_rows'][grp['gene_indptr'][g]:grp['gene_indptr'][g+1]]
+        return pd.DataFrame(grp['mutations'][rows], columns = columns)
 
     ## x is one row in pandas.DataFrame    
     def _encode_subs(self, x: pd.Series, substitution_dict: Dict):
@@ -572,25 +1246,39 @@ class BioDigDriverfDataset(BioMafDataset):
     def _encode_subs_type(self, x: pd.Series):
         return self._encode_subs(x, bio.BASE_SUBSTITUTION_TYPES)
         
-    def _encode_gene(self, x: pd.Series):
-        pass
+    def _encode_gene_column(self, maf_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        return the index of each gene symbol in the sorted symbols of the file, -1 for '.'
+        """
+        symbols = maf_df['GENE'].fillna('.').astype(str).str.strip()
+        codes, genes = pd.factorize(symbols.where(symbols != '.'), sort = True)
+        return codes.astype(np.int64), np.asarray(genes, dtype = object)
 
     def _encode_annot(self, x: pd.Series):
         return bio.MUT_ANNOT[x['ANNOT'].strip()].value
     
+    def _encode_context_column(self, maf_df: pd.DataFrame, n: int) -> np.ndarray:
+        contexts = maf_df["CONTEXT"].fillna('.').astype(str).str.strip()
+        if self.reference_genome is not None:
+            # contexts shorter than n are taken from the reference genome as well
+            contexts = contexts.where(contexts.str.len() >= n, '.')
+
+        try:
+            codes = bio.encode_context_strings(contexts.to_numpy(), n)
+        except ValueError as e:
+            self.logger.error(str(e))
+            raise
+
+        if self.reference_genome is not None:
+            # indels have no context
+            fill = (codes < 0) & (maf_df["ANNOT"].astype(str).str.strip() != bio.MUT_ANNOT.INDEL.name).to_numpy()
+            self.logger.debug(f"fill {fill.sum()} contexts of length {n} from the reference genome")
+            codes[fill] = self.reference_genome.contexts(maf_df["CHROM"].to_numpy()[fill], 
+                                                         maf_df["START"].to_numpy()[fill], n)
+        return codes
+
     def _encode_context(self, x: pd.Series, n: int):
-        ctx = x["CONTEXT"].strip()
-        if ctx == '.':
-            return -1
-        elif len(ctx) < n :
-            err_msg = f"length of context {x['CONTEXT']} is less than {n}"
-            self.logger.error(err_msg)
-            raise ValueError(err_msg)
-        elif len(ctx) == n :
-            return int(self.N_grams[n][ctx])
-        else:
-            s = int((len(ctx)-n)/2)
-            return int(self.N_grams[n][ctx[s:s+n]])
+        return int(self._encode_context_column(pd.DataFrame([x]), n)[0])
         
     def _encode_indel(self, x: pd.Series): 
         if x['ANNOT'].strip() == bio.MUT_ANNOT.INDEL.name :
@@ -600,6 +1288,7 @@ class BioDigDriverfDataset(BioMafDataset):
 
     def encode(self, x):
         # MAF_COLUMNS = ['CHROM', 'START', 'END', 'REF', 'ALT', 'SAMPLE', 'GENE', 'ANNOT', 'MUT', 'CONTEXT']
-        self.dataset_colnames = ['START', 'END', 'ANNOT', 'del_length', 'insert_length', 'subs_type', 'subs_class', 'CONTEXT_3']
-        rst = [x['START'], x['END'], self._encode_annot(x), *self._encode_indel(x), self._encode_subs_type(x), self._encode_subs_class(x), self._encode_context(x, 3)]
+        # the CONTEXT_{n} columns are encoded for the whole column in build_h5
+        self.dataset_colnames = ['START', 'END', 'ANNOT', 'del_length', 'insert_length', 'subs_type', 'subs_class']
+        rst = [x['START'], x['END'], self._encode_annot(x), *self._encode_indel(x), self._encode_subs_type(x), self._encode_subs_class(x)]
         return rst
\ No newline at end of file
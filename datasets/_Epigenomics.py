@@ -11,6 +11,7 @@ from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 ## local modules
 from datasets import BioBigWigDataset
+from mini_utils.bio import Genome
 from mini_utils.convert import enum_elt_list, enum_value_list
 
 def _build_celline_enum(epig_modi_name: str, epig_modi_cl: List[str]):
@@ -156,7 +157,11 @@ class RoadmapEpigenomicsDataset(BioBigWigDataset):
         design_cell_line: List[int] | int | str = 'all',
         preprocess: Optional[Callable] = None, 
         transform:  Optional[Callable] = None,
-        lazy_load: bool = True
+        lazy_load: bool = True,
+        concurrent: int = 0,
+        dry_run: bool = False,
+        genome: Optional[Genome] = None,
+        storage: str = 'float64'
     ) -> None:
         
         self.dataset_name = "Epigenomics"
@@ -196,16 +201,15 @@ class RoadmapEpigenomicsDataset(BioBigWigDataset):
                          rebuild_h5 = rebuild_h5,
                          preprocess = preprocess,
                          transform  = transform,
-                         lazy_load  = lazy_load)
-
-    def build_h5_summary(self):
-
-        mode = 'a'
-        if self.rebuild_h5:
-            mode = 'w'
+                         lazy_load  = lazy_load,
+                         concurrent = concurrent,
+                         dry_run    = dry_run,
+                         genome     = genome,
+                         storage    = storage)
 
+    def _summary_sources(self) -> Dict[str, Path]:
+        sources = {}
         for epig_modi in self.design_epig_modi: 
-            h5fd_dict = {}
             epig_modi_name = epig_modi.__name__
 
             if type(self.design_cell_line) is str and self.design_cell_line == 'all':
@@ -215,22 +219,10 @@ class RoadmapEpigenomicsDataset(BioBigWigDataset):
 
             for epig_cell_line in epig_modi:
                 bigwig_fname = self._bigwig_fname(epig_cell_line)
-                bigwig_fname = self.raw_path.joinpath(bigwig_fname)
-                h5_fname     = self._h5_fname(bigwig_fname.name)
-                ds_key = f"{epig_modi_name}_{epig_cell_line.name}"
-                h5fd_dict[ds_key] = h5py.File(h5_fname, 'r') 
-
-        self.logger.info(f"start building summary: {self.summary_h5_fname}")
-        with h5py.File(self.summary_h5_fname, mode=mode) as h5fd:
-            for rslt in self.resolutions:
-                dataset_name = self._dataset_name(rslt, self.overlap) 
-                for chr in self.Chm:
-                    ############# TODO: Rewrite the logic 
-                    if self.rebuild_h5 or chr.name not in h5fd.keys() or dataset_name not in h5fd[chr.name].keys() :
-                        self._concat_summary_table(h5fd, h5fd_dict, chr, rslt, self.overlap) 
+                h5_fname     = self._h5_fname(bigwig_fname)
+                sources[f"{epig_modi_name}_{epig_cell_line.name}"] = h5_fname
 
-            for k in h5fd_dict:
-                h5fd_dict[k].close()
+        return sources
 
     def _bigwig_track_key(self, cell_line: Enum, epig_modi: str):
         return f"{cell_line.name}-{epig_modi}"
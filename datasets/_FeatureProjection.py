@@ -0,0 +1,132 @@
+import h5py
+import logging
+
+import numpy as np
+
+from logging import Logger
+from pathlib import Path
+from typing import Dict, List, Union
+
+from mini_utils import h5io
+
+from ._WindowGrid import WindowGrid
+from ._FeatureStats import compute_stats, load_stats, stats_key
+from ._Quantization import read_decoded
+
+# principal components of the standardized columns, or a gaussian random projection
+PROJECTIONS = ('pca', 'random')
+
+def projected_fname(fname: Union[str, Path], method: str, components: int) -> Path:
+    """
+    the summary of the projected features, next to the summary of the features : Epigenomics.pca32.h5
+    """
+    fname = Path(fname)
+    return fname.with_name(f"{fname.stem}.{method}{components}.h5")
+
+def projection_name(grid: WindowGrid) -> str:
+    return f"projection/{grid.resolution}_{grid.overlap}"
+
+def _blocks(h5fd: h5py.File, grid: WindowGrid, block_rows: int):
+    for chr in grid.chroms:
+        ds = h5fd[grid.dataset_name(chr)]
+        for s in range(0, ds.shape[0], block_rows):
+            yield read_decoded(ds, slice(s, s + block_rows)).reshape(min(block_rows, ds.shape[0] - s), -1)
+
+def _standardize(block: np.ndarray, shift: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    # the missing values (the windows without signal of a track) are replaced by the mean of the column
+    return np.nan_to_num((block - shift) * scale, nan = 0., posinf = 0., neginf = 0.)
+
+def fit_projection(h5fd: h5py.File, grid: WindowGrid, method: str = 'pca', components: int = 32,
+                   block_rows: int = 65536, seed: int = 0) -> Dict[str, np.ndarray]:
+    """
+    the projection (n_columns, components) of the standardized columns of the tables of the grid, the tables are read
+    by blocks of block_rows windows. pca accumulates the covariance of the columns in one pass and keeps its leading
+    eigenvectors, the memory is n_columns^2 whatever the number of windows
+    """
+    if method not in PROJECTIONS:
+        raise ValueError(f"unknown projection {method}, expected one of {PROJECTIONS}")
+    stats = load_stats(h5fd, grid)
+    if stats is None:
+        stats = compute_stats(h5fd, grid, block_rows)
+    n_columns = len(stats.count)
+    if not 0 < components <= n_columns:
+        raise ValueError(f"{components} components of {n_columns} columns")
+    shift, std = stats.mean, stats.std
+    scale = np.where(std > 0, 1. / np.where(std > 0, std, 1.), 1.)
+
+    if method == 'random':
+        rng = np.random.default_rng(seed)
+        matrix = rng.standard_normal((n_columns, components)) / np.sqrt(components)
+        return {'shift': shift, 'scale': scale, 'matrix': matrix, 'explained': np.full(components, np.nan)}
+
+    gram, n = np.zeros((n_columns, n_columns)), 0
+    for block in _blocks(h5fd, grid, block_rows):
+        z = _standardize(block, shift, scale)
+        gram += z.T @ z
+        n += len(z)
+    values, vectors = np.linalg.eigh(gram / max(n, 1))
+    order = np.argsort(values)[::-1][:components]
+    matrix = vectors[:, order]
+    # the sign of an eigenvector is arbitrary, the largest loading is positive
+    matrix *= np.sign(matrix[np.abs(matrix).argmax(axis = 0), np.arange(components)])
+    total = values.clip(min = 0).sum()
+    explained = values[order].clip(min = 0) / total if total > 0 else np.zeros(components)
+    return {'shift': shift, 'scale': scale, 'matrix': matrix, 'explained': explained}
+
+def _key(src_fd: h5py.File, grid: WindowGrid, method: str, components: int, seed: int) -> str:
+    return h5io.checkpoint_key(source = stats_key(src_fd, grid), method = method, components = components, seed = seed)
+
+def _is_complete(dst_fd: h5py.File, grid: WindowGrid, key: str) -> bool:
+    return all([ h5io.is_complete(dst_fd, name, key) for name in [projection_name(grid)] + [ grid.dataset_name(c) for c in grid.chroms ] ])
+
+def write_projection(src_fd: h5py.File, dst_fd: h5py.File, grid: WindowGrid, method: str = 'pca', components: int = 32,
+                     block_rows: int = 65536, seed: int = 0, logger: Logger = logging.getLogger()) -> Dict[str, np.ndarray]:
+    """
+    write the projection of the tables of the grid to projection/{rslt}_{overlap}, and the projected tables
+    {chr}/{rslt}_{overlap} (windows, components), unless they are up to date
+    """
+    key = _key(src_fd, grid, method, components, seed)
+    name = projection_name(grid)
+    if _is_complete(dst_fd, grid, key):
+        ds = dst_fd[name]
+        return dict({ k: ds.attrs[k] for k in ['shift', 'scale', 'explained'] }, matrix = ds[:])
+
+    projection = fit_projection(src_fd, grid, method, components, block_rows, seed)
+    columns = [ f"{Path(src_fd.filename).stem}_{method}{i}" for i in range(components) ]
+    matrix = projection['matrix'].astype(np.float32)
+    for chr in grid.chroms:
+        ds = src_fd[grid.dataset_name(chr)]
+        staged = h5io.create_staged(dst_fd, grid.dataset_name(chr), shape = (ds.shape[0], components), dtype = np.float32,
+                                    chunks = (max(1, min(ds.shape[0], ds.chunks[0] if ds.chunks is not None else 1024)), components))
+        for s in range(0, ds.shape[0], block_rows):
+            block = read_decoded(ds, slice(s, s + block_rows)).reshape(min(block_rows, ds.shape[0] - s), -1)
+            staged[s: s + len(block)] = _standardize(block, projection['shift'], projection['scale']).astype(np.float32) @ matrix
+        h5io.commit_staged(dst_fd, grid.dataset_name(chr), key, {'columns': columns})
+    # the projection is written last, the tables are complete with it
+    h5io.write_unit(dst_fd, name, key, projection['matrix'],
+                    attrs = {'shift': projection['shift'], 'scale': projection['scale'], 'explained': projection['explained'],
+                             'method': method, 'columns': WindowGrid.columns(src_fd, grid.dataset_name(grid.chroms[0]))})
+    dst_fd.attrs['columns'] = columns
+    dst_fd.flush()
+    explained = np.nansum(projection['explained'])
+    logger.info(f"{len(projection['shift'])} columns of {src_fd.filename} projected on {components} {method} components "
+                f"at {grid.resolution}_{grid.overlap}" + (f", {100 * explained:.1f}% of the variance" if method == 'pca' else ''))
+    return projection
+
+def project_features(fname: Union[str, Path], grids: List[WindowGrid], method: str = 'pca', components: int = 32,
+                     block_rows: int = 65536, seed: int = 0, logger: Logger = logging.getLogger()) -> Path:
+    """
+    the summary of the projected features of a summary at each grid, see projected_fname. The file is only opened
+    for writing if a projection is missing or out of date, a feature source of BioDigDriverfDataset as the summary is
+    """
+    dst = projected_fname(fname, method, components)
+    with h5py.File(fname, 'r') as src_fd:
+        keys = [ _key(src_fd, grid, method, components, seed) for grid in grids ]
+        if dst.exists():
+            with h5py.File(dst, 'r') as dst_fd:
+                if all([ _is_complete(dst_fd, grid, key) for grid, key in zip(grids, keys) ]):
+                    return dst
+        with h5io.open_h5(dst, 'a', logger) as dst_fd:
+            for grid in grids:
+                write_projection(src_fd, dst_fd, grid, method, components, block_rows, seed, logger)
+    return dst
@@ -0,0 +1,178 @@
+import h5py
+import logging
+import warnings
+
+import numpy as np
+
+from logging import Logger
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from mini_utils import h5io
+
+from ._WindowGrid import WindowGrid
+from ._Quantization import read_decoded
+
+
+class FeatureStats(object):
+
+    """
+    FeatureStats accumulates the statistics of the columns of a table in one pass over blocks of rows, the NaN
+    values are ignored :
+
+    stats = FeatureStats(n_columns)
+    for block in blocks:
+        stats.update(block)
+    stats.mean, stats.var, stats.min, stats.max, stats.quantiles()
+
+    The mean and the variance are merged block by block (Welford, Chan et al.), the quantiles are estimated on
+    a uniform sample of sample_size rows, the rows of the smallest random keys, so that the memory is bounded.
+    """
+
+    QUANTILES = np.array([0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99])
+    FIELDS = ('count', 'mean', 'var', 'min', 'max', 'quantile_levels', 'quantiles')
+
+    def __init__(self, n_columns: int, sample_size: int = 8192, seed: int = 0) -> None:
+        self.count = np.zeros(n_columns, dtype=np.int64)
+        self.mean  = np.zeros(n_columns, dtype=np.float64)
+        self.m2    = np.zeros(n_columns, dtype=np.float64)
+        self.min   = np.full(n_columns, np.inf)
+        self.max   = np.full(n_columns, -np.inf)
+        self.sample_size = sample_size
+        self.sample = np.zeros((0, n_columns), dtype=np.float64)
+        self.keys   = np.zeros(0, dtype=np.float64)
+        # the quantiles read from a file, without the sample
+        self.stored_quantiles = None
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, block: np.ndarray):
+        block = np.asarray(block, dtype=np.float64).reshape(len(block), -1)
+        self.stored_quantiles = None
+        valid = ~np.isnan(block)
+        n = valid.sum(axis=0)
+        mean = np.where(valid, block, 0.).sum(axis=0) / np.maximum(n, 1)
+        m2 = (np.where(valid, block - mean, 0.) ** 2).sum(axis=0)
+
+        total = self.count + n
+        delta = mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(total > 0, self.mean + delta * n / total, 0.)
+            self.m2 = np.where(total > 0, self.m2 + m2 + delta ** 2 * self.count * n / total, 0.)
+        self.count = total
+        self.min = np.minimum(self.min, np.where(valid, block, np.inf).min(axis=0, initial=np.inf))
+        self.max = np.maximum(self.max, np.where(valid, block, -np.inf).max(axis=0, initial=-np.inf))
+
+        # bottom-k sample of the rows
+        keys = np.concatenate([self.keys, self.rng.random(len(block))])
+        rows = np.concatenate([self.sample, block])
+        if len(keys) > self.sample_size:
+            kept = np.argpartition(keys, self.sample_size)[:self.sample_size]
+            keys, rows = keys[kept], rows[kept]
+        self.keys, self.sample = keys, rows
+
+    @property
+    def var(self) -> np.ndarray:
+        return self.m2 / np.maximum(self.count, 1)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.var)
+
+    def quantiles(self) -> np.ndarray:
+        """
+        the quantiles QUANTILES of the columns, (len(QUANTILES), n_columns), NaN for the columns without values
+        """
+        if self.stored_quantiles is not None:
+            return self.stored_quantiles
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.nanquantile(self.sample, self.QUANTILES, axis=0) if len(self.sample) > 0 \
+                else np.full((len(self.QUANTILES), len(self.count)), np.nan)
+
+    def affine(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        the shift and the scale of the standardization (x - shift) * scale, float32, the constant columns are only centred
+        """
+        std = self.std
+        scale = np.where(std > 0, 1. / np.where(std > 0, std, 1.), 1.)
+        return self.mean.astype(np.float32), scale.astype(np.float32)
+
+    def as_dict(self) -> Dict[str, np.ndarray]:
+        return dict(zip(self.FIELDS, [self.count, self.mean, self.var, self.min, self.max, self.QUANTILES, self.quantiles()]))
+
+    @classmethod
+    def from_group(cls, group: h5py.Group) -> 'FeatureStats':
+        stats = cls(len(group['count']))
+        stats.count, stats.mean = group['count'][:], group['mean'][:]
+        stats.min, stats.max = group['min'][:], group['max'][:]
+        stats.m2 = group['var'][:] * stats.count
+        stats.stored_quantiles = group['quantiles'][:]
+        return stats
+
+    def __repr__(self) -> str:
+        return f"FeatureStats({len(self.count)} columns, {int(self.count.max()) if len(self.count) > 0 else 0} rows)"
+
+
+def stats_name(grid: WindowGrid) -> str:
+    # the statistics of the tables {chr}/{rslt}_{overlap} are the datasets stats/{rslt}_{overlap}/mean ..., not attributes
+    # of the file, an attribute is limited to 64 KB and the quantiles of a thousand columns are larger
+    return f"stats/{grid.resolution}_{grid.overlap}"
+
+def stats_key(h5fd: h5py.File, grid: WindowGrid) -> str:
+    """
+    the key of the tables of the grid, the checkpoints of the tables built by mini_utils.h5io, their shapes otherwise
+    """
+    tables = {}
+    for chr in grid.chroms:
+        ds = h5fd[grid.dataset_name(chr)]
+        checkpoint = ds.attrs.get(h5io.CHECKPOINT)
+        tables[chr] = checkpoint if checkpoint is not None else [list(ds.shape), str(ds.dtype)]
+    return h5io.checkpoint_key(tables = tables)
+
+def compute_stats(h5fd: h5py.File, grid: WindowGrid, block_rows: int = 65536, sample_size: int = 8192) -> FeatureStats:
+    """
+    the statistics of the columns of the tables of the grid, read by blocks of block_rows windows
+    """
+    stats = None
+    for chr in grid.chroms:
+        ds = h5fd[grid.dataset_name(chr)]
+        if stats is None:
+            stats = FeatureStats(int(np.prod(ds.shape[1:])), sample_size)
+        for s in range(0, ds.shape[0], block_rows):
+            stats.update(read_decoded(ds, slice(s, s + block_rows)).reshape(-1, len(stats.count)))
+    return stats
+
+def load_stats(h5fd: h5py.File, grid: WindowGrid) -> Optional[FeatureStats]:
+    """
+    the statistics of the tables of the grid, None if they are missing or the tables changed since
+    """
+    name, key = stats_name(grid), stats_key(h5fd, grid)
+    if not all([ h5io.is_complete(h5fd, f"{name}/{k}", key) for k in FeatureStats.FIELDS ]):
+        return None
+    return FeatureStats.from_group(h5fd[name])
+
+def write_stats(h5fd: h5py.File, grid: WindowGrid, logger: Logger = logging.getLogger(), force: bool = False) -> FeatureStats:
+    """
+    compute the statistics of the tables of the grid and keep them in stats/{rslt}_{overlap}, unless they are up to date
+    """
+    stats = None if force else load_stats(h5fd, grid)
+    if stats is not None:
+        return stats
+    stats = compute_stats(h5fd, grid)
+    name, key = stats_name(grid), stats_key(h5fd, grid)
+    for k, v in stats.as_dict().items():
+        h5io.write_unit(h5fd, f"{name}/{k}", key, v)
+    h5fd.flush()
+    logger.info(f"statistics of {len(stats.count)} columns of {h5fd.filename} at {grid.resolution}_{grid.overlap}")
+    return stats
+
+def update_stats(fname: Union[str, Path], grid: WindowGrid, logger: Logger = logging.getLogger()) -> FeatureStats:
+    """
+    the statistics of the tables of a file, the file is only opened for writing if they are out of date
+    """
+    with h5py.File(fname, 'r') as h5fd:
+        stats = load_stats(h5fd, grid)
+    if stats is not None:
+        return stats
+    with h5io.open_h5(fname, 'a', logger) as h5fd:
+        return write_stats(h5fd, grid, logger)
@@ -9,6 +9,7 @@ from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 ## local modules
 from datasets import BioBigWigDataset
+from mini_utils.bio import Genome
 
 class MappabilityDataset(BioBigWigDataset):
 
@@ -35,7 +36,11 @@ class MappabilityDataset(BioBigWigDataset):
         design_mers: List[int] = [24, 36, 40, 50, 75, 100],
         preprocess: Optional[Callable] = None, 
         transform:  Optional[Callable] = None,
-        lazy_load:  bool = True
+        lazy_load:  bool = True,
+        concurrent: int = 0,
+        dry_run: bool = False,
+        genome: Optional[Genome] = None,
+        storage: str = 'float64'
     ) -> None:
         
         self.dataset_name = "Mappability"
@@ -52,27 +57,15 @@ class MappabilityDataset(BioBigWigDataset):
                          rebuild_h5 = rebuild_h5,
                          preprocess = preprocess,
                          transform  = transform,
-                         lazy_load  = lazy_load)
+                         lazy_load  = lazy_load,
+                         concurrent = concurrent,
+                         dry_run    = dry_run,
+                         genome     = genome,
+                         storage    = storage)
 
 
-    def build_h5_summary(self):
-        mode = 'a'
-        if self.rebuild_h5:
-            mode = 'w'
-
-        # open designed h5 files 
-        h5fd_dict = { self._h5_fname_to_mer(h5).name: h5py.File(h5, 'r') for h5 in self.h5_list if self._h5_fname_to_mer(h5) in self.design_mers }
-
-        self.logger.info(f"start building summary: {self.summary_h5_fname}")
-        with h5py.File(self.summary_h5_fname, mode=mode) as h5fd:
-            for rslt in self.resolutions:
-                dataset_name = self._dataset_name(rslt, self.overlap) 
-                for chr in self.Chm:
-                    if self.rebuild_h5 or chr.name not in h5fd.keys() or dataset_name not in h5fd[chr.name].keys() :
-                        self._concat_summary_table(h5fd, h5fd_dict, chr, rslt, self.overlap) 
-
-        for k in h5fd_dict:
-            h5fd_dict[k].close()
+    def _summary_sources(self) -> Dict[str, Path]:
+        return { self._h5_fname_to_mer(h5).name: h5 for h5 in self.h5_list if self._h5_fname_to_mer(h5) in self.design_mers }
 
     def _bigwig_fname(self, key):
         return f"wgEncodeCrgMapability{key}.bigWig"
@@ -5,10 +5,11 @@ import numpy as np
 
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from ._BioDataset import BioDigDriverfDataset
+from ._BioDataset import BioDataset, BioDigDriverfDataset
+from mini_utils.bio import Genome
 
 
-class Dietlein(BioDigDriverfDataset):
+class MegacohortDataset(BioDigDriverfDataset):
 
     """
     designed_sets = 'Kidney', 'Esogastric', 'LungNSC', 
@@ -35,9 +36,13 @@ class Dietlein(BioDigDriverfDataset):
                  rebuild_h5: bool = False, 
                  preprocess: Callable[..., Any] | None = None, 
                  transform: Callable[..., Any] | None = None, 
-                 lazy_load: bool = True ) -> None:
+                 lazy_load: bool = True,
+                 reference_genome: BioDataset | None = None,
+                 concurrent: int = 0,
+                 dry_run: bool = False,
+                 genome: Genome | None = None ) -> None:
         
-        self.dataset_name = "PCAWG"
+        self.dataset_name = "Megacohort"
 
         self.resolutions = resolutions
         self.overlap = overlap
@@ -56,7 +61,4 @@ class Dietlein(BioDigDriverfDataset):
 
         self.source_list = [ f"{self.mirror}/{fn}_SNV.DEDUP.no_hypermut.annot.txt.gz" for fn in self.designed_subsets ]
 
-        super().__init__(h5_path, raw_path, N_grams, logger, force_download, concurrent_download, rebuild_h5, preprocess, transform, lazy_load)
-
-    def build_h5_summary(self):
-        pass
\ No newline at end of file
+        super().__init__(h5_path, raw_path, N_grams, logger, force_download, concurrent_download, rebuild_h5, preprocess, transform, lazy_load, reference_genome, concurrent, dry_run, genome)
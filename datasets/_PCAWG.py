@@ -3,9 +3,12 @@ from logging import Logger
 from pathlib import Path
 import numpy as np
 
+from functools import partial
+
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from ._BioDataset import BioDigDriverfDataset
+from ._BioDataset import BioDataset, BioDigDriverfDataset
+from mini_utils import bio
 
 
 class PCAWGDataset(BioDigDriverfDataset):
@@ -20,6 +23,13 @@ class PCAWGDataset(BioDigDriverfDataset):
                 'Eso-AdenoCa', 'Head-SCC', 'Hematopoietic_tumors',  'Bone-Cart', 'Bone-Epith',
                 'Bone-Osteosarc','Breast_tumors', 'CNS-Medullo','Digestive_tract_tumors',
                 'Glioma_tumors', 'Panc-Endocrine', 'Prost-AdenoCA'
+
+    The '*_tumors' and 'Pancan' subsets are unions of the leaf histologies (bio.PCAWG_COHORT_HIERARCHY).
+    With merge_supersets, only the leaf files are downloaded and converted, and the superset shards are
+    merged from the leaf shards, the samples present in several leaves are kept once.
+
+    The items are the windows at the smallest resolution, the features are read from the summary h5 files
+    in features, and the targets are the mutation counts of each cohort in heads (the designed subsets by default).
     """
 
     mirror = "https://cb.csail.mit.edu/cb/DIG/downloads/mutation_files/PCAWG/ICGC_only"
@@ -48,7 +58,14 @@ class PCAWGDataset(BioDigDriverfDataset):
                  rebuild_h5: bool = False, 
                  preprocess: Callable[..., Any] | None = None, 
                  transform: Callable[..., Any] | None = None, 
-                 lazy_load: bool = True ) -> None:
+                 lazy_load: bool = True,
+                 reference_genome: BioDataset | None = None,
+                 concurrent: int = 0,
+                 merge_supersets: bool = True,
+                 features: List[str | Path] = [],
+                 heads: List[str] | None = None,
+                 dry_run: bool = False,
+                 genome: bio.Genome | None = None ) -> None:
         
         logger.debug("init PCAWG start")
 
@@ -69,18 +86,39 @@ class PCAWGDataset(BioDigDriverfDataset):
                 else:
                     logger.warning(f"{s} is not identified in subset list")
 
-        self.source_list = [ f"{self.mirror}/{fn}_SNV_MNV_INDEL.ICGC.annot.txt.gz" for fn in self.designed_subsets ]
+        self.merge_supersets = merge_supersets
+        if self.merge_supersets:
+            self.designed_supersets = [ s for s in self.designed_subsets if s in bio.PCAWG_COHORT_HIERARCHY ]
+            leaves = [ l for s in self.designed_subsets for l in bio.cohort_leaves(s) ]
+            leaves = list(dict.fromkeys(leaves))
+        else:
+            self.designed_supersets = []
+            leaves = self.designed_subsets
 
-        super().__init__(h5_path, raw_path, N_grams, logger, force_download, concurrent_download, rebuild_h5, preprocess, transform, lazy_load)
+        self.source_list = [ f"{self.mirror}/{self._maf_fname(fn)}" for fn in leaves ]
 
-        logger.debug("init PCAWG end")
+        self.features = [ Path(f) for f in features ]
+        self.heads = self.designed_subsets if heads is None else heads
 
-    def build_h5_summary(self):
-        pass
+        super().__init__(h5_path, raw_path, N_grams, logger, force_download, concurrent_download, rebuild_h5, preprocess, transform, lazy_load, reference_genome, concurrent, dry_run, genome)
 
-    def __getitem__(self, index) -> Any:
-        return super().__getitem__(index)
-    
-    def __len__(self):
-        pass
+        logger.debug("init PCAWG end")
 
+    def _maf_fname(self, subset: str) -> str:
+        return f"{subset}_SNV_MNV_INDEL.ICGC.annot.txt.gz"
+
+    def add_shard_nodes(self, graph, shards):
+        super().add_shard_nodes(graph, shards)
+
+        for superset in self.designed_supersets:
+            h5 = self._h5_fname(self._maf_fname(superset))
+            leaves = bio.cohort_leaves(superset)
+            leaf_shards = [ self._h5_fname(self._maf_fname(l)) for l in leaves ]
+            self.shard_nodes[superset] = graph.add(f"merge:{superset}",
+                                                   fn = partial(self.merge_cohort_shards, superset, leaf_shards, h5),
+                                                   deps = [ self.shard_nodes[l] for l in leaves ],
+                                                   params = {'leaves': leaves},
+                                                   outputs = [h5])
+            if superset not in self.cohort_list:
+                self.h5_list.append(h5)
+                self.cohort_list.append(superset)
@@ -0,0 +1,88 @@
+import h5py
+
+import numpy as np
+
+from typing import Optional, Tuple
+
+# the storage of the values of the summary tables :
+#   float64, float32, float16   the values cast
+#   bfloat16                    the 16 high bits of the float32 values, rounded to the nearest even, in uint16
+#   int8, uint16                per-column affine codes, value = code * scale + offset, one code is NaN
+STORAGES = ('float64', 'float32', 'float16', 'bfloat16', 'int8', 'uint16')
+
+# dtype, lowest and highest codes of the values, code of NaN
+AFFINE = {
+    'int8':   (np.int8,   -127,  127, -128),
+    'uint16': (np.uint16,    0, 65534, 65535),
+}
+
+def storage_dtype(storage: str) -> np.dtype:
+    if storage not in STORAGES:
+        raise ValueError(f"unknown storage {storage}, expected one of {STORAGES}")
+    if storage == 'bfloat16':
+        return np.dtype(np.uint16)
+    if storage in AFFINE:
+        return np.dtype(AFFINE[storage][0])
+    return np.dtype(storage)
+
+def affine_params(vmin: np.ndarray, vmax: np.ndarray, storage: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    the scale and the offset of the codes of each column, the codes cover [vmin, vmax]
+    """
+    _, lo, hi, _ = AFFINE[storage]
+    vmin = np.where(np.isfinite(vmin), vmin, 0.)
+    vmax = np.where(np.isfinite(vmax), vmax, vmin)
+    scale = np.where(vmax > vmin, (vmax - vmin) / (hi - lo), 1.)
+    return scale, vmin - lo * scale
+
+def encode(table: np.ndarray, storage: str, scale: Optional[np.ndarray] = None, offset: Optional[np.ndarray] = None) -> np.ndarray:
+    table = np.asarray(table, dtype=np.float64)
+    if storage == 'bfloat16':
+        bits = table.astype(np.float32).view(np.uint32).astype(np.uint64)
+        return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+    if storage in AFFINE:
+        dtype, lo, hi, nan = AFFINE[storage]
+        with np.errstate(invalid='ignore'):
+            codes = np.clip(np.rint((table - offset) / scale), lo, hi)
+        return np.where(np.isnan(table), nan, codes).astype(dtype)
+    return table.astype(storage_dtype(storage))
+
+def decode(codes: np.ndarray, storage: str, scale: Optional[np.ndarray] = None, offset: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    the float32 values of the codes
+    """
+    if storage == 'bfloat16':
+        return (codes.astype(np.uint32) << 16).view(np.float32)
+    if storage in AFFINE:
+        values = codes.astype(np.float32) * scale.astype(np.float32) + offset.astype(np.float32)
+        values[codes == AFFINE[storage][3]] = np.nan
+        return values
+    return codes.astype(np.float32)
+
+def table_storage(ds: h5py.Dataset) -> Tuple[str, Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    the storage, scale and offset of a table, the tables written before the storages are float64
+    """
+    attrs = ds.attrs
+    storage = attrs.get('storage', 'float64')
+    if storage in AFFINE:
+        return storage, attrs['scale'][:], attrs['offset'][:]
+    return storage, None, None
+
+def read_decoded(ds: h5py.Dataset, rows: slice = slice(None)) -> np.ndarray:
+    values = ds[rows]
+    storage, scale, offset = table_storage(ds)
+    # the float tables are returned as they are stored
+    return decode(values, storage, scale, offset) if storage in AFFINE or storage == 'bfloat16' else values
+
+def encoding_error(table: np.ndarray, codes: np.ndarray, storage: str, scale: Optional[np.ndarray] = None,
+                   offset: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    the maximum and the sum of the absolute errors of each column of the decoded codes versus the float64 table,
+    and the number of values which are not NaN
+    """
+    table = np.asarray(table, dtype=np.float64).reshape(len(table), -1)
+    error = np.abs(decode(codes, storage, scale, offset).reshape(len(table), -1).astype(np.float64) - table)
+    valid = ~np.isnan(table)
+    error = np.where(valid, error, 0.)
+    return error.max(axis=0, initial=0.), error.sum(axis=0), valid.sum(axis=0)
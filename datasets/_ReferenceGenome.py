@@ -0,0 +1,352 @@
+import os
+import gzip
+import math
+import contextlib
+import h5py
+import logging
+import pathlib
+
+import numpy as np
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logging import Logger
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from ._BioDataset import BioDataset
+from mini_utils.bio import Chm
+from mini_utils import bio
+from mini_utils import h5io
+
+class ReferenceGenomeDataset(BioDataset):
+
+    """
+    ReferenceGenomeDataset downloads the reference genome FASTA and converts it once to a 2-bit packed store,
+    each chromosome is a raw file which is memory-mapped on reading :
+
+    \\{h5_path}
+    |- chr1.2bit         4 nucleotides per byte, the first nucleotide in the highest 2 bits
+    |- chr2.2bit
+    ....
+    |- ReferenceGenome.h5
+      \\- chr1
+       |- N_starts       runs of unknown nucleotides (N), which are packed as 'C' in the .2bit file
+       |- N_ends
+       ....
+
+    nucleotide codes follow bio.NUCLEOTIDE_ENUM, unknown nucleotides are returned as bio.NUCL_UNKNOWN.
+    All positions are 0-based, as START in the MAF files.
+
+    build_context_composition counts the N-gram contexts in every window, on the same grid as the bigWig summaries :
+    \\{h5_path}
+    |- ContextComposition.h5
+      \\- chr1
+       |- 10000_0        (windows, contexts) counts, the context names in the 'columns' attribute
+       |- 100000_0
+       ....
+    """
+
+    mirror = "https://hgdownload.soe.ucsc.edu/goldenPath/hg19/bigZips"
+
+    # positions encoded at once when counting contexts
+    slice_len = 1 << 22
+
+    def __init__(
+        self,
+        h5_path: Union[str, Path],
+        raw_path: Union[str, Path],
+        fasta_fname: str = "hg19.fa.gz",
+        chromosomes: Optional[List[str]] = None,
+        logger: Union[str, Logger] = logging.getLogger(),
+        force_download: bool = False,
+        rebuild_h5: bool = False,
+        dry_run: bool = False,
+        genome: Optional[bio.Genome] = None,
+    ) -> None:
+
+        self.dataset_name = "ReferenceGenome"
+        # the FASTA of the genome in config/datasets.yaml, the hg19 of the mirror otherwise
+        source = f"{self.mirror}/{fasta_fname}" if genome is None or genome.fasta is None else genome.fasta
+        fasta_fname = source.split('/')[-1]
+        self.source_list  = [ source ]
+
+        super().__init__(raw_path = raw_path, logger = logger, force_download = force_download, dry_run = dry_run, genome = genome)
+
+        self.h5_path    = Path(h5_path)
+        self.rebuild_h5 = rebuild_h5
+        self.chromosomes = self.genome.chroms if chromosomes is None else list(chromosomes)
+        self.summary_h5_fname = self.h5_path.joinpath(f"{self.dataset_name}.h5")
+
+        if self.dry_run:
+            missing = self.missing_chromosomes(fasta = self.raw_path.joinpath(fasta_fname))
+            self.logger.info(f"build plan: {len(missing)} of {len(self.chromosomes)} chromosomes to convert {missing}")
+        else:
+            self.build_h5(fasta = self.raw_path.joinpath(fasta_fname))
+
+        self._packed   = {}
+        self._N_runs   = {}
+        self.chrom_sizes = {}
+        if not os.path.isfile(self.summary_h5_fname):
+            return
+        # a dry run opens the chromosomes already converted
+        with h5py.File(self.summary_h5_fname, 'r') as h5fd:
+            for chr in self.chromosomes:
+                if chr in h5fd.keys():
+                    self.chrom_sizes[chr] = int(h5fd[chr].attrs[self.H5Attrs.LENGTH.value])
+                    self._N_runs[chr] = (h5fd[chr]['N_starts'][:], h5fd[chr]['N_ends'][:])
+                else:
+                    self.logger.warning(f"{chr} is not found in the reference genome")
+
+    def __getstate__(self):
+        # memory maps are re-opened lazily in worker processes
+        state = self.__dict__.copy()
+        state['_packed'] = {}
+        return state
+
+    def _2bit_fname(self, chr: str) -> Path:
+        return self.h5_path.joinpath(f"{chr}.2bit")
+
+    def _pack(self, codes: np.ndarray) -> np.ndarray:
+        codes = np.concatenate([codes & 3, np.zeros(-len(codes) % 4, dtype=np.uint8)])
+        return (codes[0::4] << 6) | (codes[1::4] << 4) | (codes[2::4] << 2) | codes[3::4]
+
+    def _write_chromosome(self, h5fd: h5py.File, chr: str, lines: List[bytes], key: str):
+        codes = bio.nucl2codes(b''.join(lines))
+        self.logger.info(f"{chr}, length {len(codes)}")
+
+        # write to a temporary file first, a partial .2bit file is never taken as built
+        tmp = self._2bit_fname(chr).with_suffix('.tmp')
+        self._pack(codes).tofile(tmp)
+        os.replace(tmp, self._2bit_fname(chr))
+
+        unknown = np.concatenate([[False], codes == bio.NUCL_UNKNOWN, [False]])
+        edges   = np.flatnonzero(np.diff(unknown.astype(np.int8)))
+        # the group is complete once moved in place with its checkpoint, see mini_utils.h5io
+        tmp = f".{chr}.tmp"
+        if tmp in h5fd:
+            del h5fd[tmp]
+        grp = h5fd.create_group(tmp)
+        grp.create_dataset('N_starts', data = edges[0::2].astype(np.int64))
+        grp.create_dataset('N_ends',   data = edges[1::2].astype(np.int64))
+        grp.attrs[self.H5Attrs.LENGTH.value] = len(codes)
+        if chr in h5fd:
+            del h5fd[chr]
+        h5fd.move(tmp, chr)
+        h5fd[chr].attrs[h5io.CHECKPOINT] = key
+        h5fd.flush()
+
+    def missing_chromosomes(self, fasta: Path) -> List[str]:
+        if not os.path.isfile(self.summary_h5_fname) or self.rebuild_h5:
+            return self.chromosomes
+        key = h5io.checkpoint_key(fasta = Path(fasta))
+        with h5py.File(self.summary_h5_fname, 'r') as h5fd:
+            return [ c for c in self.chromosomes if not h5io.is_complete(h5fd, c, key) or not os.path.isfile(self._2bit_fname(c)) ]
+
+    def build_h5(self, fasta: Path):
+        key = h5io.checkpoint_key(fasta = Path(fasta))
+        if os.path.isfile(self.summary_h5_fname) and not self.rebuild_h5:
+            # a corrupted file is moved aside
+            h5io.open_h5(self.summary_h5_fname, 'a', self.logger).close()
+        missing = self.missing_chromosomes(fasta)
+        if len(missing) == 0:
+            return
+
+        pathlib.Path.mkdir(self.h5_path, exist_ok=True, parents=True)
+        self.logger.info(f"convert {fasta} to 2-bit store, chromosomes: {missing}")
+
+        mode = 'w' if self.rebuild_h5 else 'a'
+        opener = gzip.open if fasta.suffix == '.gz' else open
+        with h5io.open_h5(self.summary_h5_fname, mode, self.logger) as h5fd, opener(fasta, 'rb') as fd:
+            chr, lines = None, []
+            for line in fd:
+                if line.startswith(b'>'):
+                    if chr in missing:
+                        self._write_chromosome(h5fd, chr, lines, key)
+                    chr, lines = line[1:].split()[0].decode(), []
+                elif chr in missing:
+                    lines.append(line.rstrip())
+            if chr in missing:
+                self._write_chromosome(h5fd, chr, lines, key)
+
+    def chrom_name(self, chr: Union[str, int, Chm]) -> str:
+        """
+        MAF files name chromosomes as '1', ..., 'X', the store as 'chr1', ..., 'chrX'
+        """
+        if isinstance(chr, Chm):
+            return chr.name
+        chr = str(chr)
+        return chr if chr.startswith('chr') else f"chr{chr}"
+
+    def _get_packed(self, chr: str) -> np.memmap:
+        if chr not in self._packed:
+            self._packed[chr] = np.memmap(self._2bit_fname(chr), dtype=np.uint8, mode='r')
+        return self._packed[chr]
+
+    def _fetch_positions(self, chr: str, positions: np.ndarray) -> np.ndarray:
+        codes = np.full(positions.shape, bio.NUCL_UNKNOWN, dtype=np.uint8)
+        if chr not in self.chrom_sizes:
+            return codes
+
+        valid = (positions >= 0) & (positions < self.chrom_sizes[chr])
+        pos   = positions[valid]
+        shift = (6 - 2 * (pos & 3)).astype(np.uint8)
+        values = (self._get_packed(chr)[pos >> 2] >> shift) & 3
+
+        N_starts, N_ends = self._N_runs[chr]
+        if len(N_starts) > 0:
+            run = np.searchsorted(N_starts, pos, side='right') - 1
+            values[(run >= 0) & (pos < N_ends[np.maximum(run, 0)])] = bio.NUCL_UNKNOWN
+        codes[valid] = values
+        return codes
+
+    def fetch(self, chr: Union[str, int, Chm], start: int, end: int) -> np.ndarray:
+        """
+        nucleotide codes of [start, end) in a chromosome
+        """
+        return self.fetch_batch([self.chrom_name(chr)], [start], end - start)[0]
+
+    def sequence(self, chr: Union[str, int, Chm], start: int, end: int) -> str:
+        return bio.codes2nucl(self.fetch(chr, start, end))
+
+    def fetch_batch(self, chrs, starts, length: int) -> np.ndarray:
+        """
+        nucleotide codes of [starts[i], starts[i] + length) for each i, as a (len(starts), length) array.
+        chrs are chromosome names or MAF chromosome numbers, positions out of the chromosome are unknown nucleotides.
+        """
+        starts = np.asarray(starts, dtype=np.int64).reshape(-1)
+        codes  = np.full((len(starts), length), bio.NUCL_UNKNOWN, dtype=np.uint8)
+        if len(starts) == 0:
+            return codes
+
+        chrs, inverse = np.unique(np.asarray(chrs).astype(str).reshape(-1), return_inverse=True)
+        offset = np.arange(length, dtype=np.int64)
+        for k, chr in enumerate(chrs):
+            sel = np.flatnonzero(inverse == k)
+            positions = (starts[sel].reshape(-1, 1) + offset).reshape(-1)
+            codes[sel] = self._fetch_positions(self.chrom_name(chr), positions).reshape(-1, length)
+        return codes
+
+    def contexts(self, chrs, positions, N: int, collapse: bool = False) -> np.ndarray:
+        """
+        encoded N-gram centered at each position, -1 if the context contains an unknown nucleotide
+        """
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1)
+        packed = bio.encode_N_gram(self.fetch_batch(chrs, positions - N // 2, N))
+        if collapse:
+            packed = bio.collapse_N_gram(packed, N)
+        return packed
+
+    def _h5_dataset_fullname(self, chr: str, rslt: int, overlap: int) -> str:
+        return f"{chr}/{rslt}_{overlap}"
+
+    def build_context_composition(
+        self,
+        resolutions: List[int],
+        overlap: int = 0,
+        N_grams: List[int] = [3, 5],
+        collapse: bool = True,
+        h5_chunk_size: int = 100,
+        concurrent: int = 0,
+        rebuild_h5: bool = False,
+    ) -> Path:
+        """
+        count the contexts of every position in each window, one chromosome per process.
+        Windows start every (resolution - overlap) bases as in BioBigWigDataset, a position is counted
+        if its whole context is known.
+        """
+        composition_h5_fname = self.h5_path.joinpath("ContextComposition.h5")
+        columns = [ name for n in N_grams for name in bio.N_gram_names(n, collapse) ]
+
+        # a (chromosome, resolution) table is complete if it was counted from the same 2-bit file, see mini_utils.h5io
+        def unit_key(chr, rslt):
+            return h5io.checkpoint_key(source = self._2bit_fname(chr), resolution = rslt, overlap = overlap, N_grams = N_grams, collapse = collapse)
+
+        with h5io.open_h5(composition_h5_fname, 'a', self.logger) as h5fd:
+            tasks = {}
+            for chr in self.chrom_sizes:
+                todo = [ rslt for rslt in resolutions
+                         if rebuild_h5 or not h5io.is_complete(h5fd, self._h5_dataset_fullname(chr, rslt, overlap), unit_key(chr, rslt)) ]
+                if len(todo) > 0:
+                    tasks[chr] = todo
+
+            self.logger.info(f"start counting contexts {N_grams} in windows: {tasks}")
+            args = [ (self, chr, todo, overlap, N_grams, collapse) for chr, todo in tasks.items() ]
+            with ProcessPoolExecutor(max_workers = concurrent) if concurrent > 1 else contextlib.nullcontext() as executor:
+                if executor is None:
+                    results = ( _count_window_contexts(*a) for a in args )
+                else:
+                    results = ( f.result() for f in as_completed([ executor.submit(_count_window_contexts, *a) for a in args ]) )
+
+                for chr, counts_dict in results:
+                    for rslt, counts in counts_dict.items():
+                        dataset_fullname = self._h5_dataset_fullname(chr, rslt, overlap)
+                        self.logger.debug(f"create dataset {dataset_fullname} in the h5 file")
+                        h5io.write_unit(h5fd, dataset_fullname, unit_key(chr, rslt), data = counts,
+                                        attrs = {self.H5Attrs.COLUMNS.value: columns},
+                                        chunks = (min(h5_chunk_size, counts.shape[0]), counts.shape[1]))
+            h5fd.attrs[self.H5Attrs.COLUMNS.value] = columns
+
+        return composition_h5_fname
+
+def _count_window_contexts(genome: ReferenceGenomeDataset,
+                           chr: str,
+                           resolutions: List[int],
+                           overlap: int,
+                           N_grams: List[int],
+                           collapse: bool
+    ) -> Tuple[str, Dict[int, np.ndarray]]:
+    """
+    positions are counted in blocks of gcd(step, resolution) bases. Without overlap the blocks are the
+    windows, otherwise the windows are the differences of the block counts cumulated in place. The counts
+    are int32, a count is at most the size of the chromosome
+    """
+    size = genome.chrom_sizes[chr]
+
+    # packed N-gram -> column in the composition table
+    luts, col_offset = {}, 0
+    for n in N_grams:
+        kept = np.unique(bio.collapse_N_gram(np.arange(4**n), n)) if collapse else np.arange(4**n)
+        lut  = np.full(4**n, -1, dtype=np.int64)
+        lut[kept] = col_offset + np.arange(len(kept))
+        luts[n] = lut
+        col_offset += len(kept)
+    K = col_offset
+
+    blocks = {}
+    for rslt in resolutions:
+        g = math.gcd(rslt - overlap, rslt)
+        # the first row stays 0 for the differences of the cumulated counts
+        blocks[rslt] = (g, np.zeros((math.ceil(size / g) + 1, K), dtype=np.int32))
+
+    half = max(N_grams) // 2
+    for a in range(0, size, genome.slice_len):
+        b = min(size, a + genome.slice_len)
+        codes = genome.fetch(chr, a - half, b + half)
+        positions = np.arange(a, b, dtype=np.int64)
+        for n in N_grams:
+            offset = half - n // 2
+            packed = bio.rolling_N_gram(codes[offset: offset + (b - a) + n - 1], n)
+            if collapse:
+                packed = bio.collapse_N_gram(packed, n)
+            known = packed >= 0
+            cols = luts[n][packed[known]]
+            for rslt, (g, block_counts) in blocks.items():
+                blk = positions[known] // g
+                if len(blk) == 0:
+                    continue
+                b0, b1 = blk[0], blk[-1] + 1
+                block_counts[b0 + 1: b1 + 1] += np.bincount((blk - b0) * K + cols, minlength = (b1 - b0) * K).reshape(-1, K)
+
+    counts_dict = {}
+    for rslt in list(blocks):
+        g, block_counts = blocks.pop(rslt)
+        if overlap == 0:
+            counts_dict[rslt] = block_counts[1:]
+            continue
+        cum = np.cumsum(block_counts, axis=0, out=block_counts)
+        starts = np.arange(0, size, rslt - overlap)
+        ends   = np.minimum((starts + rslt) // g, cum.shape[0] - 1)
+        counts_dict[rslt] = cum[ends] - cum[starts // g]
+        del cum, block_counts
+
+    return chr, counts_dict
@@ -8,6 +8,7 @@ from logging import Logger
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 from datasets import BioBigWigDataset
+from mini_utils.bio import Genome
 
 class ReplicationTimingDataset(BioBigWigDataset):
 
@@ -69,7 +70,11 @@ class ReplicationTimingDataset(BioBigWigDataset):
         design_cells: List[str] | str = 'all',
         preprocess: Optional[Callable] = None, 
         transform:  Optional[Callable] = None,
-        lazy_load:  bool = True
+        lazy_load:  bool = True,
+        concurrent: int = 0,
+        dry_run: bool = False,
+        genome: Optional[Genome] = None,
+        storage: str = 'float64'
     ) -> None:
         
         self.dataset_name = "ReplicationTiming"
@@ -92,32 +97,16 @@ class ReplicationTimingDataset(BioBigWigDataset):
                          rebuild_h5 = rebuild_h5,
                          preprocess = preprocess,
                          transform  = transform,
-                         lazy_load  = lazy_load)
+                         lazy_load  = lazy_load,
+                         concurrent = concurrent,
+                         dry_run    = dry_run,
+                         genome     = genome,
+                         storage    = storage)
 
 
-    def build_h5_summary(self):
-        mode = 'a'
-        if self.rebuild_h5:
-            mode = 'w'
-
-        h5fd_dict = {}
-        
-        for signal in self.design_signals:
-            for cell in self.design_cells:
-                h5 = self._h5_fname(self._bigwig_fname(cell, signal))
-                k  = self._bigwig_fname_key(cell, signal)
-                h5fd_dict[k] = h5py.File(h5, 'r')
-
-        self.logger.info(f"start building summary: {self.summary_h5_fname}")
-        with h5py.File(self.summary_h5_fname, mode=mode) as h5fd:
-            for rslt in self.resolutions:
-                dataset_name = self._dataset_name(rslt, self.overlap) 
-                for chr in self.Chm:
-                    if self.rebuild_h5 or chr.name not in h5fd.keys() or dataset_name not in h5fd[chr.name].keys() :
-                        self._concat_summary_table(h5fd, h5fd_dict, chr, rslt, self.overlap)
-
-        for k in h5fd_dict:
-            h5fd_dict[k].close()
+    def _summary_sources(self) -> Dict[str, Path]:
+        return { self._bigwig_fname_key(cell, signal): self._h5_fname(self._bigwig_fname(cell, signal))
+                 for signal in self.design_signals for cell in self.design_cells }
 
     def _bigwig_fname_key(self, cell: RepliSeqCell, signal: RepliSeqSignal, replicate: int = 1):
         return f"{cell.value}{signal.name}Rep{replicate}"
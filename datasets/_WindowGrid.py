@@ -0,0 +1,109 @@
+import h5py
+
+import numpy as np
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from mini_utils.bio import Chm, BigWigChromSizesDict
+
+
+class WindowGrid(object):
+
+    """
+    WindowGrid joins the tables built on the same genome windows by the index of the windows, without
+    decoding them to pandas. The windows of a chromosome start at 0 with the step rslt - overlap, as in
+    BioBigWigDataset._bigwig2df, and the table of a chromosome is the dataset {prefix}{chr}/{rslt}_{overlap},
+    with one row per window :
+
+    BioBigWigDataset summary     chr1/10000_0                 windows x features
+    ContextComposition.h5        chr1/10000_0                 windows x contexts
+    BioDigDriverfDataset summary Breast-AdenoCa/counts/chr1/10000_0   windows
+
+    The windows of all the chromosomes are numbered one after the other :
+
+    index    0 .......... n_chr1-1 | n_chr1 ....... n_chr1+n_chr2-1 | ...
+    window   chr1, 0 .... chr1, n_chr1-1 | chr2, 0 .... chr2, n_chr2-1 | ...
+    """
+
+    def __init__(self, resolution: int, overlap: int = 0, chrom_sizes: Optional[Dict[str, int]] = None) -> None:
+        if overlap >= resolution:
+            raise ValueError(f"overlap {overlap} should be smaller than the resolution {resolution}")
+
+        self.resolution = resolution
+        self.overlap = overlap
+        self.step = resolution - overlap
+
+        if chrom_sizes is None:
+            chrom_sizes = { chr.name: size for chr, size in BigWigChromSizesDict.items() }
+        self.chroms = list(chrom_sizes.keys())
+        self.chrom_sizes = np.array([ chrom_sizes[chr] for chr in self.chroms ], dtype=np.int64)
+
+        self.n_windows = -(-self.chrom_sizes // self.step)
+        self.offsets = np.concatenate([[0], np.cumsum(self.n_windows)])
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def dataset_name(self, chr: str) -> str:
+        return f"{chr}/{self.resolution}_{self.overlap}"
+
+    def window_starts(self, chr_size: int) -> np.ndarray:
+        return np.arange(0, chr_size, self.step)
+
+    def locate(self, indices) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        return the chromosome (index in self.chroms) and the row of the windows
+        """
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        if len(indices) > 0 and (indices.min() < 0 or indices.max() >= len(self)):
+            raise IndexError(f"window index out of range [0, {len(self)})")
+        chrom_idx = np.searchsorted(self.offsets, indices, side='right') - 1
+        return chrom_idx, indices - self.offsets[chrom_idx]
+
+    def positions(self, indices) -> np.ndarray:
+        """
+        return (chrom, start, end) of the windows, chrom is the value of Chm when the chromosome is in it
+        """
+        chrom_idx, rows = self.locate(indices)
+        chrom = np.array([ Chm[chr].value if chr in Chm.__members__ else -1 for chr in self.chroms ])[chrom_idx]
+        start = rows * self.step
+        end   = np.minimum(start + self.resolution, self.chrom_sizes[chrom_idx])
+        return np.stack([chrom, start, end], axis=1)
+
+    def read(self, h5fd: h5py.File, indices, prefix: str = '') -> np.ndarray:
+        """
+        read the rows of the windows from the tables {prefix}{chr}/{rslt}_{overlap}, in the order of indices.
+        The rows are read once per chromosome, a batch of neighbour windows is read as one slice.
+        """
+        chrom_idx, rows = self.locate(indices)
+        out = None
+        for c in np.unique(chrom_idx):
+            selected = np.flatnonzero(chrom_idx == c)
+            ds = h5fd[prefix + self.dataset_name(self.chroms[c])]
+            if ds.shape[0] != self.n_windows[c]:
+                raise ValueError(f"{ds.name} has {ds.shape[0]} rows, {self.n_windows[c]} windows expected")
+
+            # h5py point selections need increasing rows, and are slow compared to a slice
+            uniq, inverse = np.unique(rows[selected], return_inverse=True)
+            span = uniq[-1] - uniq[0] + 1
+            if span <= 2 * len(uniq) + (ds.chunks[0] if ds.chunks is not None else 0):
+                block = ds[uniq[0]: uniq[-1] + 1][uniq - uniq[0]]
+            else:
+                block = ds[uniq]
+
+            if out is None:
+                out = np.empty((len(chrom_idx),) + ds.shape[1:], dtype=ds.dtype)
+            out[selected] = block[inverse]
+
+        if out is None:
+            out = np.empty((0,), dtype=np.float64)
+        return out
+
+    @staticmethod
+    def columns(h5fd: h5py.File, dataset_name: str) -> List[str]:
+        # BioBigWigDataset summaries keep the columns on the file, ContextComposition.h5 on each dataset
+        attrs = h5fd[dataset_name].attrs
+        if 'columns' in attrs:
+            return list(attrs['columns'])
+        return list(h5fd.attrs['columns'])
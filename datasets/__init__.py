@@ -3,8 +3,15 @@ from ._BioDataset import BioDataset, BioBigWigDataset, BioMafDataset, BioDigDriv
 from ._Mappability import MappabilityDataset
 from ._ReplicationTiming import ReplicationTimingDataset
 from ._Epigenomics import RoadmapEpigenomicsDataset
+from ._ReferenceGenome import ReferenceGenomeDataset
+from ._WindowGrid import WindowGrid
+from ._FeatureStats import FeatureStats, load_stats, update_stats, write_stats
+from ._Quantization import STORAGES
+from ._FeatureProjection import PROJECTIONS, fit_projection, project_features, write_projection
 
 from ._PCAWG import PCAWGDataset
+from ._Dietlein import DietleinDataset
+from ._Megacohort import MegacohortDataset
 
 __all__ = (
     "BioDataset",
@@ -13,7 +20,13 @@ __all__ = (
     "MappabilityDataset",
     "ReplicationTimingDataset",
     "RoadmapEpigenomicsDataset", 
+    "ReferenceGenomeDataset",
+    "WindowGrid",
+    "FeatureStats", "load_stats", "update_stats", "write_stats",
+    "STORAGES",
+    "PROJECTIONS", "fit_projection", "project_features", "write_projection",
     "BioDigDriverfDataset", "PCAWGDataset",
+    "DietleinDataset", "MegacohortDataset",
 )
 
 # def __getattr__(name):
@@ -1,11 +1,7 @@
-from datasets import *
-from config import LogSingletonFactory, DatasetConfig
+import sys
 
-from run import build_datasets, build_datasets_test
+from run.cli import main
 
-logFactory = LogSingletonFactory()
-logger = logFactory.getLogger('development')
-datasetConfig = DatasetConfig()
-
-build_datasets(datasetConfig = datasetConfig, logger = logger)
-# build_datasets_test()
\ No newline at end of file
+# every node of the cluster runs the same command, with the same queue directory :
+# python main_cluster.py work --targets Epigenomics,PCAWG --queue /shared/queue/build-01 --jobs 16
+sys.exit(main(sys.argv[1:] if len(sys.argv) > 1 else ['work', '--targets', 'all']))
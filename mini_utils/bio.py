@@ -2,6 +2,8 @@ import itertools
 import numpy as np
 
 from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Optional, Union
 # from ._maths import quat2dec
 
 class Chm(Enum):
@@ -59,6 +61,86 @@ BigWigChromSizesDict = {
     # Chm(25): 16571,    # M
 }
 
+def chrom_name(chr) -> str:
+    """
+    'chr1' for Chm.chr1, 'chr1', '1' or 1, the MAF files name the chromosomes '1', ..., 'X'
+    """
+    if isinstance(chr, Chm):
+        return chr.name
+    chr = str(chr)
+    return chr if chr.startswith('chr') else f"chr{chr}"
+
+def read_chrom_sizes(fname: Union[str, Path]) -> Dict[str, int]:
+    """
+    the chromosome sizes of a chrom.sizes file (name<TAB>size per line) or of the header of a bigWig file
+    """
+    if Path(fname).suffix.lower() in ['.bigwig', '.bw']:
+        import bbi
+        return { k: int(v) for k, v in bbi.chromsizes(str(fname)).items() }
+    chrom_sizes = {}
+    with open(fname, 'r') as fd:
+        for line in fd:
+            fields = line.split()
+            if len(fields) >= 2 and not line.startswith('#'):
+                chrom_sizes[fields[0]] = int(fields[1])
+    return chrom_sizes
+
+class Genome(object):
+
+    """
+    the assembly and the chromosomes covered by the builds and the datasets, in the order of Chm. The names and
+    the codes of the chromosomes are those of Chm, their sizes depend on the assembly :
+
+    Genome()                                            hg19 chr1, ..., chrX, BigWigChromSizesDict
+    Genome(chromosomes = ['chr21'])                     a subset, for a quick build of a change
+    Genome('hg38', chrom_sizes = 'hg38.chrom.sizes')    the sizes of a chrom.sizes file
+    Genome('hg38', chrom_sizes = 'track.bigWig')        the sizes of the header of a bigWig file
+    Genome('hg38', chrom_sizes = ..., fasta = url)      the reference FASTA downloaded by ReferenceGenomeDataset
+
+    The chromosomes which are not in Chm (chrY, chrM, the alternative contigs) are left out.
+    """
+
+    def __init__(self,
+                 assembly: str = 'hg19',
+                 chrom_sizes: Union[None, str, Path, Dict[str, int]] = None,
+                 chromosomes: Optional[List[str]] = None,
+                 fasta: Optional[str] = None) -> None:
+        if chrom_sizes is None:
+            if assembly != 'hg19':
+                raise ValueError(f"the chromosome sizes of {assembly} should be given by a chrom.sizes or a bigWig file")
+            chrom_sizes = { chr.name: size for chr, size in BigWigChromSizesDict.items() }
+        elif not isinstance(chrom_sizes, dict):
+            chrom_sizes = read_chrom_sizes(chrom_sizes)
+
+        if chromosomes is None:
+            selected = [ chr.name for chr in Chm if chr.name in chrom_sizes ]
+        else:
+            selected = [ chrom_name(c) for c in chromosomes ]
+        unknown  = [ c for c in selected if c not in Chm.__members__ or c not in chrom_sizes ]
+        if len(unknown) > 0:
+            raise ValueError(f"chromosomes {unknown} are not in Chm or in the sizes of {assembly}")
+
+        self.assembly = assembly
+        self.fasta = fasta
+        self.chrom_sizes = { chr.name: int(chrom_sizes[chr.name]) for chr in Chm if chr.name in selected }
+        self.chroms = list(self.chrom_sizes.keys())
+
+    @property
+    def chms(self) -> List[Chm]:
+        return [ Chm[chr] for chr in self.chroms ]
+
+    def size(self, chr) -> int:
+        return self.chrom_sizes[chrom_name(chr)]
+
+    def __contains__(self, chr) -> bool:
+        return chrom_name(chr) in self.chrom_sizes
+
+    def __len__(self) -> int:
+        return len(self.chroms)
+
+    def __repr__(self) -> str:
+        return f"Genome({self.assembly}, {self.chroms})"
+
 class NUCLEOTIDE_ENUM(Enum):
     C = 0
     T = 1
@@ -86,8 +168,63 @@ BASE_SUBSTITUTION_CLASSES = {
 }
 
 class COHORT_CLASS(Enum):
-    # TODO
-    pass
+    """
+    leaf histologies of PCAWG (ICGC only), the other PCAWG subsets are unions of them, see PCAWG_COHORT_HIERARCHY
+    https://oncotree.mskcc.org/#/home
+    """
+    Biliary_AdenoCA  = 'Biliary-AdenoCA'
+    Bone_Cart        = 'Bone-Cart'
+    Bone_Epith       = 'Bone-Epith'
+    Bone_Osteosarc   = 'Bone-Osteosarc'
+    Breast_AdenoCa   = 'Breast-AdenoCa'
+    Breast_DCIS      = 'Breast-DCIS'
+    Breast_LobularCa = 'Breast-LobularCa'
+    CNS_Medullo      = 'CNS-Medullo'
+    CNS_PiloAstro    = 'CNS-PiloAstro'
+    Eso_AdenoCa      = 'Eso-AdenoCa'
+    Head_SCC         = 'Head-SCC'
+    Kidney_RCC       = 'Kidney-RCC'
+    Liver_HCC        = 'Liver-HCC'
+    Lymph_BNHL       = 'Lymph-BNHL'
+    Lymph_CLL        = 'Lymph-CLL'
+    Lymph_NOS        = 'Lymph-NOS'
+    Myeloid_AML      = 'Myeloid-AML'
+    Myeloid_MDS      = 'Myeloid-MDS'
+    Myeloid_MPN      = 'Myeloid-MPN'
+    Ovary_AdenoCA    = 'Ovary-AdenoCA'
+    Panc_AdenoCA     = 'Panc-AdenoCA'
+    Panc_Endocrine   = 'Panc-Endocrine'
+    Prost_AdenoCA    = 'Prost-AdenoCA'
+    Skin_Melanoma    = 'Skin-Melanoma'
+    Stomach_AdenoCA  = 'Stomach-AdenoCA'
+
+# PCAWG tumour type groups, restricted to the leaf histologies available in COHORT_CLASS
+PCAWG_COHORT_HIERARCHY = {
+    'Adenocarcinoma_tumors': ['Biliary-AdenoCA', 'Breast-AdenoCa', 'Eso-AdenoCa', 'Ovary-AdenoCA',
+                              'Panc-AdenoCA', 'Prost-AdenoCA', 'Stomach-AdenoCA'],
+    'Breast_tumors':         ['Breast-AdenoCa', 'Breast-DCIS', 'Breast-LobularCa'],
+    'Carcinoma_tumors':      ['Biliary-AdenoCA', 'Breast-AdenoCa', 'Breast-DCIS', 'Breast-LobularCa',
+                              'Eso-AdenoCa', 'Head-SCC', 'Kidney-RCC', 'Liver-HCC', 'Ovary-AdenoCA',
+                              'Panc-AdenoCA', 'Prost-AdenoCA', 'Stomach-AdenoCA'],
+    'CNS_tumors':            ['CNS-Medullo', 'CNS-PiloAstro'],
+    'Digestive_tract_tumors':['Biliary-AdenoCA', 'Eso-AdenoCa', 'Liver-HCC', 'Panc-AdenoCA',
+                              'Panc-Endocrine', 'Stomach-AdenoCA'],
+    'Female_reproductive_system_tumors': ['Breast-AdenoCa', 'Breast-DCIS', 'Breast-LobularCa', 'Ovary-AdenoCA'],
+    'Glioma_tumors':         ['CNS-PiloAstro'],
+    'Hematopoietic_tumors':  ['Lymph-BNHL', 'Lymph-CLL', 'Lymph-NOS', 'Myeloid-AML', 'Myeloid-MDS', 'Myeloid-MPN'],
+    'Kidney_tumors':         ['Kidney-RCC'],
+    'Lymph_tumors':          ['Lymph-BNHL', 'Lymph-CLL', 'Lymph-NOS'],
+    'Myeloid_tumors':        ['Myeloid-AML', 'Myeloid-MDS', 'Myeloid-MPN'],
+    'Sarcoma_tumors':        ['Bone-Cart', 'Bone-Epith', 'Bone-Osteosarc'],
+    'Squamous_tumors':       ['Head-SCC'],
+    'Pancan':                [ c.value for c in COHORT_CLASS ],
+}
+
+def cohort_leaves(cohort: str, hierarchy: dict = PCAWG_COHORT_HIERARCHY) -> list:
+    """
+    leaf cohorts of a cohort, a leaf is its own leaf
+    """
+    return list(hierarchy.get(cohort, [cohort]))
 
 class MUT_ANNOT(Enum):
     INDEL = 0
@@ -121,6 +258,148 @@ def build_N_gram_nucl_enum(N):
 
     return Enum(name, ngram_dict, type=int)
 
+# code for any byte which is not a nucleotide: 'N', '.', '-', ...
+NUCL_UNKNOWN = 4
+
+# the largest N-gram which still fits in an int32 code
+MAX_N_GRAM = 15
+
+# ASCII byte -> nucleotide code, in the NUCLEOTIDE_ENUM order, case insensitive
+NUCL_LUT = np.full(256, NUCL_UNKNOWN, dtype=np.uint8)
+for _n in NUCLEOTIDE_ENUM:
+    NUCL_LUT[ord(_n.name)] = _n.value
+    NUCL_LUT[ord(_n.name.lower())] = _n.value
+del _n
+
+def nucl2codes(seq) -> np.ndarray:
+    """
+    convert a nucleotide sequence (str, bytes or uint8 ASCII array) to an uint8 code array,
+    unknown nucleotides are coded as NUCL_UNKNOWN
+    """
+    if isinstance(seq, str):
+        seq = seq.encode('ascii')
+    if isinstance(seq, (bytes, bytearray)):
+        seq = np.frombuffer(seq, dtype=np.uint8)
+    return NUCL_LUT[np.asarray(seq, dtype=np.uint8)]
+
+def codes2nucl(codes) -> str:
+    alphabet = np.frombuffer(b'CTAGN', dtype=np.uint8)
+    return alphabet[np.asarray(codes, dtype=np.uint8)].tobytes().decode('ascii')
+
+def _check_N_gram(N: int):
+    if N < 1 or N > MAX_N_GRAM:
+        raise ValueError(f"N-gram size {N} is out of range [1, {MAX_N_GRAM}]")
+
+def encode_N_gram(codes: np.ndarray) -> np.ndarray:
+    """
+    pack the last axis of an uint8 code array of shape (..., N) into base-4 integers,
+    with the same value as build_N_gram_nucl_enum(N), for example :
+    TCG: [1, 0, 3] -> int("103", base = 4) = 19
+
+    contexts with an unknown nucleotide are encoded as -1
+    """
+    codes = np.asarray(codes, dtype=np.uint8)
+    N = codes.shape[-1]
+    _check_N_gram(N)
+    packed = np.zeros(codes.shape[:-1], dtype=np.int32)
+    for i in range(N):
+        packed <<= 2
+        packed |= codes[..., i] & 3
+    packed[(codes >= NUCL_UNKNOWN).any(axis=-1)] = -1
+    return packed
+
+def rolling_N_gram(codes: np.ndarray, N: int) -> np.ndarray:
+    """
+    encode every N-gram of a 1-d code array, the i-th value is the N-gram starting at codes[i].
+    It returns len(codes) - N + 1 values, -1 where the N-gram contains an unknown nucleotide.
+    """
+    _check_N_gram(N)
+    codes = np.asarray(codes, dtype=np.uint8)
+    L = codes.shape[0] - N + 1
+    if L <= 0:
+        return np.zeros(0, dtype=np.int32)
+    packed  = np.zeros(L, dtype=np.int32)
+    unknown = np.zeros(L, dtype=bool)
+    for i in range(N):
+        c = codes[i:i+L]
+        packed <<= 2
+        packed |= c & 3
+        unknown |= c >= NUCL_UNKNOWN
+    packed[unknown] = -1
+    return packed
+
+def revcomp_N_gram(packed: np.ndarray, N: int) -> np.ndarray:
+    """
+    reverse complement of packed N-grams. The complement of a code c is 3 - c, which gives the
+    pairing of build_N_gram_nucl_enum, for example :
+    TCG: int("103", base = 4) -> CGA: int("032", base = 4)
+    """
+    _check_N_gram(N)
+    packed = np.asarray(packed, dtype=np.int32)
+    rc = np.zeros_like(packed)
+    x  = packed.copy()
+    for _ in range(N):
+        rc <<= 2
+        rc |= 3 - (x & 3)
+        x >>= 2
+    rc[packed < 0] = -1
+    return rc
+
+def collapse_N_gram(packed: np.ndarray, N: int) -> np.ndarray:
+    """
+    collapse a N-gram and its reverse complement to the same code. For odd N, the strand with a
+    pyrimidine (C or T) at the center is kept, for even N the smaller code is kept.
+    """
+    packed = np.asarray(packed, dtype=np.int32)
+    rc = revcomp_N_gram(packed, N)
+    if N % 2 == 1:
+        center = (packed >> (2 * (N // 2))) & 3
+        return np.where(center < NUCLEOTIDE_ENUM.A.value, packed, rc)
+    return np.minimum(packed, rc)
+
+def encode_context_strings(contexts, N: int, collapse: bool = False) -> np.ndarray:
+    """
+    encode a column of context strings at once, the N-gram is taken at the center of each context.
+    Missing contexts ('.', empty, None or NaN) are encoded as -1.
+    """
+    _check_N_gram(N)
+    ctx = np.asarray(contexts) if isinstance(contexts, np.ndarray) else np.asarray(contexts, dtype=object)
+    if ctx.dtype.kind in 'fO':
+        # the NaN of a MAF column would be stringified to 'nan'
+        absent = np.frompyfunc(lambda c: c is None or c != c, 1, 1)(ctx).astype(bool)
+        ctx = np.where(absent, '.', ctx)
+    ctx = np.char.strip(np.asarray(ctx, dtype=bytes))
+    if ctx.size == 0:
+        return np.zeros(ctx.shape, dtype=np.int32)
+    lengths = np.char.str_len(ctx).reshape(-1)
+    missing = (lengths == 0) | (ctx.reshape(-1) == b'.')
+    if ((lengths < N) & ~missing).any():
+        err = ctx.reshape(-1)[(lengths < N) & ~missing][0].decode()
+        raise ValueError(f"length of context {err} is less than {N}")
+
+    width = ctx.dtype.itemsize
+    chars = np.frombuffer(ctx.tobytes(), dtype=np.uint8).reshape(-1, width)
+    start = np.where(missing, 0, (lengths - N) // 2)
+    if width < N:
+        chars = np.pad(chars, ((0, 0), (0, N - width)))
+    idx = start.reshape(-1, 1) + np.arange(N)
+    packed = encode_N_gram(NUCL_LUT[np.take_along_axis(chars, idx, axis=1)])
+    if collapse:
+        packed = collapse_N_gram(packed, N)
+    packed[missing] = -1
+    return packed.reshape(ctx.shape)
+
+def N_gram_names(N: int, collapse: bool = False) -> list:
+    """
+    return the N-gram strings in code order, only the kept strand if collapse
+    """
+    _check_N_gram(N)
+    codes = np.arange(4**N, dtype=np.int32)
+    if collapse:
+        codes = np.unique(collapse_N_gram(codes, N))
+    digits = (codes.reshape(-1, 1) >> (2 * np.arange(N)[::-1])) & 3
+    return [ codes2nucl(d) for d in digits ]
+
 @DeprecationWarning
 def build_N_ctx_mut_enum(name, N):
     """
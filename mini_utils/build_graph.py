@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import h5py
+import hashlib
+import logging
+
+from logging import Logger
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+# an output is a file, or a dataset/group in a h5 file
+Output = Union[str, Path, Tuple[Union[str, Path], str]]
+
+
+class BuildNode(object):
+
+    def __init__(self,
+                 name: str,
+                 fn: Optional[Callable] = None,
+                 deps: List[str] = [],
+                 params: Dict[str, Any] = {},
+                 sources: List[Union[str, Path]] = [],
+                 outputs: List[Output] = [],
+                 parallel: bool = True,
+                 resource: Optional[str] = None) -> None:
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.params = dict(params)
+        self.sources = [ Path(s) for s in sources ]
+        self.outputs = list(outputs)
+        # False for the nodes to run in the calling process
+        self.parallel = parallel
+        # the nodes sharing a resource never run at the same time, see resources
+        self.resource = resource
+
+    def resources(self) -> List[str]:
+        """
+        the resource of the node and the files of its outputs, a h5 file has one writer at a time
+        """
+        files = [ os.path.abspath(out[0] if isinstance(out, tuple) else out) for out in self.outputs ]
+        return sorted(set(files + ([] if self.resource is None else [self.resource])))
+
+    def outputs_exist(self) -> bool:
+        for out in self.outputs:
+            fname, key = (out[0], out[1]) if isinstance(out, tuple) else (out, None)
+            if not os.path.isfile(fname):
+                return False
+            if key is not None:
+                with h5py.File(fname, 'r') as h5fd:
+                    if key not in h5fd:
+                        return False
+        return True
+
+
+class BuildGraph(object):
+
+    """
+    BuildGraph is the DAG of the artifacts of a dataset : downloaded files, converted h5 files, summaries,
+    indices, count tensors. The fingerprint of a node is the hash of its parameters, the size and mtime of
+    its source files, and the fingerprints of its dependencies, the fingerprints of the built nodes are
+    kept in a JSON manifest. A node is built again only if :
+    - it was never built, or one of its outputs is missing
+    - its fingerprint changed (parameters, sources or dependencies)
+    - one of its dependencies is built in the same run
+    The nodes writing the same file, or sharing a resource, never run at the same time.
+
+    > graph = BuildGraph(h5_path.joinpath('Mappability.build.json'))
+    > graph.add('track:24mer:10000_0', fn = ..., params = {'resolution': 10000}, sources = [bigwig], outputs = [h5])
+    > graph.add('summary:10000_0', fn = ..., deps = ['track:24mer:10000_0'], outputs = [(summary_h5, 'chr1/10000_0')])
+    > graph.plan()
+    > graph.run(concurrent = 4)
+    """
+
+    FRESH   = 'fresh'
+    STALE   = 'stale'
+    MISSING = 'missing'
+
+    def __init__(self, manifest: Union[str, Path], logger: Union[str, Logger] = logging.getLogger()) -> None:
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.manifest = Path(manifest)
+        self.nodes: Dict[str, BuildNode] = {}
+        self.recorded: Dict[str, str] = {}
+        if os.path.isfile(self.manifest):
+            with open(self.manifest, 'r') as fd:
+                self.recorded = json.load(fd)
+
+    def add(self, name: str, fn: Optional[Callable] = None, **kwargs) -> str:
+        if name in self.nodes:
+            raise ValueError(f"build node {name} is defined twice")
+        self.nodes[name] = BuildNode(name, fn, **kwargs)
+        return name
+
+    def order(self) -> List[str]:
+        """
+        the nodes in topological order, in the order they are added when possible
+        """
+        order, state = [], {}
+        for root in self.nodes:
+            # depth first, with an explicit stack of (node, path to the node)
+            stack = [(root, [])]
+            while len(stack) > 0:
+                name, path = stack.pop()
+                if name not in self.nodes:
+                    raise ValueError(f"unknown build node {name}, required by {path[-1]}")
+                if state.get(name) == 'done':
+                    continue
+                if state.get(name) == 'visiting':
+                    state[name] = 'done'
+                    order.append(name)
+                    continue
+                state[name] = 'visiting'
+                stack.append((name, path))
+                for d in reversed(self.nodes[name].deps):
+                    if state.get(d) == 'visiting':
+                        raise ValueError(f"dependency cycle: {' -> '.join(path + [name, d])}")
+                    stack.append((d, path + [name]))
+        return order
+
+    def fingerprint(self, name: str, _cache: Optional[Dict[str, str]] = None) -> str:
+        _cache = {} if _cache is None else _cache
+        if name not in _cache:
+            node = self.nodes[name]
+            sources = []
+            for s in node.sources:
+                st = os.stat(s) if os.path.isfile(s) else None
+                sources.append([str(s), None if st is None else st.st_size, None if st is None else st.st_mtime_ns])
+            content = {'params': node.params,
+                       'sources': sources,
+                       'deps': [ self.fingerprint(d, _cache) for d in node.deps ]}
+            _cache[name] = hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+        return _cache[name]
+
+    def status(self, name: str, _cache: Optional[Dict[str, str]] = None) -> str:
+        if name not in self.recorded or not self.nodes[name].outputs_exist():
+            return self.MISSING
+        if self.recorded[name] != self.fingerprint(name, _cache):
+            return self.STALE
+        return self.FRESH
+
+    def plan(self, force: bool = False) -> List[Tuple[str, str]]:
+        """
+        return (node, status) in build order, the dependents of a node to build are stale
+        """
+        plan, todo, cache = [], set(), {}
+        for name in self.order():
+            status = self.status(name, cache)
+            if status == self.FRESH and (force or any([ d in todo for d in self.nodes[name].deps ])):
+                status = self.STALE
+            if status != self.FRESH:
+                todo.add(name)
+            plan.append((name, status))
+        return plan
+
+    def log_plan(self, plan: List[Tuple[str, str]]):
+        todo = [ (n, s) for n, s in plan if s != self.FRESH ]
+        self.logger.info(f"build plan: {len(todo)} of {len(plan)} nodes to build")
+        for name, status in todo:
+            self.logger.info(f"  {status:<8} {name}")
+
+    def record(self, name: str):
+        self.recorded[name] = self.fingerprint(name)
+        tmp = self.manifest.with_name(self.manifest.name + '.tmp')
+        self.manifest.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, 'w') as fd:
+            json.dump(self.recorded, fd, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest)
+
+    def run(self, force: bool = False, concurrent: int = 0) -> List[Dict]:
+        """
+        build the nodes of the plan, the parallel nodes in a process pool if concurrent > 1.
+        The dependents of a failed node are skipped. Return one record per node :
+        {'node', 'status': built|fresh|failed|skipped, 'result', 'seconds'}
+        """
+        plan = self.plan(force)
+        self.log_plan(plan)
+        todo = { n for n, s in plan if s != self.FRESH }
+
+        report, finished, failed = {}, set(), set()
+        pending = [ n for n, _ in plan ]
+        running = {}
+        busy = set()
+        executor = ProcessPoolExecutor(max_workers = concurrent) if concurrent > 1 else None
+
+        def done(name, status, result = None, seconds = 0.):
+            report[name] = {'node': name, 'status': status, 'result': result, 'seconds': seconds}
+            finished.add(name)
+            if status in ['failed', 'skipped']:
+                failed.add(name)
+            elif status == 'built':
+                self.record(name)
+
+        def call(name):
+            start = time.perf_counter()
+            try:
+                done(name, 'built', self.nodes[name].fn(), time.perf_counter() - start)
+            except Exception as e:
+                self.logger.error(f"build failed: {name}")
+                self.logger.error(e)
+                done(name, 'failed', None, time.perf_counter() - start)
+
+        try:
+            while len(pending) > 0 or len(running) > 0:
+                for name in list(pending):
+                    node = self.nodes[name]
+                    if not all([ d in finished for d in node.deps ]) or any([ r in busy for r in node.resources() ]):
+                        continue
+                    pending.remove(name)
+                    if any([ d in failed for d in node.deps ]):
+                        done(name, 'skipped')
+                    elif name not in todo or node.fn is None:
+                        done(name, 'fresh')
+                    elif executor is not None and node.parallel:
+                        running[executor.submit(node.fn)] = (name, time.perf_counter())
+                        busy.update(node.resources())
+                    else:
+                        call(name)
+
+                if len(running) > 0:
+                    completed, _ = wait(list(running.keys()), return_when = FIRST_COMPLETED)
+                    for future in completed:
+                        name, start = running.pop(future)
+                        busy.difference_update(self.nodes[name].resources())
+                        try:
+                            done(name, 'built', future.result(), time.perf_counter() - start)
+                        except Exception as e:
+                            self.logger.error(f"build failed: {name}")
+                            self.logger.error(e)
+                            done(name, 'failed', None, time.perf_counter() - start)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return [ report[n] for n, _ in plan ]
@@ -0,0 +1,117 @@
+"""
+crash-safe writes of the h5 build units, a (track, chromosome, resolution) dataset for instance :
+
+1. the unit is written to a temporary dataset {group}/.{name}.tmp
+2. the temporary dataset is moved to {group}/{name}, replacing the previous version, then the file is flushed
+3. the 'checkpoint' attribute of the dataset records the key of its inputs, the unit is complete
+   only if the attribute is present and matches the key of the current inputs
+
+A build interrupted during a unit leaves at most a temporary dataset, which is dropped on the next write,
+so the build resumes from the last complete unit. A h5 file which can't be opened anymore is moved aside.
+A unit built in its own file, by another node of a cluster, is copied in place with its checkpoint.
+"""
+
+import os
+import json
+import time
+import h5py
+import hashlib
+import logging
+
+from logging import Logger
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+
+CHECKPOINT = 'checkpoint'
+
+def checkpoint_key(**inputs) -> str:
+    """
+    hash of the inputs of a unit, the files are represented by their size and mtime
+    """
+    def _value(v):
+        if isinstance(v, Path):
+            st = os.stat(v) if os.path.isfile(v) else None
+            return [str(v), None if st is None else st.st_size, None if st is None else st.st_mtime_ns]
+        if isinstance(v, np.ndarray):
+            return v.tolist()
+        return v
+    content = { k: _value(v) for k, v in inputs.items() }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+def is_complete(h5fd: h5py.File, name: str, key: str) -> bool:
+    return name in h5fd and h5fd[name].attrs.get(CHECKPOINT) == key
+
+def _tmp_name(name: str) -> str:
+    parent, _, leaf = name.rpartition('/')
+    return f"{parent}/.{leaf}.tmp" if parent != '' else f".{leaf}.tmp"
+
+def create_staged(h5fd: h5py.File, name: str, **kwargs) -> h5py.Dataset:
+    """
+    create the temporary dataset of a unit, kwargs are passed to create_dataset
+    """
+    tmp = _tmp_name(name)
+    if tmp in h5fd:
+        del h5fd[tmp]
+    return h5fd.create_dataset(tmp, **kwargs)
+
+def commit_staged(h5fd: h5py.File, name: str, key: str, attrs: Dict[str, Any] = {}):
+    """
+    move the temporary dataset of a unit in place and mark it complete
+    """
+    tmp = _tmp_name(name)
+    for k, v in attrs.items():
+        h5fd[tmp].attrs[k] = v
+    if name in h5fd:
+        del h5fd[name]
+    h5fd.move(tmp, name)
+    h5fd[name].attrs[CHECKPOINT] = key
+    h5fd.flush()
+
+def write_unit(h5fd: h5py.File, name: str, key: str, data: np.ndarray, attrs: Dict[str, Any] = {}, **kwargs):
+    create_staged(h5fd, name, data = data, **kwargs)
+    commit_staged(h5fd, name, key, attrs)
+
+def adopt_unit(h5fd: h5py.File, src_fname: Union[str, Path], name: str, key: str) -> bool:
+    """
+    copy a unit built in another file, by another node of the cluster for instance, if it is complete there.
+    Return True if the unit is copied.
+    """
+    if not os.path.isfile(src_fname):
+        return False
+    with h5py.File(src_fname, 'r') as src_fd:
+        if not is_complete(src_fd, name, key):
+            return False
+        tmp = _tmp_name(name)
+        if tmp in h5fd:
+            del h5fd[tmp]
+        src_fd.copy(src_fd[name], h5fd, name = tmp)
+    commit_staged(h5fd, name, key)
+    return True
+
+def _readable(fname: Path) -> bool:
+    # a file opened or locked elsewhere is not corrupted
+    try:
+        h5py.File(fname, 'r').close()
+        return True
+    except OSError as e:
+        return 'lock' in str(e) or 'already open' in str(e)
+
+def open_h5(fname: Union[str, Path], mode: str = 'a', logger: Union[str, Logger] = logging.getLogger()) -> h5py.File:
+    """
+    open a h5 file to write, a file corrupted by an interrupted write is moved to {fname}.corrupt-{time}
+    and a new file is created
+    """
+    logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+    fname = Path(fname)
+    fname.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        return h5py.File(fname, mode)
+    except OSError as e:
+        if not os.path.isfile(fname) or mode not in ['a', 'r+'] or _readable(fname):
+            raise
+        quarantine = fname.with_name(f"{fname.name}.corrupt-{time.strftime('%Y%m%d%H%M%S')}")
+        logger.error(f"can't open {fname} ({e}), moved to {quarantine}")
+        os.replace(fname, quarantine)
+        return h5py.File(fname, mode)
@@ -0,0 +1,171 @@
+"""
+telemetry of the builds, one record per stage and unit of work :
+
+telemetry = Telemetry(logger)
+with telemetry.stage('bigwig2df', unit = 'Align24mer:chr1/10000_0') as record:
+    data_df = ...
+    record['rows'] = len(data_df)
+telemetry.report(h5_path.joinpath('Mappability.telemetry.json'))
+
+A record keeps the wall and CPU time of the stage, its rows, the bytes read and written by the process
+during the stage (/proc/self/io, the syscalls of the process and its threads, None on the systems without
+it, or given by the stage), the peak RSS of the stage and the peak RSS of the process. The peak of the stage
+is the high-water mark of the process reset at the start of the stage (/proc/self/clear_refs, Linux), the
+peak of the process since it started on the other systems.
+
+The records are appended as JSON lines to a sink file, so the stages run in the worker processes of a build
+are recorded too. report() reads them back, writes the JSON report of the build and logs the summary per stage.
+"""
+
+import os
+import json
+import time
+import logging
+import resource
+import tempfile
+
+from logging import Logger
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+def io_counters() -> Optional[Dict[str, int]]:
+    try:
+        with open('/proc/self/io', 'r') as fd:
+            counters = dict([ line.split(':') for line in fd.read().splitlines() ])
+        return {'read': int(counters['rchar']), 'written': int(counters['wchar'])}
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _peak_rss() -> Optional[int]:
+    # the high-water mark since the last reset, in bytes
+    try:
+        with open('/proc/self/status', 'r') as fd:
+            for line in fd:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+# the peak RSS of the processes, ru_maxrss is reset with the high-water mark on Linux
+_process_peaks = {}
+
+def _process_peak_rss() -> int:
+    # ru_maxrss is in kB on Linux, in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = max(peak if os.uname().sysname == 'Darwin' else peak * 1024, _peak_rss() or 0, _process_peaks.get(os.getpid(), 0))
+    _process_peaks[os.getpid()] = peak
+    return peak
+
+def _reset_peak_rss() -> bool:
+    _process_peak_rss()
+    # 5 resets the high-water mark VmHWM of the process to its current RSS
+    try:
+        with open('/proc/self/clear_refs', 'w') as fd:
+            fd.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class Telemetry(object):
+
+    def __init__(self, logger: Union[str, Logger] = logging.getLogger()) -> None:
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        # created by the first record, shared with the worker processes
+        self.sink = Path(tempfile.gettempdir()).joinpath(f"telemetry-{os.getpid()}-{time.time_ns()}.jsonl")
+        # the peaks of the stages open in the process, a nested stage resets the high-water mark of the enclosing ones
+        self._open_peaks = []
+
+    @contextmanager
+    def stage(self, stage: str, unit: Optional[str] = None, **counters) -> Iterator[Dict[str, Any]]:
+        """
+        record the stage, the counters (rows, bytes_read, bytes_written) can be set in the yielded record.
+        The failed stages are recorded with their error.
+        """
+        record = {'stage': stage, 'unit': unit, 'pid': os.getpid(), 'rows': None, 'bytes_read': None, 'bytes_written': None}
+        record.update(counters)
+        io, wall, cpu = io_counters(), time.perf_counter(), time.process_time()
+        if len(self._open_peaks) > 0:
+            self._open_peaks[-1] = max(self._open_peaks[-1], _peak_rss() or 0)
+        reset = _reset_peak_rss()
+        self._open_peaks.append(0)
+        try:
+            yield record
+        except Exception as e:
+            record['error'] = str(e)
+            raise
+        finally:
+            record['wall'] = time.perf_counter() - wall
+            record['cpu']  = time.process_time() - cpu
+            if io is not None:
+                end = io_counters()
+                record['bytes_read']    = end['read'] - io['read'] if record['bytes_read'] is None else record['bytes_read']
+                record['bytes_written'] = end['written'] - io['written'] if record['bytes_written'] is None else record['bytes_written']
+            record['rows_per_sec'] = None if record['rows'] is None or record['wall'] == 0 else record['rows'] / record['wall']
+            record['process_peak_rss'] = _process_peak_rss()
+            peak = max(self._open_peaks.pop(), _peak_rss() or 0)
+            record['peak_rss'] = peak if reset else record['process_peak_rss']
+            if len(self._open_peaks) > 0:
+                self._open_peaks[-1] = max(self._open_peaks[-1], peak)
+            self._emit(record)
+
+    def _emit(self, record: Dict[str, Any]):
+        # one write per line, the lines of the processes are not interleaved
+        with open(self.sink, 'a') as fd:
+            fd.write(json.dumps(record, default = str) + '\n')
+
+    def records(self) -> List[Dict[str, Any]]:
+        if not os.path.isfile(self.sink):
+            return []
+        with open(self.sink, 'r') as fd:
+            return [ json.loads(line) for line in fd if line.strip() != '' ]
+
+    @staticmethod
+    def summary(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        totals per stage, the wall time is the sum of the units, larger than the elapsed time of a parallel build
+        """
+        stages = {}
+        for r in records:
+            s = stages.setdefault(r['stage'], {'units': 0, 'errors': 0, 'wall': 0., 'cpu': 0., 'rows': 0,
+                                               'bytes_read': 0, 'bytes_written': 0, 'peak_rss': 0})
+            s['units']  += 1
+            s['errors'] += 'error' in r
+            s['wall']   += r['wall']
+            s['cpu']    += r['cpu']
+            for k in ['rows', 'bytes_read', 'bytes_written']:
+                s[k] += r[k] or 0
+            s['peak_rss'] = max(s['peak_rss'], r['peak_rss'])
+        for s in stages.values():
+            s['rows_per_sec']  = s['rows'] / s['wall'] if s['wall'] > 0 else None
+            s['mb_per_sec']    = (s['bytes_read'] + s['bytes_written']) / s['wall'] / 2**20 if s['wall'] > 0 else None
+        return stages
+
+    def log_summary(self, stages: Dict[str, Dict[str, Any]]):
+        self.logger.info(f"{'stage':<16} {'units':>6} {'wall s':>9} {'cpu s':>9} {'rows':>11} {'rows/s':>11} "
+                         f"{'read MB':>9} {'write MB':>9} {'peak RSS MB':>11}")
+        for name, s in stages.items():
+            self.logger.info(f"{name:<16} {s['units']:>6} {s['wall']:>9.2f} {s['cpu']:>9.2f} {s['rows']:>11} "
+                             f"{s['rows_per_sec'] or 0:>11.0f} {s['bytes_read'] / 2**20:>9.1f} {s['bytes_written'] / 2**20:>9.1f} "
+                             f"{s['peak_rss'] / 2**20:>11.1f}")
+
+    def report(self, fname: Union[str, Path], **meta) -> Dict[str, Dict[str, Any]]:
+        """
+        write the JSON report {meta, summary, records} of the stages recorded so far, log the summary,
+        and start a new sink
+        """
+        records = self.records()
+        stages  = self.summary(records)
+        fname = Path(fname)
+        fname.parent.mkdir(parents = True, exist_ok = True)
+        tmp = fname.with_name(fname.name + '.tmp')
+        with open(tmp, 'w') as fd:
+            json.dump({'meta': meta, 'summary': stages, 'records': records}, fd, indent = 1, default = str)
+        os.replace(tmp, fname)
+        if os.path.isfile(self.sink):
+            os.remove(self.sink)
+        self.log_summary(stages)
+        self.logger.info(f"telemetry report: {fname}")
+        return stages
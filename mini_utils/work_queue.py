@@ -0,0 +1,255 @@
+"""
+task queue on a shared file system, the nodes of a cluster claim the tasks of one build without a scheduler
+service. The queue is a directory :
+
+{root}/tasks/{id}.json     the task {name, payload, deps}, written once, by the first node submitting it
+{root}/leases/{id}         the lease of the worker running the task
+{root}/done/{id}.json      the result of the task
+{root}/failed/{id}.json    the error of the task
+
+A task is claimed by creating its lease file exclusively, only when the tasks it depends on are done. The
+running worker renews the lease (mtime of the file) in a thread. A lease which is not renewed for
+lease_seconds belongs to a dead worker, it is broken under an exclusive guard file {root}/leases/{id}.breaking
+and the task is claimed again : the tasks should be idempotent, their outputs written to a temporary file first. The clocks of the nodes are compared to the
+mtime set by the file server, they should be synchronised well below lease_seconds.
+
+A final merge step is a task depending on all the others.
+"""
+
+import os
+import re
+import json
+import time
+import socket
+import hashlib
+import logging
+import threading
+
+from logging import Logger
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+
+class WorkQueue(object):
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE    = 'done'
+    FAILED  = 'failed'
+
+    def __init__(self,
+                 root: Union[str, Path],
+                 lease_seconds: float = 600.,
+                 worker: Optional[str] = None,
+                 logger: Union[str, Logger] = logging.getLogger()) -> None:
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.root = Path(root)
+        self.lease_seconds = lease_seconds
+        self.worker = f"{socket.gethostname()}-{os.getpid()}" if worker is None else worker
+        for sub in ['tasks', 'leases', 'done', 'failed']:
+            self.root.joinpath(sub).mkdir(parents = True, exist_ok = True)
+        # the tasks are never modified once submitted
+        self._tasks: Dict[str, Dict] = {}
+
+    def task_id(self, name: str) -> str:
+        # a file name, unique for the name
+        return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)[:100]}-{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+
+    def _path(self, sub: str, name: str) -> Path:
+        return self.root.joinpath(sub, self.task_id(name) + ('' if sub == 'leases' else '.json'))
+
+    def _write(self, fname: Path, content: Dict, exclusive: bool = False) -> bool:
+        tmp = fname.with_name(f".{fname.name}.{self.worker}.tmp")
+        with open(tmp, 'w') as fd:
+            json.dump(content, fd, default = str)
+        try:
+            if exclusive:
+                # link fails if the file exists, also on NFS
+                os.link(tmp, fname)
+            else:
+                os.replace(tmp, fname)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+
+    def submit(self, name: str, payload: Dict[str, Any] = {}, deps: List[str] = []) -> bool:
+        """
+        add a task, unless it is already in the queue. Return True if the task is added.
+        """
+        return self._write(self._path('tasks', name), {'name': name, 'payload': payload, 'deps': list(deps)}, exclusive = True)
+
+    def tasks(self) -> Dict[str, Dict]:
+        for fname in sorted(os.listdir(self.root.joinpath('tasks'))):
+            if fname.endswith('.json') and not fname.startswith('.') and fname not in self._tasks:
+                with open(self.root.joinpath('tasks', fname), 'r') as fd:
+                    self._tasks[fname] = json.load(fd)
+        return { t['name']: t for t in self._tasks.values() }
+
+    def status(self, name: str) -> str:
+        if os.path.isfile(self._path('done', name)):
+            return self.DONE
+        if os.path.isfile(self._path('failed', name)):
+            return self.FAILED
+        if os.path.isfile(self._path('leases', name)):
+            return self.RUNNING
+        return self.PENDING
+
+    def result(self, name: str) -> Any:
+        with open(self._path('done', name), 'r') as fd:
+            return json.load(fd)['result']
+
+    def _lease_expired(self, lease: Path) -> Optional[str]:
+        # the owner of an expired lease
+        try:
+            if time.time() - os.stat(lease).st_mtime < self.lease_seconds:
+                return None
+            return lease.read_text()
+        except FileNotFoundError:
+            return None
+
+    def _break_lease(self, name: str, owner: str) -> bool:
+        """
+        remove the expired lease of owner, the lease is read again under the guard file {id}.breaking, created
+        exclusively, so that a lease renewed or claimed again in the meantime is never removed. Return True if
+        the lease is broken.
+        """
+        lease = self._path('leases', name)
+        guard = lease.with_name(f"{lease.name}.breaking")
+        try:
+            fd = os.open(guard, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # broken by another worker, or a guard left by a dead one
+            try:
+                if time.time() - os.stat(guard).st_mtime >= self.lease_seconds:
+                    os.remove(guard)
+            except FileNotFoundError:
+                pass
+            return False
+        with os.fdopen(fd, 'w') as g:
+            g.write(self.worker)
+        try:
+            # renew only touches the lease, a renewal is seen on its mtime
+            if self._lease_expired(lease) != owner:
+                return False
+            os.remove(lease)
+            self.logger.warning(f"lease of {name} by {owner} expired")
+            return True
+        except FileNotFoundError:
+            return False
+        finally:
+            os.remove(guard)
+
+    def claim(self) -> Optional[Dict]:
+        """
+        lease the first pending task whose dependencies are done
+        """
+        for name, task in self.tasks().items():
+            status = self.status(name)
+            if status == self.RUNNING:
+                owner = self._lease_expired(self._path('leases', name))
+                if owner is None or not self._break_lease(name, owner):
+                    continue
+            elif status != self.PENDING:
+                continue
+            if not all([ self.status(d) == self.DONE for d in task['deps'] ]):
+                continue
+            try:
+                fd = os.open(self._path('leases', name), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, 'w') as lease:
+                lease.write(self.worker)
+            # done between the status and the lease
+            if self.status(name) != self.RUNNING:
+                self.release(name)
+                continue
+            return task
+        return None
+
+    def renew(self, name: str):
+        os.utime(self._path('leases', name))
+
+    def release(self, name: str):
+        lease = self._path('leases', name)
+        if os.path.isfile(lease) and lease.read_text() == self.worker:
+            os.remove(lease)
+
+    def complete(self, name: str, result: Any = None):
+        self._write(self._path('done', name), {'name': name, 'worker': self.worker, 'result': result})
+        self.release(name)
+
+    def fail(self, name: str, error: str):
+        self._write(self._path('failed', name), {'name': name, 'worker': self.worker, 'error': error})
+        self.release(name)
+
+    def blocked(self) -> List[str]:
+        """
+        the pending tasks which can't run since a task they depend on failed
+        """
+        tasks = self.tasks()
+        blocked = set()
+        changed = True
+        while changed:
+            changed = False
+            for name, task in tasks.items():
+                if name in blocked or self.status(name) in [self.DONE, self.FAILED]:
+                    continue
+                if any([ d in blocked or self.status(d) == self.FAILED for d in task['deps'] ]):
+                    blocked.add(name)
+                    changed = True
+        return sorted(blocked)
+
+    def finished(self) -> bool:
+        blocked = set(self.blocked())
+        return all([ n in blocked or self.status(n) in [self.DONE, self.FAILED] for n in self.tasks() ])
+
+    def _heartbeat(self, name: str, stop: threading.Event):
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                owner = self._path('leases', name).read_text()
+                if owner != self.worker:
+                    self.logger.error(f"lost the lease of {name}, claimed again by {owner}")
+                    return
+                self.renew(name)
+            except FileNotFoundError:
+                # missing for a moment, renewed at the next tick
+                self.logger.warning(f"lease of {name} not found, retried")
+
+    def run(self, execute: Callable[[str, Dict], Any], poll: float = 5.) -> Dict[str, List[str]]:
+        """
+        claim and execute the tasks, execute(name, payload) returns a JSON result, until every task is done,
+        failed or blocked by a failed task. Return the names of the tasks run by this worker by status.
+        """
+        report = {self.DONE: [], self.FAILED: []}
+        while True:
+            task = self.claim()
+            if task is None:
+                if self.finished():
+                    return report
+                time.sleep(poll)
+                continue
+
+            name = task['name']
+            self.logger.info(f"{self.worker} runs {name}")
+            stop = threading.Event()
+            heartbeat = threading.Thread(target = self._heartbeat, args = (name, stop), daemon = True)
+            heartbeat.start()
+            try:
+                result, error = execute(name, task['payload']), None
+            except Exception as e:
+                self.logger.error(f"task failed: {name}")
+                self.logger.error(e)
+                result, error = None, str(e)
+            finally:
+                stop.set()
+                heartbeat.join()
+
+            if error is None:
+                self.complete(name, result)
+                report[self.DONE].append(name)
+            else:
+                self.fail(name, error)
+                report[self.FAILED].append(name)
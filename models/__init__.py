@@ -1,10 +1,11 @@
-import attentions
-import encoding
-import nets
+from . import attentions
+from . import encoding
+from . import gp
+from . import nets
 
 __all__ = (
     'attentions',
     'encoding',
+    'gp',
     'nets'
 )
-
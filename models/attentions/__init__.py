@@ -0,0 +1,6 @@
+from .channel import ChannelAttention, channel_groups
+
+__all__ = (
+    'ChannelAttention',
+    'channel_groups',
+)
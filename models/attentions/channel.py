@@ -1,2 +1,88 @@
-# wavelet channel attention 
-# https://arxiv.org/pdf/2211.02695
\ No newline at end of file
+# channel attention of the feature tracks, squeeze-excitation
+# https://arxiv.org/abs/1709.01507
+# wavelet channel attention
+# https://arxiv.org/pdf/2211.02695
+
+import torch
+from torch import nn
+from typing import List, Optional, Sequence
+
+def channel_groups(columns: Sequence[str], names: Sequence[str]) -> torch.Tensor:
+    """
+    the group of each column, the index of the first name found in it (the modification of an Epigenomics
+    track, DNase or H3K27ac for instance), len(names) for the columns of no group
+    """
+    return torch.tensor([ next((g for g, n in enumerate(names) if n in c), len(names)) for c in columns ], dtype = torch.int64)
+
+
+class ChannelAttention(nn.Module):
+
+    """
+    ChannelAttention weights the channels (the feature tracks) of the windows by a gate in (0, 1) learned from
+    the mean of each channel over the windows, as squeeze-excitation does :
+
+    attention = ChannelAttention(735, reduction = 16)
+    y = attention(x)            x, y : (batch, window, channels) or (batch, channels)
+
+    With groups, the channels of a group (the tracks of a modification) share their gate, the squeeze is the mean
+    over the windows and the channels of the group, and the excitation learns n_groups gates :
+
+    attention = ChannelAttention(735, groups = channel_groups(columns, ['DNase', 'H3K27ac', ...]))
+
+    The gates are computed on (batch, channels) or (batch, groups) and broadcast over the windows, the only
+    tensor of the size of x is the output.
+    """
+
+    def __init__(self,
+                 channels: int,
+                 reduction: int = 16,
+                 groups: Optional[torch.Tensor] = None,
+                 min_hidden: int = 4
+        ) -> None:
+
+        super().__init__()
+        self.channels = channels
+
+        if groups is not None:
+            groups = torch.as_tensor(groups, dtype = torch.int64)
+            if groups.shape != (channels,):
+                raise ValueError(f"{groups.shape[0]} groups given for {channels} channels")
+            n_groups = int(groups.max()) + 1
+            counts = torch.bincount(groups, minlength = n_groups).clamp(min = 1)
+            self.register_buffer('groups', groups)
+            self.register_buffer('group_sizes', counts.float())
+        else:
+            n_groups = channels
+            self.register_buffer('groups', None)
+            self.register_buffer('group_sizes', None)
+        self.n_groups = n_groups
+
+        hidden = max(min_hidden, n_groups // reduction)
+        self.excitation = nn.Sequential(nn.Linear(n_groups, hidden), nn.ReLU(), nn.Linear(hidden, n_groups), nn.Sigmoid())
+
+    def squeeze(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        the means (batch, n_groups) over the windows, and over the channels of each group
+        """
+        s = x.mean(dim = 1) if x.dim() == 3 else x
+        if self.groups is None:
+            return s
+        return s.new_zeros(s.shape[0], self.n_groups).index_add_(1, self.groups, s).div_(self.group_sizes)
+
+    def gates(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        the gates (batch, channels) of the channels
+        """
+        g = self.excitation(self.squeeze(x))
+        return g.index_select(1, self.groups) if self.groups is not None else g
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        g = self.gates(x)
+        return x * (g.unsqueeze(1) if x.dim() == 3 else g)
+
+    def group_weights(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        the gates (batch, n_groups) of the groups, or of the channels without groups, to inspect which tracks matter
+        """
+        with torch.no_grad():
+            return self.excitation(self.squeeze(x))
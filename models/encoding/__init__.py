@@ -0,0 +1,9 @@
+from .positional_encoding import GenomicPositionalEncoding, GenomicLinearPositionalEncoding, \
+                                 TrigonometricPositionalEncoding, RelativePositionalEncoding
+
+__all__ = (
+    'GenomicPositionalEncoding',
+    'GenomicLinearPositionalEncoding',
+    'TrigonometricPositionalEncoding',
+    'RelativePositionalEncoding',
+)
@@ -1,35 +1,57 @@
-import numpy as np
-from typing import Any, Callable, Dict, List, Optional, Tuple, Union
-
-from numpy.core.multiarray import array as array
-import torch 
+import torch
 from torch import nn
 from abc import abstractmethod
+from typing import Dict, List, Optional, Union
+
+from datasets import WindowGrid
+from mini_utils.bio import Genome
 
 class GenomicPositionalEncoding(nn.Module):
 
-    def __init__(self, 
-                 d_model: Union[int, List[int], Tuple[int], np.array, torch.Tensor, Dict[str,int]], 
-                 dropout: float = -1., 
-                 length: int = 100
+    """
+    GenomicPositionalEncoding encodes the positions of the windows at several resolutions. The table of each
+    resolution is computed once, when the module is built, and kept as a buffer of the module, so that an
+    encoding is a gather of the rows of the windows :
+
+    pe = TrigonometricPositionalEncoding(d_model = {10000: 16, 100000: 8}, resolutions = [10000, 100000])
+    x = pe(chroms, starts)                      (..., 24), the encodings of every resolution side by side
+    x = pe.encode(chroms, starts, 100000)       (..., 8)
+
+    chroms are the indices of the chromosomes in genome.chroms and starts the positions (bp) in the chromosomes,
+    the windows are those of WindowGrid. d_model is the size of the encodings, an int for every resolution, a list
+    in the order of resolutions or a dict by resolution.
+    """
+
+    def __init__(self,
+                 d_model: Union[int, List[int], Dict[int, int]],
+                 resolutions: List[int] = [10000],
+                 dropout: float = -1.,
+                 length: int = 100,
+                 overlap: int = 0,
+                 genome: Optional[Genome] = None
         ) -> None:
 
         super().__init__()
 
-        # there is no odd number in d_model
-        assert sum(self._is_odd(d_model)) == 0
-
-        self.d_model= d_model
+        if isinstance(d_model, int):
+            d_model = [d_model] * len(resolutions)
+        elif isinstance(d_model, dict):
+            d_model = [ d_model[r] for r in resolutions ]
+        if len(d_model) != len(resolutions):
+            raise ValueError(f"{len(d_model)} sizes of encoding for {len(resolutions)} resolutions")
+        if any([ d % 2 == 1 for d in d_model ]):
+            raise ValueError(f"the sizes of encoding {d_model} should be even")
+
+        self.d_model = list(d_model)
+        self.resolutions = list(resolutions)
         self.length = length
+        self.genome = Genome() if genome is None else genome
+        self.grids = [ WindowGrid(r, overlap, self.genome.chrom_sizes) for r in self.resolutions ]
 
-        if type(d_model) is int :
-            _d_model = torch.Tensor([d_model])
-        elif type(d_model) is Dict :
-            _d_model = torch.Tensor([d_model[k] for k in d_model])
-        else:
-            _d_model = torch.Tensor(d_model)
-
-        self._d_model= _d_model
+        for i, (grid, d) in enumerate(zip(self.grids, self.d_model)):
+            # derived from the parameters, not saved with the model
+            self.register_buffer(f"table_{i}", self._table(grid, d), persistent = False)
+            self.register_buffer(f"offsets_{i}", torch.as_tensor(grid.offsets[:-1], dtype = torch.int64), persistent = False)
 
         # initialize dropout
         if dropout > 0:
@@ -37,73 +59,105 @@ class GenomicPositionalEncoding(nn.Module):
         else:
             self.dropout = None
 
-    def _is_even(self, num: Union[List[int], Tuple[int], np.array[int], torch.Tensor[int]]) -> torch.Tensor:
-        if type(num) is Dict:
-            num = [ num[k] for k in num ]
-        return (torch.Tensor(num) & 1) == 0
-
-    def _is_odd(self,  num: Union[List[int], Tuple[int], np.array[int], torch.Tensor[int]]) -> torch.Tensor:
-        return self._is_even(num) == False
+    @property
+    def dim(self) -> int:
+        return sum(self.d_model)
 
     @abstractmethod
-    def get_position_encoding(self, t: Union[List[int], np.array[int], torch.Tensor[int]]) -> torch.Tensor:
+    def _table(self, grid: WindowGrid, d: int) -> torch.Tensor:
+        """
+        the encodings of the rows looked up by _rows, (rows, d)
+        """
         raise NotImplementedError
 
+    def _rows(self, chroms: torch.Tensor, starts: torch.Tensor, i: int) -> torch.Tensor:
+        # the windows of a chromosome share the table, its rows are the windows of the largest chromosome
+        return torch.div(starts, self.grids[i].step, rounding_mode = 'floor')
+
+    def _angles(self, t: torch.Tensor, d: int, total_progression: int, n: Optional[int] = None) -> torch.Tensor:
+        # t / total_progression^(2k/d), k = 0 ... n-1, positions x n
+        k = torch.arange(d if n is None else n, dtype = torch.float64)
+        return torch.outer(t.to(torch.float64), torch.pow(float(total_progression), -2 * k / d))
+
+    def encode(self, chroms: torch.Tensor, starts: torch.Tensor, resolution: int, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        the encodings (..., d) of the windows at one resolution, written to out when it is given
+        """
+        i = self.resolutions.index(resolution)
+        table = getattr(self, f"table_{i}")
+        rows = self._rows(chroms.reshape(-1), starts.reshape(-1), i)
+        if out is None:
+            return table.index_select(0, rows).view(*starts.shape, table.shape[1])
+        torch.index_select(table, 0, rows, out = out.view(-1, table.shape[1]))
+        return out
+
+    def forward(self, chroms: torch.Tensor, starts: torch.Tensor, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        the encodings (..., sum(d_model)) of the windows at every resolution, gathered into the columns of one output
+        """
+        if out is None:
+            out = torch.empty(*starts.shape, self.dim, dtype = self.table_0.dtype, device = self.table_0.device)
+        flat_chroms, flat_starts, flat_out = chroms.reshape(-1), starts.reshape(-1), out.view(-1, self.dim)
+        column = 0
+        for i, d in enumerate(self.d_model):
+            table = getattr(self, f"table_{i}")
+            torch.index_select(table, 0, self._rows(flat_chroms, flat_starts, i), out = flat_out[:, column: column + d])
+            column += d
+        return self.dropout(out) if self.dropout is not None else out
+
 class GenomicLinearPositionalEncoding(GenomicPositionalEncoding):
-    def __init__(self, 
-                 d_model: Union[List[int], Tuple[int], np.array[int], torch.Tensor[int], Dict[str,int]], 
-                 dropout: float = -1, 
+
+    """
+    the angles t / total_progression^(2k/d) of the window t of its chromosome, k = 0 ... d-1
+    """
+
+    def __init__(self,
+                 d_model: Union[int, List[int], Dict[int, int]],
+                 resolutions: List[int] = [10000],
+                 dropout: float = -1,
                  length: int = 100,
-                 total_progression: int = 10000, 
+                 total_progression: int = 10000,
+                 overlap: int = 0,
+                 genome: Optional[Genome] = None
         ) -> None:
 
-        super().__init__(d_model, dropout, length)
         self.total_progression = total_progression
+        super().__init__(d_model, resolutions, dropout, length, overlap, genome)
 
-    def _lin_pos_formula(self, 
-                         d: int,
-                         t:Union[List[int], np.array[int], torch.Tensor[int]], 
-                         k:Union[List[int], np.array[int], torch.Tensor[int]], 
-                         total_progression:int = 10000
-        ) -> torch.Tensor[float]:
-
-        t = torch.Tensor(t)
-        k = torch.Tensor(k)
-        return t/torch.pow(total_progression, 2*k/d)
-    
-    def get_position_encoding(self, t:  Union[List[int], np.array[int], torch.Tensor[int]]) -> torch.Tensor:
-        pe = [ self._lin_pos_formula(d, t, torch.arange(d).unsqueeze(0).view(-1,1) * torch.ones((d,t.shape[-1]))) for d in self._d_model ]
+    def _table(self, grid: WindowGrid, d: int) -> torch.Tensor:
+        t = torch.arange(int(grid.n_windows.max()))
+        return self._angles(t, d, self.total_progression).float()
 
 class TrigonometricPositionalEncoding(GenomicLinearPositionalEncoding):
-    def __init__(self, 
-                 d_model: Union[int, List[int], Tuple[int], np.array[int], torch.Tensor[int], Dict[str,int]], 
-                 dropout: float = -1, 
-                 length: int = 100, 
-                 total_progression: int = 10000, 
-        ) -> None:
 
-        super().__init__(d_model, dropout, length, total_progression)
-
-    def _tri_pos_formula(self, 
-                         t: Union[int, List[int], np.array[int], torch.Tensor[int]],
-                         k: Union[int, List[int], np.array[int], torch.Tensor[int]]
-        ) -> np.array[float]:
+    """
+    sin and cos of the angles of the window t of its chromosome, on the even and odd dimensions
+    """
 
+    def _trigonometric(self, t: torch.Tensor, d: int) -> torch.Tensor:
         # https://kazemnejad.com/blog/transformer_architecture_positional_encoding/
-        pe = np.zeros((self.dmodel,self.chr_len))
-        pe[0::2,:] = np.sin(self._lin_pos_formula(t, k[0::2, :]))
-        pe[1::2,:] = np.cos(self._lin_pos_formula(t, k[1::2, :]))
-        return pe
+        angles = self._angles(t, d, self.total_progression, d // 2)
+        pe = torch.empty(len(t), d, dtype = torch.float64)
+        pe[:, 0::2] = torch.sin(angles)
+        pe[:, 1::2] = torch.cos(angles)
+        return pe.float()
+
+    def _table(self, grid: WindowGrid, d: int) -> torch.Tensor:
+        return self._trigonometric(torch.arange(int(grid.n_windows.max())), d)
 
 class RelativePositionalEncoding(TrigonometricPositionalEncoding):
-    def __init__(self, 
-                 d_model: Union[int, List[int], Tuple[int], np.array[int], torch.Tensor[int], Dict[str,int]], 
-                 dropout: float = -1, 
-                 length: int = 100,
-                 total_progression: int = 10000, 
-        ) -> None:
 
-        super().__init__(d_model, dropout, length, total_progression)
+    """
+    the trigonometric encoding of the position of the window relative to the size of its chromosome,
+    t = length x window / windows of the chromosome, the windows of all the chromosomes have their own rows
+    """
 
+    def _table(self, grid: WindowGrid, d: int) -> torch.Tensor:
+        n_windows = torch.as_tensor(grid.n_windows, dtype = torch.float64)
+        chrom = torch.repeat_interleave(torch.arange(len(n_windows)), torch.as_tensor(grid.n_windows))
+        rows = torch.arange(len(grid)) - torch.as_tensor(grid.offsets[:-1])[chrom]
+        return self._trigonometric(self.length * rows / n_windows[chrom], d)
 
-pe = GenomicLinearPositionalEncoding([3, 8, 8], 0.6, 100)
\ No newline at end of file
+    def _rows(self, chroms: torch.Tensor, starts: torch.Tensor, i: int) -> torch.Tensor:
+        offsets = getattr(self, f"offsets_{i}")
+        return offsets.index_select(0, chroms).add_(torch.div(starts, self.grids[i].step, rounding_mode = 'floor'))
@@ -0,0 +1,6 @@
+from .svgp import SparseGP, fit
+
+__all__ = (
+    'SparseGP',
+    'fit',
+)
@@ -0,0 +1,119 @@
+# sparse variational Gaussian process, whitened inducing variables
+# https://arxiv.org/abs/1309.6835 (Hensman, Fusi, Lawrence, Gaussian processes for big data)
+
+import math
+import torch
+from torch import nn
+from typing import Iterable, List, Optional, Tuple
+
+class SparseGP(nn.Module):
+
+    """
+    SparseGP refines the embeddings of the windows (the output of DigDriverCNN.embed) into a calibrated mean and
+    variance of each output (cohort), with M inducing points in the embedding space shared by the outputs :
+
+    gp = SparseGP.from_embeddings(z, n_inducing = 256, n_outputs = 2)
+    loss = -gp.elbo(z_batch, y_batch, n_total)      minibatch estimate of the ELBO of the n_total windows
+    mean, var = gp.predict(z)                       (windows, n_outputs), var with the noise of the observations
+
+    A batch of B windows costs O(B M^2 + M^3), the time and memory of an epoch are linear in the windows. The kernel
+    is an RBF with a lengthscale per dimension of the embeddings, u = L v with L the Cholesky factor of the kernel
+    of the inducing points and q(v) = N(m, R R^T), the prior of v is N(0, I).
+    """
+
+    def __init__(self, inducing: torch.Tensor, n_outputs: int = 1, lengthscale: float = 1., variance: float = 1.,
+                 noise: float = 1., jitter: float = 1e-5) -> None:
+        super().__init__()
+        n_inducing, dim = inducing.shape
+        self.n_outputs = n_outputs
+        self.jitter = jitter
+
+        self.inducing = nn.Parameter(inducing.clone().float())
+        # positive parameters by their log
+        self.log_lengthscale = nn.Parameter(torch.full((dim,), math.log(lengthscale)))
+        self.log_variance = nn.Parameter(torch.tensor(math.log(variance)))
+        self.log_noise = nn.Parameter(torch.full((n_outputs,), math.log(noise)))
+
+        self.q_mean = nn.Parameter(torch.zeros(n_outputs, n_inducing))
+        # the lower triangle is the factor R, its diagonal is positive by its log
+        self.q_tril = nn.Parameter(torch.zeros(n_outputs, n_inducing, n_inducing))
+        self.register_buffer('tril_mask', torch.tril(torch.ones(n_inducing, n_inducing), diagonal = -1))
+
+    @classmethod
+    def from_embeddings(cls, z: torch.Tensor, n_inducing: int, n_outputs: int = 1, seed: int = 0, **kwargs) -> 'SparseGP':
+        """
+        inducing points at random windows, the lengthscales at the spread of the embeddings
+        """
+        generator = torch.Generator().manual_seed(seed)
+        inducing = z[torch.randperm(len(z), generator = generator)[:n_inducing]]
+        gp = cls(inducing, n_outputs, **kwargs)
+        with torch.no_grad():
+            gp.log_lengthscale.copy_(torch.log(z.std(dim = 0).clamp(min = 1e-3) * math.sqrt(z.shape[1])))
+        return gp
+
+    def kernel(self, a: torch.Tensor, b: torch.Tensor) -> torch.Tensor:
+        a, b = a / torch.exp(self.log_lengthscale), b / torch.exp(self.log_lengthscale)
+        sq = (a * a).sum(1, keepdim = True) - 2 * a @ b.T + (b * b).sum(1)
+        return torch.exp(self.log_variance) * torch.exp(-0.5 * sq.clamp(min = 0))
+
+    def _q_factor(self) -> torch.Tensor:
+        return self.q_tril * self.tril_mask + torch.diag_embed(torch.exp(torch.diagonal(self.q_tril, dim1 = 1, dim2 = 2)))
+
+    def forward(self, z: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        the mean and the variance (batch, n_outputs) of the latent function at z
+        """
+        kmm = self.kernel(self.inducing, self.inducing)
+        L = torch.linalg.cholesky(kmm + self.jitter * torch.eye(len(kmm), dtype = kmm.dtype, device = kmm.device))
+        # A = L^-1 Kmn, (M, batch)
+        A = torch.linalg.solve_triangular(L, self.kernel(self.inducing, z), upper = False)
+        R = self._q_factor()
+        mean = (self.q_mean @ A).T
+        # diag(Knn - A^T A + A^T R R^T A)
+        RtA = R.transpose(1, 2) @ A
+        var = torch.exp(self.log_variance) - (A * A).sum(0) + (RtA * RtA).sum(1)
+        return mean, var.T.clamp(min = 1e-10)
+
+    def kl(self) -> torch.Tensor:
+        R = self._q_factor()
+        logdet = 2 * torch.log(torch.diagonal(R, dim1 = 1, dim2 = 2)).sum(1)
+        return 0.5 * ((R * R).sum((1, 2)) + (self.q_mean * self.q_mean).sum(1) - self.q_mean.shape[1] - logdet).sum()
+
+    def elbo(self, z: torch.Tensor, y: torch.Tensor, n_total: int) -> torch.Tensor:
+        """
+        the ELBO of the n_total windows estimated on a batch, y : (batch, n_outputs) with a Gaussian likelihood
+        """
+        mean, var = self(z)
+        noise = torch.exp(self.log_noise)
+        expected = -0.5 * (torch.log(2 * math.pi * noise) + ((y - mean) ** 2 + var) / noise)
+        return n_total / len(z) * expected.sum() - self.kl()
+
+    @torch.no_grad()
+    def predict(self, z: torch.Tensor, batch_size: int = 65536, noise: bool = True) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        the predictive mean and variance (windows, n_outputs), by batches of windows
+        """
+        means, variances = [], []
+        for s in range(0, len(z), batch_size):
+            mean, var = self(z[s: s + batch_size])
+            means.append(mean)
+            variances.append(var + torch.exp(self.log_noise) if noise else var)
+        return torch.cat(means), torch.cat(variances)
+
+def fit(gp: SparseGP, batches: Iterable[Tuple[torch.Tensor, torch.Tensor]], n_total: int, epochs: int = 10,
+        lr: float = 0.01) -> List[float]:
+    """
+    maximize the ELBO by Adam on the batches (z, y), iterated once per epoch, return the loss (-ELBO / n_total) of the epochs
+    """
+    optimizer = torch.optim.Adam(gp.parameters(), lr = lr)
+    history = []
+    for _ in range(epochs):
+        total, n = 0., 0
+        for z, y in batches:
+            optimizer.zero_grad(set_to_none = True)
+            loss = -gp.elbo(z, y, n_total) / n_total
+            loss.backward()
+            optimizer.step()
+            total, n = total + loss.item() * len(z), n + len(z)
+        history.append(total / max(n, 1))
+    return history
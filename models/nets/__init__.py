@@ -0,0 +1,8 @@
+from .nets import WindowMLP, DigDriverCNN, compile_model, export_torchscript
+
+__all__ = (
+    'WindowMLP',
+    'DigDriverCNN',
+    'compile_model',
+    'export_torchscript',
+)
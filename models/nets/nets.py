@@ -1,2 +1,134 @@
 import torch
 from torch import nn
+from pathlib import Path
+from typing import List, Optional, Union
+
+from models.attentions import ChannelAttention
+
+class WindowMLP(nn.Module):
+
+    """
+    WindowMLP predicts the log mutation rate of each head (cohort) from the features of a window :
+
+    log_rates = model(x)        x : (batch, n_features), log_rates : (batch, n_heads)
+    z = model.embed(x)          the output of the last hidden layer, (batch, hidden[-1])
+    """
+
+    def __init__(self, n_features: int, n_heads: int, hidden: List[int] = [256, 128], dropout: float = 0.) -> None:
+        super().__init__()
+        layers, width = [], n_features
+        for h in hidden:
+            layers += [nn.Linear(width, h), nn.ReLU()]
+            if dropout > 0:
+                layers.append(nn.Dropout(dropout))
+            width = h
+        self.body = nn.Sequential(*layers)
+        self.heads = nn.Linear(width, n_heads)
+
+    def embed(self, x: torch.Tensor) -> torch.Tensor:
+        return self.body(x)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.heads(self.embed(x))
+
+
+class _WindowStackConv(nn.Module):
+
+    """
+    the convolutions over the windows of one resolution, (batch, window, channels) -> (batch, 2 x conv_channels[-1]),
+    the features of the central window and the mean over the windows
+    """
+
+    def __init__(self, channels: int, conv_channels: List[int], kernel_size: int, attention: bool, groups: Optional[torch.Tensor]) -> None:
+        super().__init__()
+        self.attention = ChannelAttention(channels, groups = groups) if attention else None
+        layers, width = [], channels
+        for c in conv_channels:
+            layers += [nn.Conv1d(width, c, kernel_size, padding = kernel_size // 2), nn.BatchNorm1d(c), nn.ReLU()]
+            width = c
+        self.convs = nn.Sequential(*layers)
+        self.out_features = 2 * width
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self.attention is not None:
+            x = self.attention(x)
+        h = self.convs(x.transpose(1, 2))
+        return torch.cat([h[:, :, h.shape[2] // 2], h.mean(dim = 2)], dim = 1)
+
+
+class DigDriverCNN(nn.Module):
+
+    """
+    DigDriverCNN predicts the log mutation rate of each head (cohort) of a window from the stacks of the windows
+    around it at several resolutions, the convolutions of each resolution run over its stack of windows, then the
+    dense layers join the resolutions :
+
+    model = DigDriverCNN(n_features = 735, n_resolutions = 2, n_heads = 3)
+    log_rates = model(x)            x : (batch, resolution, window, n_features), log_rates : (batch, n_heads)
+    log_rates = model(x)            x : (batch, window, n_features), one resolution
+    z = model.embed(x)              the output of the last dense layer, (batch, hidden[-1])
+
+    The central window of a stack is the predicted window. The model can be compiled (compile_model) and exported
+    to TorchScript (export_torchscript).
+    """
+
+    def __init__(self,
+                 n_features: int,
+                 n_heads: int,
+                 n_resolutions: int = 1,
+                 conv_channels: List[int] = [64, 64],
+                 kernel_size: int = 3,
+                 hidden: List[int] = [128, 64],
+                 dropout: float = 0.,
+                 attention: bool = True,
+                 groups: Optional[torch.Tensor] = None
+        ) -> None:
+
+        super().__init__()
+        if kernel_size % 2 == 0:
+            raise ValueError(f"kernel_size {kernel_size} should be odd, the windows are centred")
+
+        self.n_resolutions = n_resolutions
+        self.stacks = nn.ModuleList([ _WindowStackConv(n_features, conv_channels, kernel_size, attention, groups)
+                                      for _ in range(n_resolutions) ])
+        layers, width = [], sum([ s.out_features for s in self.stacks ])
+        for h in hidden:
+            layers += [nn.Linear(width, h), nn.ReLU()]
+            if dropout > 0:
+                layers.append(nn.Dropout(dropout))
+            width = h
+        self.dense = nn.Sequential(*layers)
+        self.heads = nn.Linear(width, n_heads)
+
+    def embed(self, x: torch.Tensor) -> torch.Tensor:
+        if x.dim() == 2:
+            raise ValueError("(batch, n_features) given, the stacks (batch, windows, n_features) of the windows around each window expected")
+        if x.dim() == 3:
+            x = x.unsqueeze(1)
+        if x.shape[1] != self.n_resolutions:
+            raise ValueError(f"{x.shape[1]} resolutions given, {self.n_resolutions} expected")
+        features = [ stack(x[:, i]) for i, stack in enumerate(self.stacks) ]
+        return self.dense(torch.cat(features, dim = 1))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.heads(self.embed(x))
+
+def compile_model(model: nn.Module, mode: Optional[str] = None, backend: str = 'inductor', dynamic: Optional[bool] = None) -> nn.Module:
+    """
+    the model compiled by torch.compile, the graphs of the forward and backward passes are fused by the backend
+    (inductor generates C++ and OpenMP kernels on the CPU), the first batches of each shape are slower
+    """
+    return torch.compile(model, mode = mode, backend = backend, dynamic = dynamic)
+
+def export_torchscript(model: nn.Module, fname: Union[str, Path]) -> torch.jit.ScriptModule:
+    """
+    save the model in eval mode as TorchScript, loaded by torch.jit.load without the code of the model
+    """
+    was_training = model.training
+    model.eval()
+    try:
+        scripted = torch.jit.optimize_for_inference(torch.jit.script(model))
+        torch.jit.save(scripted, str(fname))
+    finally:
+        model.train(was_training)
+    return scripted
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Callable, Dict, List, Tuple
 
 from datasets import *
 from config import LogSingletonFactory, DatasetConfig
@@ -7,35 +8,86 @@ from config import LogSingletonFactory, DatasetConfig
 # logger = logFactory.getLogger('development')
 # datasetConfig = DatasetConfig()
 
-def build_datasets(datasetConfig: DatasetConfig, logger):
-
-    bioDataset_path = datasetConfig.getDatasetPath('Mappability', 'download')
-    h5Dataset_path  = datasetConfig.getDatasetPath('Mappability', 'h5')
-
-    MappabilityDataset(raw_path = bioDataset_path, 
-                      h5_path = h5Dataset_path,
-                      resolutions = [10000, 100000],
-                      logger = logger,
-                      force_download = True)
+# the builders of the targets take the (download, h5) paths of every target, so that a target can open
+# the datasets it depends on, and return the dataset. They run in the worker processes of the build CLI,
+# the logger is given by name.
+
+def _check(dataset: BioDataset):
+    failed = [ r['node'] if 'node' in r else r['cohort'] for r in getattr(dataset, 'build_report', []) if r['status'] == 'failed' ]
+    if len(failed) > 0:
+        raise RuntimeError(f"{dataset.dataset_name}: failed to build {failed}")
+    return dataset
+
+def build_mappability(paths, logger, resolutions, concurrent = 0, **kwargs):
+    raw_path, h5_path = paths['Mappability']
+    return _check(MappabilityDataset(raw_path = raw_path, h5_path = h5_path, resolutions = resolutions,
+                              logger = logger, concurrent = concurrent, **kwargs))
+
+def build_replication_timing(paths, logger, resolutions, concurrent = 0, **kwargs):
+    raw_path, h5_path = paths['ReplicationTiming']
+    return _check(ReplicationTimingDataset(raw_path = raw_path, h5_path = h5_path, resolutions = resolutions,
+                                    logger = logger, concurrent = concurrent, **kwargs))
+
+def build_epigenomics(paths, logger, resolutions, concurrent = 0, **kwargs):
+    raw_path, h5_path = paths['Epigenomics']
+    return _check(RoadmapEpigenomicsDataset(raw_path = raw_path, h5_path = h5_path, resolutions = resolutions,
+                                     logger = logger, concurrent = concurrent, **kwargs))
+
+def build_reference_genome(paths, logger, resolutions, concurrent = 0, rebuild_h5 = False, dry_run = False, **kwargs):
+    raw_path, h5_path = paths['ReferenceGenome']
+    genome = ReferenceGenomeDataset(raw_path = raw_path, h5_path = h5_path, logger = logger,
+                                    rebuild_h5 = rebuild_h5, dry_run = dry_run, **kwargs)
+    if not dry_run:
+        genome.build_context_composition(resolutions = resolutions, N_grams = [3, 5],
+                                         concurrent = concurrent, rebuild_h5 = rebuild_h5)
+    return genome
+
+def _reference_genome(paths, logger, dry_run, genome = None):
+    # built by the ReferenceGenome target
+    raw_path, h5_path = paths['ReferenceGenome']
+    return ReferenceGenomeDataset(raw_path = raw_path, h5_path = h5_path, logger = logger, dry_run = dry_run, genome = genome)
+
+def build_pcawg(paths, logger, resolutions, concurrent = 0, dry_run = False, genome = None, **kwargs):
+    raw_path, h5_path = paths['PCAWG']
+    return _check(PCAWGDataset(raw_path = raw_path, h5_path = h5_path, resolutions = resolutions, logger = logger,
+                        reference_genome = _reference_genome(paths, logger, dry_run, genome),
+                        concurrent = concurrent, dry_run = dry_run, genome = genome, **kwargs))
+
+def build_dietlein(paths, logger, resolutions, concurrent = 0, dry_run = False, genome = None, **kwargs):
+    raw_path, h5_path = paths['Dietlein']
+    return _check(DietleinDataset(raw_path = raw_path, h5_path = h5_path, resolutions = resolutions, logger = logger,
+                           reference_genome = _reference_genome(paths, logger, dry_run, genome),
+                           concurrent = concurrent, dry_run = dry_run, genome = genome, **kwargs))
+
+# name in config/datasets.yaml : (builder, targets it depends on)
+TARGETS: Dict[str, Tuple[Callable, List[str]]] = {
+    'Mappability':       (build_mappability,        []),
+    'ReplicationTiming': (build_replication_timing, []),
+    'Epigenomics':       (build_epigenomics,        []),
+    'ReferenceGenome':   (build_reference_genome,   []),
+    'PCAWG':             (build_pcawg,              ['ReferenceGenome']),
+    'Dietlein':          (build_dietlein,           ['ReferenceGenome']),
+}
+
+# the targets summarizing bigWig tracks, stored as --storage
+BIGWIG_TARGETS = ['Mappability', 'ReplicationTiming', 'Epigenomics']
+
+def build_target(name: str, paths, logger, resolutions, **kwargs):
+    # in a worker process, the dataset is not sent back
+    TARGETS[name][0](paths, logger, resolutions, **kwargs)
+
+def target_paths(datasetConfig: DatasetConfig) -> Dict[str, Tuple[Path, Path]]:
+    return { name: (datasetConfig.getDatasetPath(name, 'download'), datasetConfig.getDatasetPath(name, 'h5'))
+             for name in TARGETS if name in datasetConfig.getDatasetNames() }
 
-    bioDataset_path = datasetConfig.getDatasetPath('ReplicationTiming', 'download')
-    h5Dataset_path  = datasetConfig.getDatasetPath('ReplicationTiming', 'h5')
-
-    ReplicationTimingDataset(raw_path = bioDataset_path, 
-                        h5_path = h5Dataset_path,
-                        resolutions = [10000, 100000],
-                        logger = logger,
-                        force_download = True)
+def build_datasets(datasetConfig: DatasetConfig, logger):
 
-    bioDataset_path = datasetConfig.getDatasetPath('Epigenomics', 'download')
-    h5Dataset_path  = datasetConfig.getDatasetPath('Epigenomics', 'h5')
+    paths = target_paths(datasetConfig)
+    genome = datasetConfig.getGenome()
+    for name in ['Mappability', 'ReplicationTiming', 'Epigenomics']:
+        TARGETS[name][0](paths, logger, resolutions = [10000, 100000], force_download = True, genome = genome)
+    build_reference_genome(paths, logger, resolutions = [10000, 100000], genome = genome)
 
-    RoadmapEpigenomicsDataset(raw_path = bioDataset_path, 
-                        h5_path = h5Dataset_path, 
-                        resolutions = [10000, 100000], 
-                        logger = logger,
-                        force_download = True)
-    
 
 def build_datasets_test():
 
@@ -0,0 +1,157 @@
+"""
+command line of the dataset builds, with the paths of config/datasets.yaml :
+
+python -m run build --targets Mappability,Epigenomics --resolutions 10000,100000 --jobs 8
+python -m run build --targets all --dry-run
+python -m run build --targets Mappability,PCAWG --chromosomes chr21 --resolutions 100000
+python -m run work --targets Epigenomics,PCAWG --queue /shared/queue/build-01 --jobs 4
+
+The selected targets and the targets they depend on are scheduled on a build graph, the independent
+targets run at the same time in --jobs processes, and the remaining processes are shared by the
+bigWig tracks and MAF shards of each target. The work command shares the build between the nodes of a
+cluster running the same command, see run.cluster. The genome section of the config, or --assembly,
+--chrom-sizes and --chromosomes, choose the chromosomes built by every target.
+"""
+
+import sys
+import logging
+import argparse
+
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from config import LogSingletonFactory, DatasetConfig
+from datasets import STORAGES
+from mini_utils.build_graph import BuildGraph
+from mini_utils.work_queue import WorkQueue
+
+from . import cluster
+from .build_datasets import BIGWIG_TARGETS, TARGETS, build_target, target_paths
+
+def _csv(value: str) -> List[str]:
+    return [ v.strip() for v in value.split(',') if v.strip() != '' ]
+
+def _add_common_arguments(command: argparse.ArgumentParser):
+    command.add_argument('--targets', type = _csv, default = ['all'],
+                         help = f"comma separated datasets, or all : {','.join(TARGETS)}")
+    command.add_argument('--resolutions', type = lambda v: [ int(r) for r in _csv(v) ], default = [10000, 100000],
+                         help = 'comma separated window sizes')
+    command.add_argument('--jobs', type = int, default = 1, help = 'number of processes')
+    command.add_argument('--config', default = 'config/datasets.yaml')
+    command.add_argument('--logger', default = 'development', help = 'logger of config/logging_config.yaml')
+    command.add_argument('--assembly', default = None, help = 'genome assembly, hg19 by default')
+    command.add_argument('--chrom-sizes', default = None, help = 'chrom.sizes or bigWig file of the chromosome sizes of the assembly')
+    command.add_argument('--chromosomes', type = _csv, default = None, help = 'comma separated chromosomes to build, all by default')
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog = 'python -m run', description = 'RepDigDriver datasets')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    build = commands.add_parser('build', help = 'download and convert the datasets')
+    _add_common_arguments(build)
+    build.add_argument('--dry-run', action = 'store_true', help = 'only log what would be downloaded and built')
+    build.add_argument('--force-download', action = 'store_true')
+    build.add_argument('--rebuild', action = 'store_true', help = 'rebuild the h5 files from scratch')
+    build.add_argument('--storage', default = 'float64', choices = STORAGES,
+                       help = f"values of the bigWig summaries ({','.join(BIGWIG_TARGETS)}), int8 and uint16 are affine codes per column")
+
+    work = commands.add_parser('work', help = 'build the datasets with the other nodes of a cluster')
+    _add_common_arguments(work)
+    work.add_argument('--queue', default = None, help = 'queue directory of the build, on the shared file system, {h5 root}/queue by default')
+    work.add_argument('--lease', type = float, default = 600., help = 'seconds before the task of a silent worker is claimed again')
+    work.add_argument('--poll', type = float, default = 5., help = 'seconds between two claims when no task is ready')
+    return parser
+
+def select_targets(names: List[str]) -> List[str]:
+    """
+    the targets and the targets they depend on
+    """
+    names = list(TARGETS) if 'all' in names else names
+    unknown = [ n for n in names if n not in TARGETS ]
+    if len(unknown) > 0:
+        raise ValueError(f"unknown targets {unknown}, expected {list(TARGETS)}")
+    selected, stack = [], list(names)
+    while len(stack) > 0:
+        name = stack.pop()
+        if name not in selected:
+            selected.append(name)
+            stack.extend(TARGETS[name][1])
+    return [ n for n in TARGETS if n in selected ]
+
+def _configured_targets(args: argparse.Namespace):
+    datasetConfig = DatasetConfig(config_file = args.config)
+    paths   = target_paths(datasetConfig)
+    targets = select_targets(args.targets)
+    missing = [ t for t in targets if t not in paths ]
+    if len(missing) > 0:
+        raise ValueError(f"targets {missing} are not configured in {args.config}")
+    genome = datasetConfig.getGenome(assembly = args.assembly, chrom_sizes = args.chrom_sizes, chromosomes = args.chromosomes)
+    return datasetConfig, paths, targets, genome
+
+def build(args: argparse.Namespace, logger: logging.Logger) -> int:
+    datasetConfig, paths, targets, genome = _configured_targets(args)
+    logger.info(f"targets {targets} on {genome}")
+
+    # the targets running at the same time share the processes
+    jobs = max(1, args.jobs)
+    workers = min(jobs, len(targets))
+    graph = BuildGraph(datasetConfig.getDatasetRoot('h5').joinpath('targets.build.json'), logger)
+    for name in targets:
+        graph.add(name,
+                  fn = partial(build_target, name, paths, args.logger, args.resolutions,
+                               concurrent = max(1, jobs // workers) if jobs > 1 else 0,
+                               force_download = args.force_download,
+                               rebuild_h5 = args.rebuild,
+                               dry_run = args.dry_run,
+                               genome = genome,
+                               **({'storage': args.storage} if name in BIGWIG_TARGETS else {})),
+                  deps = [ d for d in TARGETS[name][1] if d in targets ])
+
+    if args.dry_run:
+        for name in graph.order():
+            logger.info(f"target {name}")
+            graph.nodes[name].fn()
+        return 0
+
+    # the targets are always run, each one skips what it has already built
+    report = graph.run(force = True, concurrent = workers)
+    for r in report:
+        logger.info(f"{r['node']:<20} {r['status']:<8} {r['seconds']:10.1f}s")
+    return 0 if all([ r['status'] == 'built' for r in report ]) else 1
+
+def work(args: argparse.Namespace, logger: logging.Logger) -> int:
+    datasetConfig, paths, targets, genome = _configured_targets(args)
+    queue_root = datasetConfig.getDatasetRoot('h5').joinpath('queue') if args.queue is None else args.queue
+
+    queue = WorkQueue(queue_root, lease_seconds = args.lease, logger = logger)
+    logger.info(f"{cluster.submit_targets(queue, paths, targets, args.resolutions, args.logger, genome)} tasks submitted to {queue_root}")
+
+    worker = partial(cluster.work, queue_root, paths, args.logger, args.resolutions, lease_seconds = args.lease, poll = args.poll,
+                     genome = genome)
+    if args.jobs <= 1:
+        reports = [ worker() ]
+    else:
+        with ProcessPoolExecutor(max_workers = args.jobs) as executor:
+            futures = [ executor.submit(worker) for _ in range(args.jobs) ]
+            reports = [ f.result() for f in futures ]
+
+    done   = sum([ len(r[WorkQueue.DONE]) for r in reports ])
+    failed = [ n for n, t in queue.tasks().items() if queue.status(n) == WorkQueue.FAILED ]
+    blocked = queue.blocked()
+    logger.info(f"{done} tasks run on this node, {len(failed)} failed, {len(blocked)} blocked")
+    for name in failed + blocked:
+        logger.error(f"  {queue.status(name) if name in failed else 'blocked':<8} {name}")
+    return 0 if len(failed) + len(blocked) == 0 else 1
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = make_parser().parse_args(argv)
+    logger = LogSingletonFactory().getLogger(args.logger)
+    if args.command == 'build':
+        return build(args, logger)
+    if args.command == 'work':
+        return work(args, logger)
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+build of the datasets by the nodes of a cluster, sharing the work through a WorkQueue on the shared file
+system. Every node runs the same command, with a queue directory for this build :
+
+python main_cluster.py work --targets Epigenomics,PCAWG --queue /shared/queue/build-01 --jobs 4
+
+1. the node submits the tasks of the targets, a task already submitted by another node is kept
+   download:{target}:{file}                     one per source file
+   unit:{target}:{file}:{chrom}:{resolution}    bigWig targets, one per (source file, chromosome, resolution)
+   unit:{target}:{file}                         MAF targets, one per MAF file
+   merge:{target}                               the normal build of the target, after all its units and the
+                                                targets it depends on : the units are copied in the tracks,
+                                                the shards are kept, the summaries are built
+2. --jobs local workers claim the tasks until every task is done, failed or blocked by a failed task
+
+The units are built in their own files, a dead node leaves no partial output, its tasks are claimed again
+once their lease expires.
+"""
+
+import logging
+
+from logging import Logger
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from mini_utils.bio import Genome
+from mini_utils.work_queue import WorkQueue
+
+from .build_datasets import TARGETS, build_target
+
+def submit_targets(queue: WorkQueue, paths: Dict[str, Tuple[Path, Path]], targets: List[str],
+                   resolutions: List[int], logger: Union[str, Logger] = logging.getLogger(),
+                   genome: Optional[Genome] = None) -> int:
+    """
+    submit the tasks of the targets, in the order of their dependencies. Return the number of new tasks.
+    """
+    submitted = 0
+    for name in targets:
+        dataset = TARGETS[name][0](paths, logger, resolutions, dry_run = True, genome = genome)
+        after = [ f"merge:{d}" for d in TARGETS[name][1] if d in targets ]
+
+        downloads = {}
+        for url in dataset.source_list:
+            fname = url.split('/')[-1]
+            downloads[fname] = f"download:{name}:{fname}"
+            submitted += queue.submit(downloads[fname], {'kind': 'download', 'target': name, 'url': url})
+
+        units = []
+        for unit in (dataset.work_units() if hasattr(dataset, 'work_units') else []):
+            units.append(':'.join(['unit', name] + [ str(v) for v in unit.values() ]))
+            submitted += queue.submit(units[-1], {'kind': 'unit', 'target': name, 'unit': unit},
+                                      deps = [downloads[unit['source']]] + after)
+
+        submitted += queue.submit(f"merge:{name}", {'kind': 'merge', 'target': name},
+                                  deps = list(downloads.values()) + units + after)
+    return submitted
+
+def work(queue_root: Union[str, Path], paths: Dict[str, Tuple[Path, Path]], logger: str, resolutions: List[int],
+         lease_seconds: float = 600., poll: float = 5., genome: Optional[Genome] = None) -> Dict[str, List[str]]:
+    """
+    a worker of the queue, in its own process
+    """
+    queue = WorkQueue(queue_root, lease_seconds = lease_seconds, logger = logger)
+    # the datasets are opened without building, to run the downloads and units
+    datasets = {}
+
+    def execute(task: str, payload: Dict):
+        target = payload['target']
+        if payload['kind'] == 'merge':
+            build_target(target, paths, logger, resolutions, genome = genome)
+            return None
+        if target not in datasets:
+            datasets[target] = TARGETS[target][0](paths, logger, resolutions, dry_run = True, genome = genome)
+        if payload['kind'] == 'download':
+            datasets[target].raw_path.mkdir(parents = True, exist_ok = True)
+            fname, success, error = datasets[target]._download(payload['url'])
+            if not success:
+                raise RuntimeError(f"download failed: {payload['url']} {error}")
+            return fname
+        return datasets[target].build_unit(**payload['unit'])
+
+    return queue.run(execute, poll = poll)
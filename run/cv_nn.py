@@ -0,0 +1,274 @@
+"""
+chromosome-held-out cross-validation of the window models of run.train_nn, configured by config/train.yaml :
+
+python -m run.cv_nn --config config/train.yaml
+python -m run.cv_nn --config config/train.yaml --folds 5 --jobs 5 --epochs 3
+
+The chromosomes are split in cv.folds folds of about the same number of windows. Each fold trains the model of
+the config on the windows of the other chromosomes, and is evaluated on the windows of its chromosomes, the
+windows of a stack (data.context) are always in the fold of the predicted window.
+
+The features and the mutation counts of every window are read once from the h5 files into the .npy files of
+cv.cache, then each fold maps them read-only (numpy mmap), the processes share the pages of the files and a fold
+is only the indices of its windows. The cache is read again if the dataset or the features change, see
+h5io.checkpoint_key.
+
+The cv.jobs processes train the folds concurrently, with the cores of the node shared between them
+(torch.set_num_threads). The metrics of the held-out windows of each fold, the Poisson loss and the Pearson
+correlation of the rates and the counts of each head, are written to cv.json in the output directory with their
+means over the folds, the folds are recorded as telemetry stages.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+import numpy as np
+import torch
+
+from torch import nn
+from logging import Logger
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from torch.utils.data import BatchSampler, DataLoader, SubsetRandomSampler
+
+from config import LogSingletonFactory
+from datasets import WindowGrid
+from mini_utils import h5io
+from mini_utils.telemetry import Telemetry
+
+from .train_nn import WindowBatches, Prefetcher, build_model, load_config, open_dataset, train_epoch
+
+# the cached windows of a worker process, mapped once by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+class CachedWindows(WindowBatches):
+
+    """
+    the batches of WindowBatches read from the arrays of the cache, x : (windows, n_features) and y : (windows, n_heads)
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, grid: WindowGrid, context: int = 0) -> None:
+        self.x, self.y = x, y
+        self.grid = grid
+        self.context = context
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def __getitem__(self, indices: List[int]) -> Tuple[torch.Tensor, torch.Tensor]:
+        indices = np.asarray(indices, dtype = np.int64)
+        rows = indices if self.context == 0 else self._stacks(indices)
+        # the fancy indexing copies the rows out of the mapped file
+        return torch.from_numpy(self.x[rows]), torch.from_numpy(self.y[indices])
+
+def cache_windows(data: Dict[str, Any], cache: Path, logger: Logger, batch_size: int = 65536) -> Dict[str, Any]:
+    """
+    write the features and the counts of every window to cache/features.npy and cache/counts.npy, unless the
+    cache has the key of the inputs already. Return the description of the cache, cache/windows.json
+    """
+    dataset = open_dataset(data, logger)
+    key = h5io.checkpoint_key(summary = Path(dataset.summary_h5_fname), cohorts = data['cohorts'],
+                              resolution = data['resolution'], overlap = data['overlap'], genome = data['genome'],
+                              normalize = data['normalize'], projection = data['projection'],
+                              **{ f"features{i}": Path(f) for i, f in enumerate(data['features']) })
+    meta_fname = cache.joinpath('windows.json')
+    if meta_fname.exists():
+        meta = json.loads(meta_fname.read_text())
+        if meta['key'] == key:
+            logger.info(f"{meta['windows']} cached windows in {cache}")
+            return meta
+
+    cache.mkdir(parents = True, exist_ok = True)
+    columns = dataset.feature_columns()
+    heads = list(dataset.heads)
+    batches = WindowBatches(dataset, 0)
+    start = time.perf_counter()
+    # the description is written last, an interrupted cache is written again
+    meta_fname.unlink(missing_ok = True)
+    x = np.lib.format.open_memmap(cache.joinpath('features.npy'), mode = 'w+', dtype = np.float32, shape = (len(batches), len(columns)))
+    y = np.lib.format.open_memmap(cache.joinpath('counts.npy'), mode = 'w+', dtype = np.float32, shape = (len(batches), len(heads)))
+    for s in range(0, len(batches), batch_size):
+        x_batch, y_batch = batches[np.arange(s, min(len(batches), s + batch_size))]
+        x[s: s + len(x_batch)], y[s: s + len(y_batch)] = x_batch.numpy(), y_batch.numpy()
+    x.flush()
+    y.flush()
+    del x, y
+    dataset.close_window_reader()
+
+    grid = batches.grid
+    meta = {'key': key, 'windows': len(batches), 'columns': columns, 'heads': heads, 'resolution': grid.resolution,
+            'overlap': grid.overlap, 'chrom_sizes': dict(zip(grid.chroms, grid.chrom_sizes.tolist()))}
+    meta_fname.write_text(json.dumps(meta))
+    logger.info(f"{len(batches)} windows of {len(columns)} features cached in {cache} in {time.perf_counter() - start:.1f}s")
+    return meta
+
+def chromosome_folds(grid: WindowGrid, n_folds: int) -> List[List[str]]:
+    """
+    the chromosomes of each fold, the largest chromosomes first to the fold with the fewest windows
+    """
+    if not 2 <= n_folds <= len(grid.chroms):
+        raise ValueError(f"{n_folds} folds of {len(grid.chroms)} chromosomes")
+    folds, sizes = [ [] for _ in range(n_folds) ], np.zeros(n_folds, dtype = np.int64)
+    for c in np.argsort(-grid.n_windows, kind = 'stable'):
+        f = int(np.argmin(sizes))
+        folds[f].append(grid.chroms[c])
+        sizes[f] += grid.n_windows[c]
+    return folds
+
+def fold_mask(grid: WindowGrid, chroms: List[str]) -> np.ndarray:
+    """
+    True for the windows of the chromosomes
+    """
+    mask = np.zeros(len(grid), dtype = bool)
+    for chr in chroms:
+        c = grid.chroms.index(chr)
+        mask[grid.offsets[c]: grid.offsets[c + 1]] = True
+    return mask
+
+def _init_worker(cache: Path, meta: Dict[str, Any], context: int, threads: int, telemetry: Telemetry):
+    torch.set_num_threads(threads)
+    grid = WindowGrid(meta['resolution'], meta['overlap'], meta['chrom_sizes'])
+    x, y = np.load(cache.joinpath('features.npy'), mmap_mode = 'r'), np.load(cache.joinpath('counts.npy'), mmap_mode = 'r')
+    _worker.update(windows = CachedWindows(x, y, grid, context), meta = meta, telemetry = telemetry)
+
+def evaluate(model: nn.Module, windows: CachedWindows, indices: np.ndarray, heads: List[str], batch_size: int = 8192) -> Dict[str, Any]:
+    """
+    the Poisson loss of the windows and the Pearson correlation of the predicted rates and the counts of each head
+    """
+    model.eval()
+    loss_fn = nn.PoissonNLLLoss(log_input = True, reduction = 'sum')
+    rates, counts, loss = [], [], 0.
+    with torch.inference_mode():
+        for s in range(0, len(indices), batch_size):
+            x, y = windows[indices[s: s + batch_size]]
+            log_rates = model(x).float()
+            loss += loss_fn(log_rates, y).item()
+            rates.append(torch.exp(log_rates).numpy())
+            counts.append(y.numpy())
+    rates, counts = np.concatenate(rates).astype(np.float64), np.concatenate(counts).astype(np.float64)
+    pearson = {}
+    for i, head in enumerate(heads):
+        r, c = rates[:, i] - rates[:, i].mean(), counts[:, i] - counts[:, i].mean()
+        norm = np.sqrt((r * r).sum() * (c * c).sum())
+        # undefined for constant rates or counts
+        pearson[head] = float((r * c).sum() / norm) if norm > 0 else None
+    return {'loss': loss / (len(indices) * max(1, counts.shape[1])), 'pearson': pearson}
+
+def run_fold(config: Dict[str, Any], fold: int, chroms: List[str]) -> Dict[str, Any]:
+    """
+    train the model on the windows out of the chromosomes of the fold, and evaluate it on them
+    """
+    windows, meta = _worker['windows'], _worker['meta']
+    loader, optim = config['loader'], config['optim']
+    held_out = fold_mask(windows.grid, chroms)
+    train_idx, test_idx = np.flatnonzero(~held_out), np.flatnonzero(held_out)
+
+    torch.manual_seed(optim['seed'] + fold)
+    model = build_model(config['model'], len(meta['columns']), len(meta['heads']), config['data']['context'])
+    optimizer = torch.optim.AdamW(model.parameters(), lr = optim['lr'], weight_decay = optim['weight_decay'])
+    sampler = SubsetRandomSampler(train_idx.tolist(), generator = torch.Generator().manual_seed(optim['seed'] + fold))
+    # the windows are in memory already, no worker processes
+    batches = Prefetcher(DataLoader(windows, batch_size = None, sampler = BatchSampler(sampler, loader['batch_size'], drop_last = False)),
+                         loader['prefetch'])
+
+    with _worker['telemetry'].stage('fold', unit = f"fold{fold}", rows = len(train_idx)):
+        history = [ train_epoch(model, batches, optimizer, nn.PoissonNLLLoss(log_input = True), optim['accumulate'], optim['autocast'])
+                    for _ in range(optim['epochs']) ]
+    metrics = evaluate(model, windows, test_idx, meta['heads'], loader['batch_size'])
+    return dict(metrics, fold = fold, chroms = chroms, train_windows = len(train_idx), test_windows = len(test_idx),
+                train_loss = history[-1]['loss'] if len(history) > 0 else None,
+                seconds = sum([ h['seconds'] for h in history ]))
+
+def _mean(values: List[Optional[float]]) -> Optional[float]:
+    values = [ v for v in values if v is not None ]
+    return float(np.mean(values)) if len(values) > 0 else None
+
+def cross_validate(config: Dict[str, Any], logger: Logger = logging.getLogger()) -> Dict[str, Any]:
+    """
+    the metrics of the held-out windows of each fold and their means, written to cv.json in the output directory
+    """
+    cv, data = config['cv'], config['data']
+    tmp = None
+    if cv['cache'] is not None:
+        cache = Path(cv['cache'])
+    elif config['output'] is not None:
+        cache = Path(config['output']).joinpath('cache')
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        cache = Path(tmp.name)
+
+    try:
+        meta = cache_windows(data, cache, logger)
+        grid = WindowGrid(meta['resolution'], meta['overlap'], meta['chrom_sizes'])
+        folds = chromosome_folds(grid, cv['folds'])
+
+        jobs = max(1, min(cv['jobs'], len(folds)))
+        threads = config['threads']['intra_op'] or max(1, (os.cpu_count() or 1) // jobs)
+        telemetry = Telemetry(logger)
+        init = (cache, meta, data['context'], threads, telemetry)
+        logger.info(f"{len(folds)} folds of {meta['windows']} windows, {jobs} processes of {threads} threads")
+
+        start, results = time.perf_counter(), []
+        if jobs == 1:
+            _init_worker(*init)
+            results = [ run_fold(config, f, chroms) for f, chroms in enumerate(folds) ]
+        else:
+            with ProcessPoolExecutor(max_workers = jobs, initializer = _init_worker, initargs = init) as executor:
+                futures = [ executor.submit(run_fold, config, f, chroms) for f, chroms in enumerate(folds) ]
+                for future in as_completed(futures):
+                    results.append(future.result())
+                    logger.debug(f"fold {results[-1]['fold']} done")
+        seconds = time.perf_counter() - start
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    results = sorted(results, key = lambda r: r['fold'])
+    for r in results:
+        pearson = ' '.join([ f"{h} {v:.3f}" if v is not None else f"{h} -" for h, v in r['pearson'].items() ])
+        logger.info(f"fold {r['fold']:>2} {r['test_windows']:>9} held-out windows loss {r['loss']:.4f} pearson {pearson}")
+    report = {'folds': results, 'seconds': seconds,
+              'mean': {'loss': _mean([ r['loss'] for r in results ]),
+                       'pearson': { h: _mean([ r['pearson'][h] for r in results ]) for h in meta['heads'] }}}
+    logger.info(f"{len(results)} folds in {seconds:.1f}s, mean loss {report['mean']['loss']:.4f}")
+
+    if config['output'] is not None:
+        output = Path(config['output'])
+        output.mkdir(parents = True, exist_ok = True)
+        output.joinpath('cv.json').write_text(json.dumps(report, indent = 2))
+        telemetry.report(output.joinpath('cv.telemetry.json'), folds = len(folds), jobs = jobs, threads = threads)
+        logger.info(f"cross-validation report saved to {output.joinpath('cv.json')}")
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog = 'python -m run.cv_nn', description = 'chromosome-held-out cross-validation of the window models')
+    parser.add_argument('--config', default = 'config/train.yaml')
+    parser.add_argument('--logger', default = 'development', help = 'logger of config/logging_config.yaml')
+    parser.add_argument('--folds', type = int, default = None)
+    parser.add_argument('--jobs', type = int, default = None, help = 'folds trained concurrently')
+    parser.add_argument('--cache', default = None, help = 'directory of the cached windows')
+    parser.add_argument('--epochs', type = int, default = None)
+    parser.add_argument('--output', default = None, help = 'directory of cv.json and the telemetry report')
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    overrides = {('cv', 'folds'): args.folds, ('cv', 'jobs'): args.jobs, ('cv', 'cache'): args.cache, ('optim', 'epochs'): args.epochs}
+    for (section, key), value in overrides.items():
+        if value is not None:
+            config[section][key] = value
+    if args.output is not None:
+        config['output'] = args.output
+
+    cross_validate(config, LogSingletonFactory().getLogger(args.logger))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+genome-wide predictions of a model trained by run.train_nn, the mutation rates of every window of every cohort :
+
+python -m run.predict_nn --model models/model.pt --output predictions.h5
+python -m run.predict_nn --model models/model.pt --output predictions.h5 --resolutions 10000,100000,1000000 --jobs 8
+
+The windows of the genome at the resolution of the training are cut in blocks of --block-windows windows of one
+chromosome. The --jobs processes load the model once, read the features of a block by batches of --batch-size
+windows (run.train_nn.WindowBatches) and predict them, the main process writes the blocks as they come. The
+predictions are aligned with the summary of the dataset, the windows of WindowGrid :
+
+{cohort}/rates/{chr}/{rslt}_{overlap}       windows, expected mutations of the window
+
+The rates at the coarser --resolutions are the sums of the rates of the windows they contain.
+
+A block is flagged in progress/{chr} once written, an interrupted run resumes from the blocks not flagged. The
+file starts over if the model or the features change, see h5io.checkpoint_key. The blocks are recorded as
+telemetry stages, and the windows/s of the run are logged and written to the telemetry report.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+import h5py
+import numpy as np
+import torch
+
+from torch import nn
+from logging import Logger
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from config import LogSingletonFactory
+from datasets import WindowGrid
+from mini_utils import h5io
+from mini_utils.telemetry import Telemetry
+
+from .train_nn import AUTOCAST, WindowBatches, build_model, open_dataset
+
+# the model and the features of a worker process, loaded once by _init_worker
+_worker: Dict[str, Any] = {}
+
+def load_model(checkpoint: Dict[str, Any]) -> nn.Module:
+    model = build_model(checkpoint['config']['model'], len(checkpoint['features']), len(checkpoint['heads']),
+                        checkpoint['config']['data']['context'])
+    model.load_state_dict(checkpoint['model'])
+    return model.eval()
+
+def _init_worker(model_fname: Union[str, Path], threads: int, batch_size: int, autocast: Optional[str], telemetry: Telemetry):
+    torch.set_num_threads(threads)
+    checkpoint = torch.load(model_fname, map_location = 'cpu', weights_only = False)
+    config = checkpoint['config']
+    quiet = logging.getLogger('predict.datasets')
+    quiet.setLevel(logging.WARNING)
+    dataset = open_dataset(config['data'], quiet)
+    # the features only
+    dataset.heads = []
+    _worker.update(model = load_model(checkpoint), batches = WindowBatches(dataset, config['data']['context']),
+                   batch_size = batch_size, autocast = autocast, telemetry = telemetry)
+
+def predict_block(chrom: str, offset: int, start: int, end: int) -> Tuple[str, int, np.ndarray]:
+    """
+    the rates (end - start, n_heads) of the windows start ... end-1 of the chromosome, offset is the index of its first window
+    """
+    batches, model = _worker['batches'], _worker['model']
+    rates = []
+    with _worker['telemetry'].stage('predict', unit = f"{chrom}:{start}-{end}", rows = end - start):
+        for s in range(start, end, _worker['batch_size']):
+            x, _ = batches[np.arange(offset + s, offset + min(end, s + _worker['batch_size']))]
+            with torch.inference_mode(), torch.autocast('cpu', dtype = AUTOCAST.get(_worker['autocast'], torch.bfloat16),
+                                                        enabled = _worker['autocast'] is not None):
+                rates.append(torch.exp(model(x).float()).numpy())
+    return chrom, start, np.concatenate(rates, axis = 0)
+
+def _blocks(grid: WindowGrid, block_windows: int) -> Dict[str, List[Tuple[int, int]]]:
+    return { chr: [ (s, min(int(n), s + block_windows)) for s in range(0, int(n), block_windows) ]
+             for chr, n in zip(grid.chroms, grid.n_windows) }
+
+def _rates_name(cohort: str, grid: WindowGrid, chr: str) -> str:
+    return f"{cohort}/rates/{grid.dataset_name(chr)}"
+
+def _prepare(h5fd: h5py.File, key: str, grid: WindowGrid, heads: List[str], blocks: Dict[str, List], logger: Logger):
+    if h5fd.attrs.get(h5io.CHECKPOINT) != key:
+        if len(h5fd.keys()) > 0:
+            logger.info("the model or the features changed, the predictions start over")
+        for k in list(h5fd.keys()):
+            del h5fd[k]
+        h5fd.attrs['heads'] = heads
+        h5fd.attrs['resolution'] = grid.resolution
+        h5fd.attrs[h5io.CHECKPOINT] = key
+    for c, chr in enumerate(grid.chroms):
+        n = int(grid.n_windows[c])
+        for cohort in heads:
+            if _rates_name(cohort, grid, chr) not in h5fd:
+                h5fd.create_dataset(_rates_name(cohort, grid, chr), shape = (n,), dtype = np.float32, chunks = (min(n, 65536),))
+        if f"progress/{chr}" not in h5fd:
+            h5fd.create_dataset(f"progress/{chr}", data = np.zeros(len(blocks[chr]), dtype = bool))
+    h5fd.flush()
+
+def _aggregate(h5fd: h5py.File, key: str, grid: WindowGrid, heads: List[str], resolution: int):
+    """
+    the rates at a coarser resolution, the sums of the rates of the windows of the grid in its windows
+    """
+    if grid.overlap != 0 or resolution % grid.resolution != 0:
+        raise ValueError(f"resolution {resolution} is not a multiple of the windows {grid.resolution}_{grid.overlap}")
+    coarse, k = WindowGrid(resolution, 0, dict(zip(grid.chroms, grid.chrom_sizes.tolist()))), resolution // grid.resolution
+    for chr in grid.chroms:
+        for cohort in heads:
+            name = _rates_name(cohort, coarse, chr)
+            if h5io.is_complete(h5fd, name, key):
+                continue
+            rates = h5fd[_rates_name(cohort, grid, chr)][:]
+            sums = np.add.reduceat(rates, np.arange(0, len(rates), k)).astype(np.float32)
+            h5io.write_unit(h5fd, name, key, sums)
+
+def predict(model_fname: Union[str, Path], output: Union[str, Path], resolutions: List[int] = [], jobs: int = 1,
+            batch_size: int = 8192, block_windows: int = 65536, autocast: Optional[str] = None,
+            logger: Logger = logging.getLogger()) -> Dict[str, Any]:
+    """
+    write the predictions of the model to output, return the windows predicted by this run and their windows/s
+    """
+    model_fname, output = Path(model_fname), Path(output)
+    checkpoint = torch.load(model_fname, map_location = 'cpu', weights_only = False)
+    data, heads = checkpoint['config']['data'], checkpoint['heads']
+
+    dataset = open_dataset(data, logger)
+    grid = WindowGrid(dataset.resolutions[0], dataset.overlap, dataset.genome.chrom_sizes)
+    key = h5io.checkpoint_key(model = model_fname, chroms = grid.chroms, block_windows = block_windows,
+                              **{ f"features{i}": Path(f) for i, f in enumerate(data['features']) })
+    blocks = _blocks(grid, block_windows)
+    telemetry = Telemetry(logger)
+
+    jobs = max(1, jobs)
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    with h5io.open_h5(output, 'a', logger) as h5fd:
+        _prepare(h5fd, key, grid, heads, blocks, logger)
+        todo = [ (chr, int(grid.offsets[c]), s, e) for c, chr in enumerate(grid.chroms)
+                 for b, (s, e) in enumerate(blocks[chr]) if not h5fd[f"progress/{chr}"][b] ]
+        skipped = sum([ len(b) for b in blocks.values() ]) - len(todo)
+        logger.info(f"{len(grid)} windows of {grid.resolution}, {len(todo)} blocks to predict, {skipped} already done, {jobs} processes")
+
+        def write(chr: str, start: int, rates: np.ndarray):
+            for i, cohort in enumerate(heads):
+                h5fd[_rates_name(cohort, grid, chr)][start: start + len(rates)] = rates[:, i]
+            h5fd[f"progress/{chr}"][blocks[chr].index((start, start + len(rates)))] = True
+            h5fd.flush()
+
+        init = (model_fname, threads, batch_size, autocast, telemetry)
+        start, windows = time.perf_counter(), 0
+        if jobs == 1:
+            _init_worker(*init)
+            for block in todo:
+                chr, s, rates = predict_block(*block)
+                write(chr, s, rates)
+                windows += len(rates)
+        else:
+            with ProcessPoolExecutor(max_workers = jobs, initializer = _init_worker, initargs = init) as executor:
+                futures = [ executor.submit(predict_block, *block) for block in todo ]
+                for future in as_completed(futures):
+                    chr, s, rates = future.result()
+                    write(chr, s, rates)
+                    windows += len(rates)
+                    logger.debug(f"{chr}:{s} {len(rates)} windows")
+        seconds = time.perf_counter() - start
+
+        for rslt in [ r for r in resolutions if r != grid.resolution ]:
+            _aggregate(h5fd, key, grid, heads, rslt)
+
+    report = {'windows': windows, 'blocks': len(todo), 'skipped': skipped, 'seconds': seconds,
+              'windows_per_sec': windows / seconds if seconds > 0 and windows > 0 else None}
+    logger.info(f"{windows} windows predicted in {seconds:.1f}s, {report['windows_per_sec'] or 0:.0f} windows/s")
+    telemetry.report(output.with_name(output.name + '.telemetry.json'), model = str(model_fname), jobs = jobs, **report)
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog = 'python -m run.predict_nn', description = 'genome-wide predictions of a model')
+    parser.add_argument('--model', required = True, help = 'model.pt of run.train_nn')
+    parser.add_argument('--output', required = True, help = 'h5 file of the predictions')
+    parser.add_argument('--resolutions', type = lambda v: [ int(r) for r in v.split(',') if r.strip() != '' ], default = [],
+                        help = 'comma separated coarser window sizes, multiples of the resolution of the model')
+    parser.add_argument('--jobs', type = int, default = 1, help = 'number of processes')
+    parser.add_argument('--batch-size', type = int, default = 8192)
+    parser.add_argument('--block-windows', type = int, default = 65536, help = 'windows of a unit of work')
+    parser.add_argument('--autocast', default = None, choices = list(AUTOCAST), help = 'reduced precision of the forward pass')
+    parser.add_argument('--logger', default = 'development', help = 'logger of config/logging_config.yaml')
+    args = parser.parse_args(argv)
+
+    predict(args.model, args.output, args.resolutions, args.jobs, args.batch_size, args.block_windows, args.autocast,
+            LogSingletonFactory().getLogger(args.logger))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+projection of the columns of the feature summaries on a few components, by blocks of windows :
+
+python -m run.project_features --features Epigenomics.h5 --resolutions 10000,100000 --components 32
+python -m run.project_features --features Epigenomics.h5 ReplicationTiming.h5 --method random --components 64
+
+The summary X.h5 is projected to X.{method}{components}.h5 next to it, with the tables {chr}/{rslt}_{overlap}
+(windows, components) and the projection matrix projection/{rslt}_{overlap} (columns, components), see
+datasets.project_features. pca keeps the leading principal components of the standardized columns, computed from
+their covariance in one pass over the windows, random is a gaussian random projection. The projected summary
+replaces the summary in the features of config/train.yaml, or data.projection projects every summary there.
+"""
+
+import sys
+import argparse
+
+from typing import List, Optional
+
+from config import LogSingletonFactory
+from datasets import PROJECTIONS, WindowGrid, project_features
+from mini_utils.bio import Genome
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog = 'python -m run.project_features', description = 'projection of the feature summaries')
+    parser.add_argument('--features', nargs = '+', required = True, help = 'summary h5 files of the window features')
+    parser.add_argument('--resolutions', type = lambda v: [ int(r) for r in v.split(',') if r.strip() != '' ], default = [10000],
+                        help = 'comma separated window sizes')
+    parser.add_argument('--overlap', type = int, default = 0)
+    parser.add_argument('--method', default = 'pca', choices = PROJECTIONS)
+    parser.add_argument('--components', type = int, default = 32)
+    parser.add_argument('--block-rows', type = int, default = 65536, help = 'windows read at once')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of the random projection')
+    parser.add_argument('--assembly', default = 'hg19', help = 'genome assembly of the summaries')
+    parser.add_argument('--chrom-sizes', default = None, help = 'chrom.sizes or bigWig file of the chromosome sizes of the assembly')
+    parser.add_argument('--chromosomes', type = lambda v: [ c.strip() for c in v.split(',') if c.strip() != '' ], default = None,
+                        help = 'comma separated chromosomes of the summaries, all by default')
+    parser.add_argument('--logger', default = 'development', help = 'logger of config/logging_config.yaml')
+    args = parser.parse_args(argv)
+
+    logger = LogSingletonFactory().getLogger(args.logger)
+    genome = Genome(args.assembly, chrom_sizes = args.chrom_sizes, chromosomes = args.chromosomes)
+    grids = [ WindowGrid(r, args.overlap, genome.chrom_sizes) for r in args.resolutions ]
+    for fname in args.features:
+        dst = project_features(fname, grids, args.method, args.components, args.block_rows, args.seed, logger)
+        logger.info(f"{fname} projected to {dst}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+the Gaussian process stage of a model trained by run.train_nn, on the embeddings of its last hidden layer :
+
+python -m run.train_gp --model models/model.pt --output models/gp.pt
+python -m run.train_gp --model models/model.pt --output models/gp.pt --inducing 1024 --epochs 20 --batch-size 4096
+
+The embeddings of every window (model.embed) are computed once by batches, then the sparse variational GP
+(models.gp.SparseGP) is fitted on shuffled minibatches of (embedding, mutation counts of each cohort), so that
+the memory and the time of an epoch are linear in the windows. The GP gives a mean and a variance per window
+and cohort, see SparseGP.predict.
+"""
+
+import sys
+import time
+import logging
+import argparse
+
+import torch
+
+from logging import Logger
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from config import LogSingletonFactory
+from models.gp import SparseGP, fit
+
+from .train_nn import WindowBatches, open_dataset
+from .predict_nn import load_model
+
+
+class _Shuffled(object):
+
+    """
+    the minibatches of (z, y) in a new order at each epoch
+    """
+
+    def __init__(self, z: torch.Tensor, y: torch.Tensor, batch_size: int, seed: int = 0) -> None:
+        self.z, self.y, self.batch_size = z, y, batch_size
+        self.generator = torch.Generator().manual_seed(seed)
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        order = torch.randperm(len(self.z), generator = self.generator)
+        for s in range(0, len(order), self.batch_size):
+            batch = order[s: s + self.batch_size]
+            yield self.z[batch], self.y[batch]
+
+def embed_windows(model: torch.nn.Module, batches: WindowBatches, batch_size: int = 8192) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    the embeddings (windows, dim) and the mutation counts (windows, n_heads) of every window, in the order of the windows
+    """
+    zs, ys = [], []
+    for s in range(0, len(batches), batch_size):
+        x, y = batches[list(range(s, min(len(batches), s + batch_size)))]
+        with torch.inference_mode():
+            zs.append(model.embed(x).float())
+        ys.append(y)
+    return torch.cat(zs), torch.cat(ys)
+
+def train_gp(model_fname: Union[str, Path], output: Union[str, Path], n_inducing: int = 512, epochs: int = 10,
+             batch_size: int = 4096, lr: float = 0.01, seed: int = 0, logger: Logger = logging.getLogger()) -> Dict[str, Any]:
+    """
+    fit the GP on the embeddings of the model and save it to output, return the loss of the epochs
+    """
+    checkpoint = torch.load(model_fname, map_location = 'cpu', weights_only = False)
+    model, data, heads = load_model(checkpoint), checkpoint['config']['data'], checkpoint['heads']
+    dataset = open_dataset(data, logger)
+    dataset.heads = heads
+
+    start = time.perf_counter()
+    z, y = embed_windows(model, WindowBatches(dataset, data['context']))
+    dataset.close_window_reader()
+    logger.info(f"{len(z)} embeddings of {z.shape[1]} dimensions in {time.perf_counter() - start:.1f}s")
+
+    torch.manual_seed(seed)
+    gp = SparseGP.from_embeddings(z, min(n_inducing, len(z)), len(heads), seed = seed)
+    start = time.perf_counter()
+    history = fit(gp, _Shuffled(z, y, batch_size, seed), len(z), epochs, lr)
+    seconds = time.perf_counter() - start
+    for epoch, loss in enumerate(history):
+        logger.info(f"epoch {epoch:>3} loss {loss:.4f}")
+    logger.info(f"{epochs} epochs in {seconds:.1f}s, {epochs * len(z) / seconds if seconds > 0 else 0:.0f} windows/s")
+
+    output = Path(output)
+    output.parent.mkdir(parents = True, exist_ok = True)
+    torch.save({'gp': gp.state_dict(), 'n_inducing': gp.inducing.shape[0], 'dim': gp.inducing.shape[1], 'heads': heads,
+                'model': str(model_fname), 'history': history}, output)
+    logger.info(f"GP saved to {output}")
+    return {'history': history, 'seconds': seconds, 'windows': len(z)}
+
+def load_gp(fname: Union[str, Path]) -> SparseGP:
+    saved = torch.load(fname, map_location = 'cpu', weights_only = False)
+    gp = SparseGP(torch.zeros(saved['n_inducing'], saved['dim']), len(saved['heads']))
+    gp.load_state_dict(saved['gp'])
+    return gp.eval()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog = 'python -m run.train_gp', description = 'sparse GP on the embeddings of a model')
+    parser.add_argument('--model', required = True, help = 'model.pt of run.train_nn')
+    parser.add_argument('--output', required = True, help = 'file of the GP')
+    parser.add_argument('--inducing', type = int, default = 512, help = 'number of inducing points')
+    parser.add_argument('--epochs', type = int, default = 10)
+    parser.add_argument('--batch-size', type = int, default = 4096)
+    parser.add_argument('--lr', type = float, default = 0.01)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--logger', default = 'development', help = 'logger of config/logging_config.yaml')
+    args = parser.parse_args(argv)
+
+    train_gp(args.model, args.output, args.inducing, args.epochs, args.batch_size, args.lr, args.seed,
+             LogSingletonFactory().getLogger(args.logger))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+training of the window models on the windows of a MAF dataset, configured by config/train.yaml :
+
+python -m run.train_nn --config config/train.yaml
+python -m run.train_nn --config config/train.yaml --epochs 1 --threads 32 --interop-threads 4 --workers 8
+
+The model predicts the log mutation rate of each cohort (head) from the features of a window, with a Poisson
+loss on the mutation counts of the windows. The model is WindowMLP, or DigDriverCNN on the stack of the window
+and its data.context neighbours on each side, compiled by torch.compile with model.compile.
+
+The batches are read by the DataLoader workers, one h5 read per table and batch (BioDigDriverfDataset.read_batch),
+and queued by a background thread ahead of the training loop, so that reading the next batches overlaps the
+forward and backward passes of the current one.
+
+threads     torch intra-op and inter-op threads of the training loop, the workers use one thread each
+autocast    the forward pass in bfloat16 (or float16) on the CPU, the loss and the weights stay in float32
+accumulate  the gradients of several batches per optimizer step, larger effective batches at the same memory
+
+Each epoch logs its loss, samples/s and the share of the time the loop waited for data, and is recorded as a
+telemetry stage, see mini_utils.telemetry. The model and the telemetry report are written to the output directory.
+"""
+
+import os
+import sys
+import copy
+import time
+import queue
+import logging
+import argparse
+import threading
+
+import numpy as np
+import torch
+import yaml
+
+from torch import nn
+from logging import Logger
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler, SequentialSampler
+
+from config import LogSingletonFactory
+from datasets import BioDigDriverfDataset, DietleinDataset, PCAWGDataset, WindowGrid, project_features
+from mini_utils.bio import Genome
+from mini_utils.telemetry import Telemetry
+from models.nets import DigDriverCNN, WindowMLP, compile_model
+
+DATASETS = {'PCAWG': PCAWGDataset, 'Dietlein': DietleinDataset}
+
+AUTOCAST = {'bfloat16': torch.bfloat16, 'float16': torch.float16}
+
+# the values missing in config/train.yaml
+DEFAULTS: Dict[str, Any] = {
+    'data': {'dataset': 'PCAWG', 'raw_path': None, 'h5_path': None, 'cohorts': None, 'resolution': 10000,
+             'overlap': 0, 'genome': None, 'features': [], 'context': 0, 'normalize': False,
+             'projection': None},
+    'threads': {'intra_op': None, 'inter_op': None},
+    'loader': {'batch_size': 1024, 'workers': 4, 'prefetch_factor': 4, 'prefetch': 8, 'pin_memory': True, 'shuffle': True},
+    'model': {'name': 'mlp', 'hidden': [256, 128], 'dropout': 0.1, 'conv_channels': [64, 64], 'kernel_size': 3,
+              'attention': True, 'compile': False},
+    'cv': {'folds': 5, 'jobs': 1, 'cache': None},
+    'optim': {'epochs': 10, 'lr': 0.001, 'weight_decay': 0., 'accumulate': 1, 'autocast': 'bfloat16', 'device': 'cpu', 'seed': 0},
+    'output': None,
+}
+
+def load_config(fname: str | Path) -> Dict[str, Any]:
+    with open(fname, 'r') as fd:
+        config = yaml.safe_load(fd) or {}
+    merged = copy.deepcopy(DEFAULTS)
+    for section, values in config.items():
+        if isinstance(merged.get(section), dict):
+            merged[section].update(values or {})
+        else:
+            merged[section] = values
+    check_model(merged['model'], merged['data']['context'])
+    return merged
+
+def configure_threads(intra_op: Optional[int], inter_op: Optional[int], logger: Logger):
+    intra_op = os.cpu_count() if intra_op is None else intra_op
+    torch.set_num_threads(intra_op)
+    if inter_op is not None:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # only once per process, before the first parallel work
+            logger.warning(f"inter-op threads already set to {torch.get_num_interop_threads()}, {inter_op} ignored")
+    logger.info(f"{torch.get_num_threads()} intra-op threads, {torch.get_num_interop_threads()} inter-op threads")
+
+
+class WindowBatches(Dataset):
+
+    """
+    the items are whole batches of windows, x : (batch, n_features) and y : (batch, n_heads) mutation counts,
+    read at once by read_batch instead of window by window and stacked again by the collate. With context,
+    x : (batch, 2 x context + 1, n_features) are the windows around each window, the windows past the ends of
+    the chromosome repeat the last window.
+    """
+
+    def __init__(self, dataset: BioDigDriverfDataset, context: int = 0) -> None:
+        self.dataset = dataset
+        self.context = context
+        self.grid = WindowGrid(dataset.resolutions[0], dataset.overlap, dataset.genome.chrom_sizes)
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    def _stacks(self, indices: List[int]) -> np.ndarray:
+        chrom_idx, rows = self.grid.locate(indices)
+        rows = rows[:, None] + np.arange(-self.context, self.context + 1)
+        rows = np.clip(rows, 0, self.grid.n_windows[chrom_idx][:, None] - 1)
+        return self.grid.offsets[chrom_idx][:, None] + rows
+
+    def __getitem__(self, indices: List[int]) -> Tuple[torch.Tensor, torch.Tensor]:
+        if self.context == 0:
+            x, y = self.dataset.read_batch(indices)
+        else:
+            stacks = self._stacks(indices)
+            x, y = self.dataset.read_batch(stacks.reshape(-1))
+            x = x.reshape(*stacks.shape, -1)
+            y = { h: v.reshape(stacks.shape)[:, self.context] for h, v in y.items() }
+        # the windows without signal in a bigWig track have NaN means
+        x = np.nan_to_num(x, copy = False)
+        # no heads to predict the windows
+        y = np.stack([ y[h] for h in self.dataset.heads ], axis = 1).astype(np.float32) if len(self.dataset.heads) > 0 \
+            else np.zeros((len(x), 0), dtype = np.float32)
+        return torch.from_numpy(x), torch.from_numpy(y)
+
+
+class Prefetcher(object):
+
+    """
+    iterates the loader in a background thread, up to `depth` batches ahead of the training loop.
+    The batches are copied to the device there, from page-locked memory when the loader pins them.
+    """
+
+    _END = object()
+
+    def __init__(self, loader: DataLoader, depth: int = 8, device: str = 'cpu') -> None:
+        self.loader = loader
+        self.depth = max(1, depth)
+        self.device = torch.device(device)
+
+    def _fill(self, batches: queue.Queue, stop: threading.Event):
+        try:
+            for x, y in self.loader:
+                if self.device.type != 'cpu':
+                    x, y = x.to(self.device, non_blocking = True), y.to(self.device, non_blocking = True)
+                while not stop.is_set():
+                    try:
+                        batches.put((x, y), timeout = 0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            batches.put(self._END)
+        except Exception as e:
+            batches.put(e)
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        batches, stop = queue.Queue(maxsize = self.depth), threading.Event()
+        thread = threading.Thread(target = self._fill, args = (batches, stop), daemon = True)
+        thread.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is self._END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    def __len__(self) -> int:
+        return len(self.loader)
+
+def open_dataset(data: Dict[str, Any], logger: Logger) -> BioDigDriverfDataset:
+    """
+    the dataset built by `python -m run build`, opened without building
+    """
+    cohorts = data['cohorts'] if data['cohorts'] is not None else 'all'
+    genome = Genome(**data['genome']) if data['genome'] is not None else None
+    dataset = DATASETS[data['dataset']](h5_path = data['h5_path'], raw_path = data['raw_path'], designed_subsets = cohorts,
+                                        resolutions = [data['resolution']], overlap = data['overlap'], logger = logger,
+                                        dry_run = True, genome = genome)
+    dataset.features = [ Path(f) for f in data['features'] ]
+    if data['projection'] is not None:
+        # the k components of each summary instead of its columns
+        grid = WindowGrid(dataset.resolutions[0], dataset.overlap, dataset.genome.chrom_sizes)
+        dataset.features = [ project_features(f, [grid], data['projection']['method'], data['projection']['components'], logger = logger)
+                             for f in dataset.features ]
+    dataset.heads = data['cohorts']
+    dataset.normalize = data['normalize']
+    if dataset.normalize:
+        dataset.prepare_normalization()
+    return dataset
+
+def check_model(model: Dict[str, Any], context: int):
+    # the cnn convolves the stack of the windows around each window, a single window isn't a stack
+    if model['name'] == 'cnn' and context < 1:
+        raise ValueError(f"model.name cnn needs data.context >= 1 windows on each side, {context} given")
+
+def build_model(model: Dict[str, Any], n_features: int, n_heads: int, context: int = 0) -> nn.Module:
+    if model['name'] == 'mlp':
+        return WindowMLP(n_features, n_heads, model['hidden'], model['dropout'])
+    if model['name'] == 'cnn':
+        check_model(model, context)
+        return DigDriverCNN(n_features, n_heads, conv_channels = model['conv_channels'], kernel_size = model['kernel_size'],
+                            hidden = model['hidden'], dropout = model['dropout'], attention = model['attention'])
+    raise ValueError(f"unknown model {model['name']}, expected mlp or cnn")
+
+def make_loader(dataset: BioDigDriverfDataset, loader: Dict[str, Any], device: str, seed: int = 0, context: int = 0) -> DataLoader:
+    batches = WindowBatches(dataset, context)
+    indices = RandomSampler(batches, generator = torch.Generator().manual_seed(seed)) if loader['shuffle'] else SequentialSampler(batches)
+    workers = loader['workers']
+    # page-locked memory only speeds up the copies to an accelerator
+    return DataLoader(batches, batch_size = None, sampler = BatchSampler(indices, loader['batch_size'], drop_last = False),
+                      num_workers = workers, pin_memory = loader['pin_memory'] and device != 'cpu',
+                      prefetch_factor = loader['prefetch_factor'] if workers > 0 else None,
+                      persistent_workers = workers > 0)
+
+def train_epoch(model: nn.Module, batches: Prefetcher, optimizer: torch.optim.Optimizer, loss_fn: nn.Module,
+                accumulate: int = 1, autocast: Optional[str] = None, device: str = 'cpu') -> Dict[str, Any]:
+    model.train()
+    device_type = torch.device(device).type
+    samples, total_loss, wait, steps = 0, 0., 0., 0
+    start = time.perf_counter()
+    optimizer.zero_grad(set_to_none = True)
+
+    n_batches = len(batches)
+    iterator = iter(batches)
+    for i in range(n_batches):
+        waited = time.perf_counter()
+        x, y = next(iterator)
+        wait += time.perf_counter() - waited
+
+        with torch.autocast(device_type, dtype = AUTOCAST.get(autocast, torch.bfloat16), enabled = autocast is not None):
+            log_rates = model(x)
+        loss = loss_fn(log_rates.float(), y)
+        (loss / accumulate).backward()
+        # the last batches of the epoch make a smaller step
+        if (i + 1) % accumulate == 0 or i + 1 == n_batches:
+            optimizer.step()
+            optimizer.zero_grad(set_to_none = True)
+            steps += 1
+
+        samples += len(x)
+        total_loss += loss.item() * len(x)
+    # the background thread stops
+    iterator.close()
+
+    seconds = time.perf_counter() - start
+    return {'samples': samples, 'steps': steps, 'loss': total_loss / samples if samples > 0 else None, 'seconds': seconds,
+            'samples_per_sec': samples / seconds if seconds > 0 else None, 'data_wait': wait / seconds if seconds > 0 else None}
+
+def train(config: Dict[str, Any], logger: Logger = logging.getLogger()) -> List[Dict[str, Any]]:
+    """
+    train the model of the config, return the statistics of the epochs
+    """
+    data, loader, optim = config['data'], config['loader'], config['optim']
+    configure_threads(config['threads']['intra_op'], config['threads']['inter_op'], logger)
+    torch.manual_seed(optim['seed'])
+    if optim['autocast'] is not None and optim['autocast'] not in AUTOCAST:
+        raise ValueError(f"autocast {optim['autocast']}, expected {list(AUTOCAST)} or null")
+
+    dataset = open_dataset(data, logger)
+    columns = dataset.feature_columns()
+    heads = list(dataset.heads)
+    # each worker opens its own file handles
+    dataset.close_window_reader()
+    logger.info(f"{len(dataset)} windows of {data['resolution']}, {len(columns)} features, heads {heads}")
+
+    net = build_model(config['model'], len(columns), len(heads), data['context']).to(optim['device'])
+    # the compiled model shares the parameters of net
+    model = compile_model(net) if config['model']['compile'] else net
+    optimizer = torch.optim.AdamW(net.parameters(), lr = optim['lr'], weight_decay = optim['weight_decay'])
+    loss_fn = nn.PoissonNLLLoss(log_input = True)
+    batches = Prefetcher(make_loader(dataset, loader, optim['device'], optim['seed'], data['context']), loader['prefetch'], optim['device'])
+
+    telemetry = Telemetry(logger)
+    history = []
+    for epoch in range(optim['epochs']):
+        with telemetry.stage('epoch', unit = f"epoch{epoch}") as record:
+            stats = train_epoch(model, batches, optimizer, loss_fn, optim['accumulate'], optim['autocast'], optim['device'])
+            record['rows'] = stats['samples']
+        history.append(dict(stats, epoch = epoch))
+        logger.info(f"epoch {epoch:>3} loss {stats['loss']:.4f} {stats['samples']:>9} samples {stats['seconds']:8.1f}s "
+                    f"{stats['samples_per_sec'] or 0:>10.0f} samples/s  data wait {100 * (stats['data_wait'] or 0):5.1f}%")
+
+    if config['output'] is not None:
+        output = Path(config['output'])
+        output.mkdir(parents = True, exist_ok = True)
+        torch.save({'model': net.state_dict(), 'config': config, 'features': columns, 'heads': heads, 'history': history},
+                   output.joinpath('model.pt'))
+        telemetry.report(output.joinpath('train.telemetry.json'), threads = torch.get_num_threads(),
+                         workers = loader['workers'], batch_size = loader['batch_size'], accumulate = optim['accumulate'])
+        logger.info(f"model saved to {output.joinpath('model.pt')}")
+    return history
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog = 'python -m run.train_nn', description = 'train the window models')
+    parser.add_argument('--config', default = 'config/train.yaml')
+    parser.add_argument('--logger', default = 'development', help = 'logger of config/logging_config.yaml')
+    parser.add_argument('--epochs', type = int, default = None)
+    parser.add_argument('--threads', type = int, default = None, help = 'intra-op threads')
+    parser.add_argument('--interop-threads', type = int, default = None, help = 'inter-op threads')
+    parser.add_argument('--workers', type = int, default = None, help = 'DataLoader processes')
+    parser.add_argument('--batch-size', type = int, default = None)
+    parser.add_argument('--output', default = None, help = 'directory of the model and the telemetry report')
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    overrides = {('optim', 'epochs'): args.epochs, ('threads', 'intra_op'): args.threads, ('threads', 'inter_op'): args.interop_threads,
+                 ('loader', 'workers'): args.workers, ('loader', 'batch_size'): args.batch_size}
+    for (section, key), value in overrides.items():
+        if value is not None:
+            config[section][key] = value
+    if args.output is not None:
+        config['output'] = args.output
+
+    train(config, LogSingletonFactory().getLogger(args.logger))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
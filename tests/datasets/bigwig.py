@@ -0,0 +1,142 @@
+import json
+import h5py
+import logging
+import tempfile
+import unittest
+
+from unittest import mock
+
+import numpy as np
+import pyBigWig
+
+from pathlib import Path
+
+from datasets import BioBigWigDataset, MappabilityDataset, WindowGrid, load_stats
+from mini_utils.bio import BigWigChromSizesDict, Chm, Genome
+
+def write_bigwig(fname: Path, value: float, n_intervals: int = 10, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    bw = pyBigWig.open(str(fname), 'w')
+    bw.addHeader([ (chr.name, size) for chr, size in BigWigChromSizesDict.items() ])
+    for chr, size in BigWigChromSizesDict.items():
+        starts = np.sort(rng.choice(size // 1000 - 1, n_intervals, replace=False)) * 1000
+        bw.addEntries([chr.name] * n_intervals, starts.tolist(), ends = (starts + 500).tolist(),
+                      values = (value + rng.random(n_intervals)).tolist())
+    bw.close()
+
+class TestBigWigBuildGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.raw_path = self.root.joinpath('raw')
+        self.raw_path.mkdir()
+        for i, mer in enumerate([24, 36]):
+            write_bigwig(self.raw_path.joinpath(f"wgEncodeCrgMapabilityAlign{mer}mer.bigWig"), value = i, seed = i)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _build(self, resolutions, genome = None):
+        return MappabilityDataset(h5_path = self.root.joinpath('h5'),
+                                  raw_path = self.raw_path,
+                                  resolutions = resolutions,
+                                  h5_chunk_size = 1,
+                                  design_mers = [24, 36],
+                                  logger = logging.getLogger(),
+                                  genome = genome)
+
+    def _built(self, dataset):
+        return sorted([ r['node'] for r in dataset.build_report if r['status'] == 'built' ])
+
+    def test_incremental_build(self):
+        dataset = self._build([50000000])
+        self.assertEqual(self._built(dataset), ['summary:50000000_0', 'track:wgEncodeCrgMapabilityAlign24mer:50000000_0',
+                                                'track:wgEncodeCrgMapabilityAlign36mer:50000000_0'])
+        del dataset
+
+        # only the new resolution is built
+        dataset = self._build([50000000, 100000000])
+        self.assertEqual(self._built(dataset), ['summary:100000000_0', 'track:wgEncodeCrgMapabilityAlign24mer:100000000_0',
+                                                'track:wgEncodeCrgMapabilityAlign36mer:100000000_0'])
+        with h5py.File(dataset.summary_h5_fname, 'r') as h5fd:
+            self.assertEqual(list(h5fd.attrs['columns']), ['Align24mer_mean', 'Align36mer_mean'])
+            self.assertEqual(h5fd['chr1/100000000_0'].shape, (3, 2))
+        # the telemetry of the last build
+        report = json.loads(self.root.joinpath('h5', 'Mappability.telemetry.json').read_text())
+        self.assertEqual(report['summary']['bigwig2df']['units'], 2 * 23)
+        self.assertEqual(report['summary']['build_h5']['rows'], report['summary']['bigwig2df']['rows'])
+        self.assertEqual(report['summary']['concat_summary']['units'], 23)
+        self.assertEqual(report['summary']['build']['units'], 1)
+        del dataset
+
+        # a new version of one file rebuilds its tracks and the summaries
+        write_bigwig(self.raw_path.joinpath("wgEncodeCrgMapabilityAlign36mer.bigWig"), value = 10, seed = 1)
+        dataset = self._build([50000000, 100000000])
+        self.assertEqual(self._built(dataset), ['summary:100000000_0', 'summary:50000000_0',
+                                                'track:wgEncodeCrgMapabilityAlign36mer:100000000_0',
+                                                'track:wgEncodeCrgMapabilityAlign36mer:50000000_0'])
+        with h5py.File(dataset.summary_h5_fname, 'r') as h5fd:
+            self.assertGreaterEqual(np.nanmin(h5fd['chr1/50000000_0'][:, 1]), 10)
+
+    def test_resume_interrupted_build(self):
+        dataset = self._build([50000000])
+        del dataset
+
+        # interrupted while building chr5 of the 36mer track : the node is not recorded, chr5 is staged
+        h5 = self.root.joinpath('h5', 'wgEncodeCrgMapabilityAlign36mer.h5')
+        with h5py.File(h5, 'a') as h5fd:
+            h5fd.move('chr5/50000000_0', 'chr5/.50000000_0.tmp')
+        manifest = self.root.joinpath('h5', 'Mappability.build.json')
+        recorded = json.loads(manifest.read_text())
+        del recorded['track:wgEncodeCrgMapabilityAlign36mer:50000000_0']
+        manifest.write_text(json.dumps(recorded))
+
+        with mock.patch.object(MappabilityDataset, '_bigwig2df', autospec = True, side_effect = BioBigWigDataset._bigwig2df) as bigwig2df:
+            dataset = self._build([50000000])
+        self.assertEqual([ c.args[2].name for c in bigwig2df.call_args_list ], ['chr5'])
+        self.assertEqual(self._built(dataset), ['summary:50000000_0', 'track:wgEncodeCrgMapabilityAlign36mer:50000000_0'])
+        with h5py.File(h5, 'r') as h5fd:
+            self.assertEqual(list(h5fd['chr5'].keys()), ['50000000_0'])
+
+    def test_getitem(self):
+        dataset = self._build([10000000, 50000000], Genome(chromosomes = ['chr21', 'chr22']))
+        sizes = Genome(chromosomes = ['chr21', 'chr22']).chrom_sizes
+        # one chunk of h5_chunk_size windows of 10 Mb, with the window of 50 Mb covering it
+        self.assertEqual(len(dataset), sum([ int(np.ceil(size / 10000000)) for size in sizes.values() ]))
+        n21 = int(np.ceil(sizes['chr21'] / 10000000))
+        with h5py.File(dataset.summary_h5_fname, 'r') as h5fd:
+            for index, chr, row in [(0, 'chr21', 0), (n21 - 1, 'chr21', n21 - 1), (n21, 'chr22', 0), (len(dataset) - 1, 'chr22', None)]:
+                df = dataset[index]
+                self.assertEqual(len(df), 2)
+                self.assertEqual(df['chrom'].tolist(), [Chm[chr].value] * 2)
+                self.assertEqual(list(df.columns), ['chrom', 'start', 'end', 'Align24mer_mean', 'Align36mer_mean'])
+                if row is not None:
+                    self.assertEqual(df['start'].iloc[0], row * 10000000)
+                    self.assertTrue(np.array_equal(df.iloc[0, 3:].to_numpy(dtype = float), h5fd[f"{chr}/10000000_0"][row], equal_nan = True))
+                self.assertTrue(np.array_equal(df.iloc[1, 3:].to_numpy(dtype = float), h5fd[f"{chr}/50000000_0"][df['start'].iloc[1] // 50000000],
+                                               equal_nan = True))
+        with self.assertRaises(IndexError):
+            dataset[len(dataset)]
+
+    def test_chromosome_subset(self):
+        dataset = self._build([10000000], Genome(chromosomes = ['chr21', 'chr22']))
+        with h5py.File(dataset.summary_h5_fname, 'r') as h5fd:
+            self.assertEqual(sorted(h5fd.keys()), ['chr21', 'chr22', 'stats'])
+            self.assertEqual(h5fd['chr21/10000000_0'].shape, (5, 2))
+            # the statistics of the columns are kept with the summary
+            stats = load_stats(h5fd, WindowGrid(10000000, 0, Genome(chromosomes = ['chr21', 'chr22']).chrom_sizes))
+            table = np.concatenate([h5fd['chr21/10000000_0'][:], h5fd['chr22/10000000_0'][:]])
+            # the windows without signal are NaN
+            self.assertEqual(stats.count.tolist(), (~np.isnan(table)).sum(axis = 0).tolist())
+            self.assertTrue(np.allclose(stats.mean, np.nanmean(table, axis = 0)))
+        report = json.loads(self.root.joinpath('h5', 'Mappability.telemetry.json').read_text())
+        self.assertEqual(report['summary']['bigwig2df']['units'], 2 * 2)
+        del dataset
+
+        # the whole genome keeps the chromosomes already built
+        dataset = self._build([10000000])
+        report = json.loads(self.root.joinpath('h5', 'Mappability.telemetry.json').read_text())
+        self.assertEqual(report['summary']['bigwig2df']['units'], 2 * 21)
+        with h5py.File(dataset.summary_h5_fname, 'r') as h5fd:
+            self.assertEqual(len(h5fd.keys()), 23 + 1)
@@ -0,0 +1,96 @@
+import logging
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from pathlib import Path
+
+from datasets import WindowGrid, fit_projection, project_features
+from mini_utils.bio import Genome
+from run.train_nn import load_config, open_dataset
+from tests.run.train_nn import write_training_inputs
+
+def write_low_rank(fname: Path, grid: WindowGrid, rank: int = 3, n_columns: int = 12, seed: int = 0):
+    """
+    a summary of n_columns columns of rank `rank` plus a small noise, a few NaN
+    """
+    rng = np.random.default_rng(seed)
+    mixing = rng.normal(size = (rank, n_columns))
+    with h5py.File(fname, 'w') as h5fd:
+        h5fd.attrs['columns'] = [ f"track{i}_mean" for i in range(n_columns) ]
+        for c, chr in enumerate(grid.chroms):
+            table = rng.normal(size = (int(grid.n_windows[c]), rank)) @ mixing + 0.01 * rng.normal(size = (int(grid.n_windows[c]), n_columns))
+            table[rng.random(table.shape) < 0.01] = np.nan
+            h5fd.create_dataset(grid.dataset_name(chr), data = table)
+
+class TestFeatureProjection(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.genome = Genome(chromosomes = ['chr1', 'chr2', 'chr21'])
+        self.grids = [ WindowGrid(r, 0, self.genome.chrom_sizes) for r in [1000000, 5000000] ]
+        self.fname = self.root.joinpath('Epigenomics.h5')
+        write_low_rank(self.fname, self.grids[0])
+        with h5py.File(self.fname, 'a') as h5fd:
+            for c, chr in enumerate(self.grids[1].chroms):
+                h5fd[self.grids[1].dataset_name(chr)] = h5fd[self.grids[0].dataset_name(chr)][::5]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_pca(self):
+        with h5py.File(self.fname, 'r') as h5fd:
+            projection = fit_projection(h5fd, self.grids[0], 'pca', 4, block_rows = 50)
+            table = np.concatenate([ h5fd[self.grids[0].dataset_name(chr)][:] for chr in self.grids[0].chroms ])
+        # the 3 components carry the variance of the columns
+        self.assertGreater(projection['explained'][:3].sum(), 0.99)
+        self.assertLess(projection['explained'][3], 0.01)
+        self.assertTrue(np.allclose(projection['matrix'].T @ projection['matrix'], np.eye(4), atol = 1e-8))
+
+        # the covariance of the blocks is the covariance of the whole table
+        z = np.nan_to_num((table - np.nanmean(table, axis = 0)) / np.nanstd(table, axis = 0))
+        values = np.linalg.eigvalsh(z.T @ z / len(z))[::-1]
+        self.assertTrue(np.allclose(projection['explained'], values[:4] / values.sum()))
+        with h5py.File(self.fname, 'r') as h5fd, self.assertRaises(ValueError):
+            fit_projection(h5fd, self.grids[0], 'pca', 13)
+
+    def test_project_features(self):
+        dst = project_features(self.fname, self.grids, 'pca', 3, block_rows = 64, logger = logging.getLogger())
+        self.assertEqual(dst.name, 'Epigenomics.pca3.h5')
+        with h5py.File(dst, 'r') as h5fd:
+            for grid in self.grids:
+                self.assertEqual(h5fd[grid.dataset_name('chr1')].shape, (int(grid.n_windows[0]), 3))
+                self.assertEqual(h5fd[f"projection/{grid.resolution}_0"].shape, (12, 3))
+            self.assertEqual(WindowGrid.columns(h5fd, 'chr1/1000000_0'), [ f"Epigenomics_pca{i}" for i in range(3) ])
+            rows = h5fd['chr1/1000000_0'][:]
+        # the components of the windows, decorrelated
+        self.assertTrue(np.isfinite(rows).all())
+        corr = np.corrcoef(rows.T)
+        self.assertLess(np.abs(corr[np.triu_indices(3, 1)]).max(), 0.2)
+
+        # up to date, the file is not written again
+        mtime = dst.stat().st_mtime_ns
+        self.assertEqual(project_features(self.fname, self.grids, 'pca', 3, logger = logging.getLogger()), dst)
+        self.assertEqual(dst.stat().st_mtime_ns, mtime)
+
+        # a random projection
+        dst = project_features(self.fname, self.grids[:1], 'random', 5, logger = logging.getLogger())
+        with h5py.File(dst, 'r') as h5fd:
+            self.assertEqual(h5fd['chr21/1000000_0'].shape[1], 5)
+            self.assertTrue(np.isnan(h5fd['projection/1000000_0'].attrs['explained']).all())
+
+    def test_dataset_source(self):
+        data = load_config(write_training_inputs(self.root))['data']
+        data['projection'] = {'method': 'pca', 'components': 2}
+        dataset = open_dataset(data, logging.getLogger())
+        self.assertEqual(dataset.features[0].name, 'features.pca2.h5')
+        self.assertEqual(len(dataset.feature_columns()), 2)
+        x, _ = dataset.read_batch(np.arange(10))
+        self.assertEqual(x.shape, (10, 2))
+        dataset.close_window_reader()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import logging
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from pathlib import Path
+
+from datasets import FeatureStats, load_stats, update_stats, write_stats
+from mini_utils import h5io
+from benchmarks.synthetic import write_summary
+from run.train_nn import load_config, open_dataset
+from tests.run.train_nn import write_training_inputs
+
+class TestFeatureStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_streaming(self):
+        rng = np.random.default_rng(0)
+        table = rng.normal(3., 2., (10000, 3))
+        table[rng.random(table.shape) < 0.1] = np.nan
+        # a constant column
+        table[:, 2] = 5.
+        stats = FeatureStats(3, sample_size = 2000)
+        for s in range(0, len(table), 777):
+            stats.update(table[s: s + 777])
+
+        self.assertTrue((stats.count == (~np.isnan(table)).sum(axis = 0)).all())
+        self.assertTrue(np.allclose(stats.mean, np.nanmean(table, axis = 0)))
+        self.assertTrue(np.allclose(stats.var, np.nanvar(table, axis = 0)))
+        self.assertTrue(np.allclose(stats.min, np.nanmin(table, axis = 0)))
+        self.assertTrue(np.allclose(stats.max, np.nanmax(table, axis = 0)))
+        self.assertEqual(len(stats.sample), 2000)
+        quantiles = stats.quantiles()
+        self.assertEqual(quantiles.shape, (len(FeatureStats.QUANTILES), 3))
+        self.assertTrue(np.allclose(quantiles[:, :2], np.nanquantile(table[:, :2], FeatureStats.QUANTILES, axis = 0), atol = 0.25))
+
+        shift, scale = stats.affine()
+        self.assertEqual(shift.dtype, np.float32)
+        self.assertEqual(scale[2], 1.)
+
+    def test_reuse(self):
+        fname = self.root.joinpath('features.h5')
+        grid = write_summary(fname, 10000000, n_columns = 4)
+        stats = update_stats(fname, grid, logging.getLogger())
+        with h5py.File(fname, 'r') as h5fd:
+            loaded = load_stats(h5fd, grid)
+            table = np.concatenate([ h5fd[grid.dataset_name(chr)][:] for chr in grid.chroms ])
+        self.assertTrue(np.allclose(loaded.mean, table.mean(axis = 0)))
+        self.assertTrue(np.allclose(loaded.quantiles(), stats.quantiles()))
+
+        # the statistics are out of date once a table is rebuilt
+        with h5py.File(fname, 'a') as h5fd:
+            ds = h5fd[grid.dataset_name(grid.chroms[0])]
+            ds[:] = ds[:] + 1
+            ds.attrs[h5io.CHECKPOINT] = 'rebuilt'
+            self.assertIsNone(load_stats(h5fd, grid))
+            self.assertIsNotNone(write_stats(h5fd, grid))
+            self.assertIsNotNone(load_stats(h5fd, grid))
+
+    def test_wide_summary(self):
+        # the quantiles of 1300 columns are larger than the 64 KB of an attribute
+        fname = self.root.joinpath('features.h5')
+        grid = write_summary(fname, 10000000, n_columns = 1300)
+        stats = update_stats(fname, grid, logging.getLogger())
+        with h5py.File(fname, 'r') as h5fd:
+            loaded = load_stats(h5fd, grid)
+            self.assertEqual(h5fd['stats/10000000_0/quantiles'].shape, (len(FeatureStats.QUANTILES), 1300))
+        self.assertEqual(len(loaded.count), 1300)
+        self.assertTrue(np.allclose(loaded.quantiles(), stats.quantiles(), equal_nan = True))
+
+    def test_normalized_batches(self):
+        data = load_config(write_training_inputs(self.root))['data']
+        raw = open_dataset(data, logging.getLogger())
+        x, _ = raw.read_batch(np.arange(316))
+        raw.close_window_reader()
+        data['normalize'] = True
+        dataset = open_dataset(data, logging.getLogger())
+        normalized, _ = dataset.read_batch(np.arange(316))
+        self.assertTrue(np.allclose(normalized, (x - x.mean(axis = 0)) / x.std(axis = 0), atol = 1e-4))
+        dataset.close_window_reader()
+
+if __name__ == '__main__':
+    unittest.main()
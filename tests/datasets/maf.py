@@ -0,0 +1,185 @@
+import h5py
+import logging
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+
+from datasets import PCAWGDataset, WindowGrid
+from mini_utils.bio import Genome
+
+def write_maf(fname: Path, n_rows: int, samples: list, seed: int = 0):
+    rng  = np.random.default_rng(seed)
+    subs = np.array(['C>A', 'C>G', 'C>T', 'T>A', 'T>C', 'T>G'])
+    mut  = rng.choice(subs, n_rows)
+    start = rng.integers(0, 1000000, n_rows)
+    maf_df = pd.DataFrame({
+        'CHROM':   rng.choice(['1', '2', 'X', 'Y'], n_rows),
+        'START':   start,
+        'END':     start + 1,
+        'REF':     [ m[0] for m in mut ],
+        'ALT':     [ m[2] for m in mut ],
+        'SAMPLE':  rng.choice(samples, n_rows),
+        'GENE':    rng.choice(['.', 'TP53', 'KRAS'], n_rows),
+        'ANNOT':   rng.choice(['Noncoding', 'Missense', 'Synonymous'], n_rows),
+        'MUT':     mut,
+        'CONTEXT': [ 'A' + m[0] + 'G' for m in mut ],
+    })
+    maf_df.to_csv(fname, sep='\t', header=False, index=False, compression='gzip')
+    return maf_df
+
+class TestMafConversion(unittest.TestCase):
+
+    subsets = ['Breast-AdenoCa', 'Breast-DCIS', 'Breast-LobularCa', 'Lymph-CLL']
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.raw_path = self.root.joinpath('raw')
+        self.raw_path.mkdir()
+        self.maf_dfs = {}
+        for i, subset in enumerate(self.subsets):
+            fname = self.raw_path.joinpath(f"{subset}_SNV_MNV_INDEL.ICGC.annot.txt.gz")
+            self.maf_dfs[subset] = write_maf(fname, 200, [ f"{subset}-s{k}" for k in range(5) ], seed = i)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _build(self, h5_path, concurrent):
+        return PCAWGDataset(h5_path = self.root.joinpath(h5_path),
+                            raw_path = self.raw_path,
+                            designed_subsets = self.subsets,
+                            logger = logging.getLogger(),
+                            concurrent = concurrent)
+
+    def test_concurrent_conversion(self):
+        serial   = self._build('serial', 0)
+        parallel = self._build('parallel', 2)
+
+        self.assertEqual(sorted([ r['cohort'] for r in parallel.build_report ]), sorted(self.subsets))
+        for r in parallel.build_report:
+            self.assertEqual(r['status'], 'built')
+            self.assertEqual(r['rows'], 200)
+
+        with h5py.File(serial.summary_h5_fname, 'r') as s_fd, h5py.File(parallel.summary_h5_fname, 'r') as p_fd:
+            for subset in self.subsets:
+                self.assertTrue((s_fd[subset]['mutations'][:] == p_fd[subset]['mutations'][:]).all())
+
+                mutations = p_fd[subset]['mutations']
+                columns = list(mutations.attrs['columns'])
+                table = mutations[:]
+                # chrY is not in the genome grid
+                maf_df = self.maf_dfs[subset]
+                self.assertEqual(len(table), (maf_df['CHROM'] != 'Y').sum())
+                indptr = p_fd[subset]['chrom_indptr'][:]
+                self.assertEqual(indptr[1] - indptr[0], (maf_df['CHROM'] == '1').sum())
+                chr1 = table[indptr[0]:indptr[1]]
+                self.assertTrue((np.diff(chr1[:, columns.index('START')]) >= 0).all())
+                samples = [ s.decode() for s in p_fd[subset]['samples'][:] ]
+                self.assertEqual(samples, sorted(maf_df['SAMPLE'].unique()))
+
+        # shards are kept on the next run
+        del serial, parallel
+        again = self._build('parallel', 2)
+        self.assertEqual({ r['status'] for r in again.build_report }, {'cached'})
+
+    def test_superset_merge(self):
+        # the same sample in two leaves
+        self.maf_dfs['Breast-DCIS'] = write_maf(self.raw_path.joinpath("Breast-DCIS_SNV_MNV_INDEL.ICGC.annot.txt.gz"),
+                                                200, ['Breast-DCIS-s0', 'Breast-AdenoCa-s0'], seed = 7)
+        dataset = PCAWGDataset(h5_path = self.root.joinpath('h5'),
+                               raw_path = self.raw_path,
+                               designed_subsets = ['Breast_tumors', 'Lymph-CLL'],
+                               logger = logging.getLogger())
+
+        # only the leaf files are converted
+        self.assertEqual([ Path(s).name.split('_SNV')[0] for s in dataset.source_list ],
+                         ['Breast-AdenoCa', 'Breast-DCIS', 'Breast-LobularCa', 'Lymph-CLL'])
+        self.assertIn('Breast_tumors', dataset.cohort_list)
+
+        with h5py.File(dataset.summary_h5_fname, 'r') as h5fd:
+            samples = [ s.decode() for s in h5fd['Breast_tumors']['samples'][:] ]
+            self.assertEqual(len(samples), len(set(samples)))
+            self.assertIn('Breast-AdenoCa-s0', samples)
+            maf_df = pd.concat([ self.maf_dfs[l] for l in ['Breast-AdenoCa', 'Breast-DCIS', 'Breast-LobularCa'] ])
+            # Breast-AdenoCa-s0 is taken from Breast-AdenoCa only
+            dcis = self.maf_dfs['Breast-DCIS']
+            expected = (maf_df['CHROM'] != 'Y').sum() - ((dcis['CHROM'] != 'Y') & (dcis['SAMPLE'] == 'Breast-AdenoCa-s0')).sum()
+            self.assertEqual(len(h5fd['Breast_tumors']['mutations']), expected)
+
+    def test_gene_index(self):
+        dataset = PCAWGDataset(h5_path = self.root.joinpath('h5'),
+                               raw_path = self.raw_path,
+                               designed_subsets = ['Breast_tumors', 'Lymph-CLL'],
+                               logger = logging.getLogger())
+
+        maf_df = pd.concat([ self.maf_dfs[l] for l in ['Breast-AdenoCa', 'Breast-DCIS', 'Breast-LobularCa'] ])
+        maf_df = maf_df[maf_df['CHROM'] != 'Y']
+        burden = dataset.gene_burden('Breast_tumors')
+        self.assertEqual(burden.index.tolist(), ['KRAS', 'TP53'])
+        self.assertEqual(burden.to_dict(), maf_df[maf_df['GENE'] != '.']['GENE'].value_counts().to_dict())
+
+        tp53 = dataset.gene_mutations('Breast_tumors', 'TP53')
+        self.assertEqual(len(tp53), (maf_df['GENE'] == 'TP53').sum())
+        self.assertTrue((tp53['GENE'] == burden.index.get_loc('TP53')).all())
+        self.assertEqual(len(dataset.gene_mutations('Lymph-CLL', 'EGFR')), 0)
+
+    def test_window_dataset(self):
+        # a feature summary at 100kb : one column with the window index, one with the chromosome
+        grid = WindowGrid(100000)
+        features = self.root.joinpath('features.h5')
+        with h5py.File(features, 'w') as h5fd:
+            for c, chr in enumerate(grid.chroms):
+                index = np.arange(grid.offsets[c], grid.offsets[c+1])
+                h5fd.create_dataset(grid.dataset_name(chr), data = np.stack([index, np.full(len(index), c)], axis=1).astype(float), chunks = (100, 2))
+            h5fd.attrs['columns'] = ['index', 'chrom']
+
+        dataset = PCAWGDataset(h5_path = self.root.joinpath('h5'),
+                               raw_path = self.raw_path,
+                               designed_subsets = ['Breast_tumors', 'Lymph-CLL'],
+                               resolutions = [100000, 1000000],
+                               logger = logging.getLogger(),
+                               features = [features])
+        self.assertEqual(len(dataset), len(grid))
+        # the files are opened by the first read, in the DataLoader workers
+        self.assertIsNone(getattr(dataset, 'window_fds', None))
+        self.assertEqual(dataset.feature_columns(), ['index', 'chrom'])
+
+        chr2 = grid.offsets[grid.chroms.index('chr2')]
+        indices = np.array([chr2 + 3, 0, 9, 5, chr2, len(grid) - 1, 5])
+        x, y = dataset.read_batch(indices)
+        self.assertEqual(x[:, 0].tolist(), indices.tolist())
+        self.assertEqual(sorted(y.keys()), ['Breast_tumors', 'Lymph-CLL'])
+
+        maf_df = self.maf_dfs['Lymph-CLL']
+        expected = []
+        for i in indices:
+            chr, row = ('2', i - chr2) if chr2 <= i < chr2 + grid.n_windows[1] else ('1', i)
+            start = maf_df[maf_df['CHROM'] == chr]['START']
+            expected.append(int(((start >= row * 100000) & (start < (row + 1) * 100000)).sum()) if i != len(grid) - 1 else 0)
+        self.assertEqual(y['Lymph-CLL'].tolist(), expected)
+
+        # an item is a row of the batch
+        item_x, item_y = dataset[int(indices[0])]
+        self.assertEqual(item_x.tolist(), x[0].tolist())
+        self.assertEqual(item_y['Lymph-CLL'], y['Lymph-CLL'][0])
+        batch = dataset.__getitems__(indices.tolist())
+        self.assertEqual(batch[3][1]['Breast_tumors'], y['Breast_tumors'][3])
+
+    def test_chromosome_subset(self):
+        genome = Genome(chromosomes = ['chr2'])
+        dataset = PCAWGDataset(h5_path = self.root.joinpath('h5'),
+                               raw_path = self.raw_path,
+                               designed_subsets = ['Lymph-CLL'],
+                               resolutions = [100000],
+                               logger = logging.getLogger(),
+                               genome = genome)
+        self.assertEqual(len(dataset), len(WindowGrid(100000, chrom_sizes = genome.chrom_sizes)))
+        maf_df = self.maf_dfs['Lymph-CLL']
+        with h5py.File(dataset.summary_h5_fname, 'r') as h5fd:
+            mutations = h5fd['Lymph-CLL']['mutations']
+            self.assertEqual(len(mutations), (maf_df['CHROM'] == '2').sum())
+            self.assertEqual(list(h5fd['Lymph-CLL']['counts'].keys()), ['chr2'])
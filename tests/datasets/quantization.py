@@ -0,0 +1,111 @@
+import json
+import h5py
+import logging
+import tempfile
+import unittest
+
+import numpy as np
+
+from pathlib import Path
+
+from datasets import MappabilityDataset, WindowGrid
+from datasets._Quantization import AFFINE, affine_params, decode, encode, encoding_error, read_decoded
+from mini_utils.bio import Genome
+from run.train_nn import load_config, open_dataset
+from tests.datasets.bigwig import write_bigwig
+from tests.run.train_nn import write_training_inputs
+
+class TestQuantization(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        rng = np.random.default_rng(0)
+        self.table = np.column_stack([rng.normal(0., 1., 1000), rng.random(1000) * 1e3, np.full(1000, 2.)])
+        self.table[rng.random(self.table.shape) < 0.05] = np.nan
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_codes(self):
+        valid = ~np.isnan(self.table)
+        for storage, rtol in [('float32', 1e-7), ('float16', 2 ** -11), ('bfloat16', 2 ** -8)]:
+            codes = encode(self.table, storage)
+            values = decode(codes, storage)
+            self.assertTrue((np.isnan(values) == ~valid).all())
+            self.assertTrue(np.allclose(values[valid], self.table[valid], rtol = rtol, atol = 0))
+        for storage in AFFINE:
+            scale, offset = affine_params(np.nanmin(self.table, axis = 0), np.nanmax(self.table, axis = 0), storage)
+            codes = encode(self.table, storage, scale, offset)
+            values = decode(codes, storage, scale, offset)
+            self.assertTrue((np.isnan(values) == ~valid).all())
+            error_max, error_sum, count = encoding_error(self.table, codes, storage, scale, offset)
+            # half a step of the codes, up to the float32 rounding
+            self.assertTrue((error_max <= scale / 2 * (1 + 1e-3) + 1e-6).all())
+            self.assertTrue((count == valid.sum(axis = 0)).all())
+            # the constant column is exact
+            self.assertEqual(error_max[2], 0.)
+        # bfloat16 rounds to the nearest even
+        self.assertEqual(encode(np.array([1. + 2 ** -8]), 'bfloat16')[0], encode(np.array([1.]), 'bfloat16')[0])
+
+    def _build(self, storage):
+        return MappabilityDataset(h5_path = self.root.joinpath(storage), raw_path = self.root.joinpath('raw'), resolutions = [1000000],
+                                  h5_chunk_size = 1, design_mers = [24, 36], logger = logging.getLogger(),
+                                  genome = Genome(chromosomes = ['chr21', 'chr22']), storage = storage)
+
+    def test_summary_storage(self):
+        self.root.joinpath('raw').mkdir()
+        for i, mer in enumerate([24, 36]):
+            write_bigwig(self.root.joinpath('raw', f"wgEncodeCrgMapabilityAlign{mer}mer.bigWig"), value = 10 * i, n_intervals = 400, seed = i)
+        reference = self._build('float64')
+        with h5py.File(reference.summary_h5_fname, 'r') as h5fd:
+            expected = np.concatenate([ h5fd[f"{chr}/1000000_0"][:] for chr in ['chr21', 'chr22'] ])
+        valid = ~np.isnan(expected)
+        self.assertFalse(self.root.joinpath('float64', 'Mappability.1000000_0.quantization.json').exists())
+
+        for storage, itemsize in [('float16', 2), ('bfloat16', 2), ('int8', 1), ('uint16', 2)]:
+            dataset = self._build(storage)
+            with h5py.File(dataset.summary_h5_fname, 'r') as h5fd:
+                self.assertEqual(h5fd['chr21/1000000_0'].dtype.itemsize, itemsize)
+                values = np.concatenate([ read_decoded(h5fd[f"{chr}/1000000_0"]) for chr in ['chr21', 'chr22'] ])
+            self.assertTrue((np.isnan(values) == ~valid).all())
+            error = np.abs(values - expected)
+
+            report = json.loads(self.root.joinpath(storage, 'Mappability.1000000_0.quantization.json').read_text())
+            self.assertEqual(report['storage'], storage)
+            self.assertEqual(report['columns'], ['Align24mer_mean', 'Align36mer_mean'])
+            self.assertTrue(np.allclose(report['max_abs_error'], np.nanmax(np.where(valid, error, np.nan), axis = 0), rtol = 1e-3, atol = 1e-6))
+            self.assertTrue(np.allclose(report['mean_abs_error'], np.nanmean(np.where(valid, error, np.nan), axis = 0), rtol = 1e-3, atol = 1e-6))
+            if storage in AFFINE:
+                # one scale per column on every chromosome
+                with h5py.File(dataset.summary_h5_fname, 'r') as h5fd:
+                    self.assertTrue(np.array_equal(h5fd['chr21/1000000_0'].attrs['scale'], h5fd['chr22/1000000_0'].attrs['scale']))
+            del dataset
+
+    def test_fused_read(self):
+        data = load_config(write_training_inputs(self.root))['data']
+        dataset = open_dataset(data, logging.getLogger())
+        expected, _ = dataset.read_batch(np.arange(316))
+        dataset.close_window_reader()
+
+        # the same features stored as uint16 codes
+        fname, grid = self.root.joinpath('features.uint16.h5'), WindowGrid(10000000, 0, Genome().chrom_sizes)
+        with h5py.File(data['features'][0], 'r') as src, h5py.File(fname, 'w') as dst:
+            dst.attrs['columns'] = src.attrs['columns']
+            tables = [ src[grid.dataset_name(chr)][:] for chr in grid.chroms ]
+            scale, offset = affine_params(np.min([ t.min(axis = 0) for t in tables ], axis = 0),
+                                          np.max([ t.max(axis = 0) for t in tables ], axis = 0), 'uint16')
+            for chr, table in zip(grid.chroms, tables):
+                ds = dst.create_dataset(grid.dataset_name(chr), data = encode(table, 'uint16', scale, offset))
+                ds.attrs.update(storage = 'uint16', scale = scale, offset = offset)
+        data['features'] = [str(fname)]
+        for normalize in [False, True]:
+            data['normalize'] = normalize
+            dataset = open_dataset(data, logging.getLogger())
+            x, _ = dataset.read_batch(np.arange(316))
+            dataset.close_window_reader()
+            reference = (expected - expected.mean(axis = 0)) / expected.std(axis = 0) if normalize else expected
+            self.assertTrue(np.allclose(x, reference, atol = 1e-3))
+
+if __name__ == '__main__':
+    unittest.main()
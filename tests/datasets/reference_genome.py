@@ -0,0 +1,110 @@
+import gzip
+import h5py
+import logging
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+
+from datasets import ReferenceGenomeDataset, BioDigDriverfDataset
+from mini_utils import bio
+
+def write_fasta(fname: Path, chroms: dict, line_width: int = 50):
+    with gzip.open(fname, 'wt') as fd:
+        for chr, seq in chroms.items():
+            fd.write(f">{chr}\n")
+            for i in range(0, len(seq), line_width):
+                fd.write(seq[i:i+line_width] + "\n")
+
+class TestReferenceGenomeDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        rng  = np.random.default_rng(0)
+        self.chroms = {
+            'chr1':  ''.join(rng.choice(list('ACGTacgt'), 1001)),
+            'chrUn': 'ACGT' * 10,
+            'chr2':  'NNNNN' + ''.join(rng.choice(list('ACGT'), 97)) + 'NN' + 'ACGTA',
+        }
+        write_fasta(root.joinpath('test.fa.gz'), self.chroms)
+        self.genome = ReferenceGenomeDataset(h5_path = root.joinpath('h5'),
+                                             raw_path = root,
+                                             fasta_fname = 'test.fa.gz',
+                                             chromosomes = ['chr1', 'chr2'],
+                                             logger = logging.getLogger())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sequences(self):
+        self.assertEqual(self.genome.chrom_sizes, {'chr1': 1001, 'chr2': 109})
+        self.assertEqual(self.genome.sequence('chr1', 0, 1001), self.chroms['chr1'].upper())
+        self.assertEqual(self.genome.sequence('2', 0, 109), self.chroms['chr2'])
+        # out of the chromosome
+        self.assertEqual(self.genome.sequence('chr1', 998, 1003), self.chroms['chr1'][998:].upper() + 'NN')
+
+    def test_fasta_source(self):
+        root   = Path(self.tmp.name)
+        genome = bio.Genome(chromosomes = ['chr1', 'chr2'], fasta = 'https://example.org/hg19/test.fa.gz')
+        # the URL of the genome replaces the mirror, the file already downloaded is reused
+        dataset = ReferenceGenomeDataset(h5_path = root.joinpath('h5'),
+                                         raw_path = root,
+                                         logger = logging.getLogger(),
+                                         genome = genome)
+        self.assertEqual(dataset.source_list, ['https://example.org/hg19/test.fa.gz'])
+        self.assertEqual(dataset.chrom_sizes, {'chr1': 1001, 'chr2': 109})
+
+    def test_contexts(self):
+        chrs = np.array(['1'] * 300 + ['2'] * 109)
+        positions = np.concatenate([np.arange(300), np.arange(109)])
+        codes = self.genome.contexts(chrs, positions, 5)
+
+        padded = {c: 'NN' + self.chroms[f"chr{c}"].upper() + 'NN' for c in ['1', '2']}
+        expected = bio.encode_context_strings([ padded[c][p:p+5] for c, p in zip(chrs, positions) ], 5)
+        self.assertEqual(codes.tolist(), expected.tolist())
+        self.assertEqual(codes[300:305].tolist(), [-1] * 5)
+
+    def test_fill_maf_contexts(self):
+        maf = BioDigDriverfDataset.__new__(BioDigDriverfDataset)
+        maf.logger = logging.getLogger()
+        maf.reference_genome = self.genome
+        maf_df = pd.DataFrame({'CHROM':   ['1', '1', '2'],
+                               'START':   [10, 20, 50],
+                               'ANNOT':   ['Noncoding', 'Noncoding', 'INDEL'],
+                               'CONTEXT': ['ACG', '.', '.']})
+        codes = maf._encode_context_column(maf_df, 3)
+        self.assertEqual(codes[0], bio.encode_context_strings(['ACG'], 3)[0])
+        self.assertEqual(codes[1], bio.encode_context_strings([self.chroms['chr1'][19:22]], 3)[0])
+        self.assertEqual(codes[2], -1)
+
+    def test_context_composition(self):
+        self.genome.slice_len = 64
+        resolutions = [10, 25]
+        # the windows without overlap are the blocks of the counts
+        for overlap, concurrent in [(5, 2), (0, 0)]:
+            h5_fname = self.genome.build_context_composition(resolutions = resolutions, overlap = overlap, N_grams = [3, 5], concurrent = concurrent)
+
+            names = { n: (bio.N_gram_names(n), bio.N_gram_names(n, collapse=True)) for n in [3, 5] }
+            with h5py.File(h5_fname, 'r') as h5fd:
+                columns = list(h5fd[f"chr1/10_{overlap}"].attrs['columns'])
+                self.assertEqual(len(columns), 32 + 512)
+                for chr, seq in [('chr1', self.chroms['chr1'].upper()), ('chr2', self.chroms['chr2'])]:
+                    padded = 'NN' + seq + 'NN'
+                    for rslt in resolutions:
+                        counts = h5fd[f"{chr}/{rslt}_{overlap}"][:]
+                        starts = np.arange(0, len(seq), rslt - overlap)
+                        self.assertEqual(counts.shape, (len(starts), len(columns)))
+                        for w, s in enumerate(starts):
+                            for n, offset in [(3, 0), (5, 32)]:
+                                positions = np.arange(s, min(s + rslt, len(seq)))
+                                ctx = [ padded[p + 2 - n // 2: p + 2 - n // 2 + n] for p in positions ]
+                                codes = bio.encode_context_strings(ctx, n, collapse=True)
+                                all_names, kept_names = names[n]
+                                expected = np.zeros(len(kept_names), dtype=int)
+                                for c in codes[codes >= 0]:
+                                    expected[kept_names.index(all_names[c])] += 1
+                                self.assertEqual(counts[w, offset: offset + len(kept_names)].tolist(), expected.tolist())
@@ -1,7 +1,97 @@
-from logging import getLogger
-from os import getcwd
+import gzip
+import h5py
+import logging
+import tempfile
+import unittest
+
+import pyBigWig
+
 from pathlib import Path
-from typing import List
 
-from datasets import BioBigWigDataset
+from benchmarks import loader
+from benchmarks.conversion import compare, run_benchmarks
+from benchmarks.synthetic import write_bigwig, write_maf, write_summary
+
+class TestSyntheticInputs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bigwig(self):
+        fname = self.root.joinpath('track.bigWig')
+        n = write_bigwig(fname, density = 2, value = 3., chrom_sizes = {'chr1': 5000000, 'chr2': 2000000})
+        self.assertEqual(n, 14)
+        with pyBigWig.open(str(fname)) as bw:
+            self.assertEqual(bw.chroms(), {'chr1': 5000000, 'chr2': 2000000})
+            intervals = bw.intervals('chr1')
+        self.assertEqual(len(intervals), 10)
+        self.assertTrue(all([ 3. <= v < 4. and e - s == 500 for s, e, v in intervals ]))
+
+    def test_maf(self):
+        fname = self.root.joinpath('Lymph-CLL.txt.gz')
+        maf_df = write_maf(fname, 500, n_samples = 4, cohort = 'Lymph-CLL', chroms = ['chr1', 'chrX'])
+        with gzip.open(fname, 'rt') as fd:
+            lines = fd.read().splitlines()
+        self.assertEqual(len(lines), 500)
+        self.assertEqual(set(maf_df['CHROM']), {'1', 'X'})
+        self.assertEqual(maf_df['SAMPLE'].nunique(), 4)
+        self.assertTrue((maf_df['CONTEXT'].str[1] == maf_df['REF']).all())
+
+    def test_summary(self):
+        fname = self.root.joinpath('summary.h5')
+        grid = write_summary(fname, 1000000, n_columns = 3, chunk_rows = 50, backend = 'gzip')
+        with h5py.File(fname, 'r') as h5fd:
+            ds = h5fd[grid.dataset_name('chr1')]
+            self.assertEqual(ds.shape, (grid.n_windows[0], 3))
+            self.assertEqual(ds.chunks, (50, 3))
+            self.assertEqual(ds.compression, 'gzip')
+            self.assertEqual(len(h5fd.attrs['columns']), 3)
+
+class TestConversionBenchmarks(unittest.TestCase):
+
+    def test_tiny(self):
+        results = run_benchmarks(['tiny'], repeat = 1, logger = logging.getLogger('benchmarks'))
+        benches = results['results']['tiny']
+        self.assertEqual(set(benches), {'bigwig_build_h5', 'concat_summary', 'bigwig_summary', 'maf_build_h5'})
+        self.assertEqual(benches['maf_build_h5']['rows'], 1000)
+        # 2 tracks of the same windows
+        self.assertEqual(benches['bigwig_build_h5']['rows'], 2 * benches['bigwig_summary']['rows'])
+        self.assertTrue(all([ b['rows_per_sec'] > 0 for b in benches.values() ]))
+
+        self.assertEqual(compare(results, results), [])
+        faster = {'results': {'tiny': { k: dict(v, rows_per_sec = 2 * v['rows_per_sec']) for k, v in benches.items() }}}
+        self.assertEqual(len(compare(results, faster, tolerance = 0.25)), 4)
+        self.assertEqual(compare(results, faster, tolerance = 0.6), [])
+
+class TestLoaderBenchmarks(unittest.TestCase):
+
+    def test_sweep(self):
+        results = loader.run_benchmarks(kinds = ['features', 'mutations'], backends = ['chunked'], chunk_sizes = [100],
+                                        caching = ['default', 'core'], workers = [0, 1], batch_sizes = [64], batches = 3,
+                                        resolution = 1000000, maf_rows = 200, logger = logging.getLogger('benchmarks'))
+        self.assertEqual(results['config']['resolution'], 1000000)
+        for kind in ['features', 'mutations']:
+            self.assertEqual(sorted(results['results'][kind]), ['chunked/chunk100/core/w0/b64', 'chunked/chunk100/core/w1/b64',
+                                                                'chunked/chunk100/default/w0/b64', 'chunked/chunk100/default/w1/b64'])
+            for r in results['results'][kind].values():
+                self.assertEqual(r['batches'], 3)
+                self.assertGreater(r['samples_per_sec'], 0)
+                self.assertLessEqual(r['p50'], r['p99'])
+                self.assertGreater(r['bytes_per_sample'], 0)
+
+    def test_batches_larger_than_windows(self):
+        # 316 windows, the first batch only
+        results = loader.run_benchmarks(kinds = ['features'], backends = ['chunked'], chunk_sizes = [100], caching = ['default'],
+                                        workers = [0], batch_sizes = [256], batches = 3, resolution = 10000000, maf_rows = 200,
+                                        logger = logging.getLogger('benchmarks'))
+        r = results['results']['features']['chunked/chunk100/default/w0/b256']
+        self.assertEqual(r['batches'], 0)
+        self.assertIsNone(r['samples_per_sec'])
+        self.assertIsNone(r['p50'])
 
+if __name__ == '__main__':
+    unittest.main()
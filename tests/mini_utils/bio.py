@@ -0,0 +1,97 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pyBigWig
+
+from pathlib import Path
+
+from mini_utils import bio
+
+class TestNGramEncoding(unittest.TestCase):
+
+    def test_same_value_as_enum(self):
+        context3 = bio.build_N_gram_nucl_enum(3)
+        names = [ e.name for e in context3 ]
+        codes = bio.encode_context_strings(names, 3)
+        self.assertEqual(codes.tolist(), [ e.value for e in context3 ])
+
+    def test_center_and_missing_context(self):
+        codes = bio.encode_context_strings(['TCG', 'ATCGA', '.', ' TCG ', 'TNG'], 3)
+        self.assertEqual(codes.tolist(), [19, 19, -1, 19, -1])
+
+    def test_nan_context(self):
+        codes = bio.encode_context_strings(['ATCGA', float('nan'), None], 5)
+        self.assertEqual(codes.tolist()[1:], [-1, -1])
+        self.assertEqual(bio.encode_context_strings(np.array([np.nan, np.nan]), 5).tolist(), [-1, -1])
+
+    def test_short_context_raises(self):
+        with self.assertRaises(ValueError):
+            bio.encode_context_strings(['TCG', 'TC'], 3)
+
+    def test_rolling_matches_strings(self):
+        seq = 'ACGTTGCANACGGT'
+        N = 5
+        rolling = bio.rolling_N_gram(bio.nucl2codes(seq), N)
+        expected = bio.encode_context_strings([ seq[i:i+N] for i in range(len(seq)-N+1) ], N)
+        self.assertEqual(rolling.tolist(), expected.tolist())
+
+    def test_revcomp_and_collapse(self):
+        # TCG -> CGA
+        self.assertEqual(int(bio.revcomp_N_gram(19, 3)), int('032', base = 4))
+
+        N = 11
+        rng = np.random.default_rng(0)
+        seqs = [ ''.join(rng.choice(list('ACGT'), N)) for _ in range(100) ]
+        rc_seqs = [ s[::-1].translate(str.maketrans('ACGT', 'TGCA')) for s in seqs ]
+        codes    = bio.encode_context_strings(seqs, N, collapse=True)
+        rc_codes = bio.encode_context_strings(rc_seqs, N, collapse=True)
+        self.assertTrue((codes == rc_codes).all())
+        # the center of the kept strand is a pyrimidine
+        center = (codes >> (2 * (N // 2))) & 3
+        self.assertTrue((center < bio.NUCLEOTIDE_ENUM.A.value).all())
+
+    def test_collapsed_names(self):
+        self.assertEqual(len(bio.N_gram_names(3, collapse=True)), 32)
+        self.assertEqual(len(bio.N_gram_names(4, collapse=True)), 136)
+
+class TestGenome(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_default_and_subset(self):
+        genome = bio.Genome()
+        self.assertEqual(genome.chroms, [ c.name for c in bio.Chm ])
+        self.assertEqual(genome.size(bio.Chm.chr21), bio.BigWigChromSizesDict[bio.Chm.chr21])
+
+        # in the order of Chm, MAF names are accepted
+        genome = bio.Genome(chromosomes = ['X', 'chr21'])
+        self.assertEqual(genome.chroms, ['chr21', 'chrX'])
+        self.assertEqual(genome.chms, [bio.Chm.chr21, bio.Chm.chrX])
+        self.assertIn('21', genome)
+        self.assertNotIn('chr1', genome)
+
+        with self.assertRaises(ValueError):
+            bio.Genome(chromosomes = ['chrY'])
+        with self.assertRaises(ValueError):
+            bio.Genome('hg38')
+
+    def test_chrom_sizes(self):
+        fname = self.root.joinpath('hg38.chrom.sizes')
+        fname.write_text("chr1\t248956422\nchrY\t57227415\nchr21\t46709983\nchr1_KI270706v1_random\t175055\n")
+        genome = bio.Genome('hg38', chrom_sizes = fname)
+        self.assertEqual(genome.chrom_sizes, {'chr1': 248956422, 'chr21': 46709983})
+        with self.assertRaises(ValueError):
+            bio.Genome('hg38', chrom_sizes = fname, chromosomes = ['chr2'])
+
+        bigwig = self.root.joinpath('track.bigWig')
+        bw = pyBigWig.open(str(bigwig), 'w')
+        bw.addHeader([('chr21', 46709983), ('chr22', 50818468)])
+        bw.close()
+        genome = bio.Genome('hg38', chrom_sizes = bigwig, chromosomes = ['chr22'])
+        self.assertEqual(genome.chrom_sizes, {'chr22': 50818468})
@@ -0,0 +1,98 @@
+import json
+import time
+import tempfile
+import unittest
+
+from pathlib import Path
+from functools import partial
+
+from mini_utils.build_graph import BuildGraph
+
+def write(fname: Path, text: str):
+    fname.write_text(text)
+    return len(text)
+
+def append(fname: Path, log: Path, name: str):
+    # the intervals of the writers of fname
+    start = time.time()
+    time.sleep(0.2)
+    with open(fname, 'a') as fd:
+        fd.write(name)
+    with open(log, 'a') as fd:
+        fd.write(f"{start} {time.time()}\n")
+
+def fail():
+    raise RuntimeError("failed node")
+
+class TestBuildGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.source = self.root.joinpath('source.txt')
+        self.source.write_text('abc')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _graph(self, resolution = 10, extra = False):
+        graph = BuildGraph(self.root.joinpath('build.json'))
+        graph.add('track', fn = partial(write, self.root.joinpath('track'), 'track'), params = {'resolution': resolution},
+                  sources = [self.source], outputs = [self.root.joinpath('track')])
+        graph.add('other', fn = partial(write, self.root.joinpath('other'), 'other'), outputs = [self.root.joinpath('other')])
+        graph.add('summary', fn = partial(write, self.root.joinpath('summary'), 'summary'), deps = ['track', 'other'],
+                  outputs = [self.root.joinpath('summary')])
+        if extra:
+            graph.add('extra', fn = fail)
+            graph.add('after_extra', fn = partial(write, self.root.joinpath('after'), 'after'), deps = ['extra'])
+        return graph
+
+    def _status(self, report):
+        return { r['node']: r['status'] for r in report }
+
+    def test_only_stale_nodes_are_built(self):
+        self.assertEqual(set(self._status(self._graph().run()).values()), {'built'})
+        self.assertEqual(set(self._status(self._graph().run()).values()), {'fresh'})
+
+        # a parameter changes the node and its dependents
+        plan = dict(self._graph(resolution = 20).plan())
+        self.assertEqual(plan, {'track': 'stale', 'other': 'fresh', 'summary': 'stale'})
+        self.assertEqual(self._status(self._graph(resolution = 20).run(concurrent = 2)),
+                         {'track': 'built', 'other': 'fresh', 'summary': 'built'})
+
+        # a missing output, or a source changed
+        self.root.joinpath('other').unlink()
+        self.assertEqual(dict(self._graph(resolution = 20).plan()), {'track': 'fresh', 'other': 'missing', 'summary': 'stale'})
+        self._graph(resolution = 20).run()
+        self.source.write_text('abcd')
+        self.assertEqual(dict(self._graph(resolution = 20).plan())['track'], 'stale')
+        self.assertEqual(dict(self._graph(resolution = 20).plan(force = True))['other'], 'stale')
+
+    def test_shared_output(self):
+        # the nodes writing the same file are serialized, without a resource
+        graph = BuildGraph(self.root.joinpath('build.json'))
+        shared, log = self.root.joinpath('shared.h5'), self.root.joinpath('log')
+        for name in ['a', 'b', 'c']:
+            graph.add(name, fn = partial(append, shared, log, name), outputs = [(shared, name)])
+        graph.add('other', fn = partial(write, self.root.joinpath('other'), 'other'), outputs = [self.root.joinpath('other')])
+        self.assertEqual(graph.nodes['a'].resources(), [str(shared)])
+        graph.run(concurrent = 3)
+        intervals = sorted([ tuple(map(float, line.split())) for line in log.read_text().splitlines() ])
+        self.assertEqual(len(intervals), 3)
+        for (_, end), (start, _) in zip(intervals[:-1], intervals[1:]):
+            self.assertLessEqual(end, start)
+
+    def test_failed_node(self):
+        report = self._status(self._graph(extra = True).run())
+        self.assertEqual(report['extra'], 'failed')
+        self.assertEqual(report['after_extra'], 'skipped')
+        self.assertEqual(report['summary'], 'built')
+        with open(self.root.joinpath('build.json')) as fd:
+            self.assertNotIn('extra', json.load(fd))
+
+    def test_cycle(self):
+        graph = BuildGraph(self.root.joinpath('build.json'))
+        graph.add('a', deps = ['b'])
+        graph.add('b', deps = ['a'])
+        with self.assertRaises(ValueError):
+            graph.order()
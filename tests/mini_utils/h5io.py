@@ -0,0 +1,57 @@
+import h5py
+import logging
+import tempfile
+import unittest
+
+import numpy as np
+
+from pathlib import Path
+
+from mini_utils import h5io
+
+class TestCheckpointedWrites(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_interrupted_unit(self):
+        source = self.root.joinpath('source.txt')
+        source.write_text('abc')
+        key = h5io.checkpoint_key(source = source, resolution = 10)
+
+        with h5io.open_h5(self.root.joinpath('units.h5')) as h5fd:
+            h5io.write_unit(h5fd, 'chr1/10_0', key, data = np.arange(5))
+            # a unit interrupted before its commit
+            h5fd.create_dataset('chr2/10_0', data = np.arange(2))
+            staged = h5io.create_staged(h5fd, 'chr2/10_0', shape = (5,), dtype = int)
+            staged[:2] = 1
+
+        with h5io.open_h5(self.root.joinpath('units.h5')) as h5fd:
+            self.assertTrue(h5io.is_complete(h5fd, 'chr1/10_0', key))
+            self.assertFalse(h5io.is_complete(h5fd, 'chr2/10_0', key))
+            # the next write drops the staged dataset, and replaces the incomplete one
+            h5io.write_unit(h5fd, 'chr2/10_0', key, data = np.arange(5) * 2)
+            self.assertEqual(h5fd['chr2/10_0'][:].tolist(), [0, 2, 4, 6, 8])
+            self.assertEqual(sorted(h5fd['chr2'].keys()), ['10_0'])
+
+        # a new version of the source
+        source.write_text('abcd')
+        with h5io.open_h5(self.root.joinpath('units.h5')) as h5fd:
+            self.assertFalse(h5io.is_complete(h5fd, 'chr1/10_0', h5io.checkpoint_key(source = source, resolution = 10)))
+
+    def test_quarantine_corrupted_file(self):
+        fname = self.root.joinpath('corrupted.h5')
+        fname.write_bytes(b'\x89HDF\r\n\x1a\n' + b'\x00' * 64)
+        with h5io.open_h5(fname, 'a', logging.getLogger()) as h5fd:
+            self.assertEqual(len(h5fd.keys()), 0)
+        self.assertEqual(len(list(self.root.glob('corrupted.h5.corrupt-*'))), 1)
+
+        # a file opened elsewhere is not moved
+        with h5py.File(fname, 'r'):
+            with self.assertRaises(OSError):
+                h5io.open_h5(fname, 'a')
+        self.assertEqual(len(list(self.root.glob('corrupted.h5.corrupt-*'))), 1)
@@ -0,0 +1,68 @@
+import os
+import json
+import logging
+import tempfile
+import unittest
+
+import numpy as np
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from mini_utils.telemetry import Telemetry
+
+def _unit(telemetry: Telemetry, fname: Path, rows: int):
+    with telemetry.stage('write', unit = fname.name) as record:
+        fname.write_bytes(b'x' * rows)
+        record['rows'] = rows
+
+class TestTelemetry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_report(self):
+        telemetry = Telemetry(logging.getLogger())
+        # the units of the worker processes are recorded
+        with telemetry.stage('build', unit = 'test'):
+            with ProcessPoolExecutor(max_workers = 2) as executor:
+                list(executor.map(_unit, [telemetry] * 4, [ self.root.joinpath(f"unit{i}") for i in range(4) ], [1000] * 4))
+        with self.assertRaises(ValueError):
+            with telemetry.stage('write', unit = 'failed'):
+                raise ValueError()
+
+        stages = telemetry.report(self.root.joinpath('report.json'), dataset = 'test')
+        self.assertEqual(stages['write']['units'], 5)
+        self.assertEqual(stages['write']['errors'], 1)
+        self.assertEqual(stages['write']['rows'], 4000)
+        self.assertEqual(stages['build']['units'], 1)
+        self.assertGreater(stages['build']['peak_rss'], 0)
+
+        report = json.loads(self.root.joinpath('report.json').read_text())
+        self.assertEqual(report['meta'], {'dataset': 'test'})
+        self.assertEqual(len(report['records']), 6)
+        self.assertEqual(sorted([ r['unit'] for r in report['records'] if r['stage'] == 'write' and 'error' not in r ]),
+                         [ f"unit{i}" for i in range(4) ])
+        # a new sink after the report
+        self.assertEqual(telemetry.records(), [])
+
+    @unittest.skipUnless(os.path.exists('/proc/self/clear_refs'), 'the peak of a stage needs /proc/self/clear_refs')
+    def test_stage_peak(self):
+        telemetry = Telemetry(logging.getLogger())
+        with telemetry.stage('build', unit = 'test'):
+            with telemetry.stage('large') as record:
+                table = np.ones(2**25)
+                record['rows'] = len(table)
+            del table
+            with telemetry.stage('small') as record:
+                record['rows'] = len(np.ones(2**10))
+        records = { r['stage']: r for r in telemetry.records() }
+        # the small stage after the large one does not report its peak, the enclosing stage does
+        self.assertGreater(records['large']['peak_rss'] - records['small']['peak_rss'], 2**27)
+        self.assertGreaterEqual(records['build']['peak_rss'], records['large']['peak_rss'])
+        self.assertGreaterEqual(records['small']['process_peak_rss'], records['large']['peak_rss'])
+        telemetry.report(self.root.joinpath('report.json'))
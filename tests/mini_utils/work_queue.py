@@ -0,0 +1,128 @@
+import os
+import time
+import logging
+import tempfile
+import unittest
+import threading
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from mini_utils.work_queue import WorkQueue
+
+def _work(root: str, out: str):
+    # a node of the cluster, each task appends its name to out
+    def execute(name, payload):
+        if payload.get('fail', False):
+            raise RuntimeError(name)
+        with open(out, 'a') as fd:
+            fd.write(name + '\n')
+        return len(name)
+    return WorkQueue(root, lease_seconds = 60., logger = logging.getLogger()).run(execute, poll = 0.05)
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name).joinpath('queue')
+        self.out  = Path(self.tmp.name).joinpath('out.txt')
+        self.queue = WorkQueue(self.root, lease_seconds = 60., worker = 'test', logger = logging.getLogger())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_processes(self):
+        units = [ f"unit:{s}:chr{c}:10000" for s in ['a.bigWig', 'b.bigWig'] for c in range(1, 11) ]
+        for u in units:
+            self.assertTrue(self.queue.submit(u, {}))
+        self.queue.submit('merge', {}, deps = units)
+        self.assertFalse(self.queue.submit(units[0], {}))
+
+        with ProcessPoolExecutor(max_workers = 3) as executor:
+            reports = [ f.result() for f in [ executor.submit(_work, str(self.root), str(self.out)) for _ in range(3) ] ]
+
+        # every task is run once, the merge after all the units
+        lines = self.out.read_text().split()
+        self.assertEqual(sorted(lines), sorted(units + ['merge']))
+        self.assertEqual(lines[-1], 'merge')
+        self.assertEqual(sum([ len(r[WorkQueue.DONE]) for r in reports ]), len(units) + 1)
+        self.assertEqual(self.queue.result('merge'), len('merge'))
+
+    def test_lease_expiry(self):
+        self.queue.submit('unit', {})
+        task = self.queue.claim()
+        self.assertEqual(task['name'], 'unit')
+        self.assertIsNone(self.queue.claim())
+
+        # the worker died, its lease is not renewed
+        other = WorkQueue(self.root, lease_seconds = 60., worker = 'other', logger = logging.getLogger())
+        self.assertIsNone(other.claim())
+        lease = self.root.joinpath('leases', self.queue.task_id('unit'))
+        os.utime(lease, (time.time() - 120, time.time() - 120))
+        self.assertEqual(other.claim()['name'], 'unit')
+        self.assertEqual(lease.read_text(), 'other')
+
+        # the dead worker doesn't release the lease of the other
+        self.queue.release('unit')
+        self.assertEqual(self.queue.status('unit'), WorkQueue.RUNNING)
+        other.complete('unit', 1)
+        self.assertEqual(self.queue.status('unit'), WorkQueue.DONE)
+
+    def test_lease_renewal(self):
+        self.queue.submit('unit', {})
+        self.queue.claim()
+        lease = self.root.joinpath('leases', self.queue.task_id('unit'))
+        os.utime(lease, (time.time() - 120, time.time() - 120))
+
+        # the lease is renewed by its owner between the expiry seen by the other worker and the break
+        other = WorkQueue(self.root, lease_seconds = 60., worker = 'other', logger = logging.getLogger())
+        owner = other._lease_expired(lease)
+        self.assertEqual(owner, 'test')
+        self.queue.renew('unit')
+        other._break_lease('unit', owner)
+        self.assertEqual(lease.read_text(), 'test')
+        self.assertIsNone(other.claim())
+
+    def test_heartbeat(self):
+        queue = WorkQueue(self.root, lease_seconds = 0.6, worker = 'test', logger = logging.getLogger())
+        other = WorkQueue(self.root, lease_seconds = 0.6, worker = 'other', logger = logging.getLogger())
+        queue.submit('unit', {})
+        queue.claim()
+        lease = self.root.joinpath('leases', queue.task_id('unit'))
+        stop = threading.Event()
+        heartbeat = threading.Thread(target = queue._heartbeat, args = ('unit', stop), daemon = True)
+        heartbeat.start()
+
+        # the live lease is never broken by the other worker
+        for _ in range(10):
+            self.assertIsNone(other.claim())
+            time.sleep(0.1)
+        self.assertEqual(lease.read_text(), 'test')
+
+        # the lease missing for a tick is renewed at the next one
+        moved = lease.with_name('moved')
+        os.rename(lease, moved)
+        time.sleep(0.4)
+        os.rename(moved, lease)
+        os.utime(lease, (time.time() - 120, time.time() - 120))
+        time.sleep(0.4)
+        self.assertLess(time.time() - os.stat(lease).st_mtime, 0.6)
+        self.assertIsNone(other.claim())
+        self.assertTrue(heartbeat.is_alive())
+
+        # the heartbeat stops once the lease belongs to another worker
+        lease.write_text('other')
+        heartbeat.join(1.)
+        self.assertFalse(heartbeat.is_alive())
+        stop.set()
+
+    def test_failed_dependency(self):
+        self.queue.submit('download', {'fail': True})
+        self.queue.submit('unit', {}, deps = ['download'])
+        self.queue.submit('merge', {}, deps = ['unit'])
+        self.queue.submit('other', {})
+
+        report = _work(str(self.root), str(self.out))
+        self.assertEqual(report, {WorkQueue.DONE: ['other'], WorkQueue.FAILED: ['download']})
+        self.assertEqual(self.queue.blocked(), ['merge', 'unit'])
+        self.assertTrue(self.queue.finished())
@@ -0,0 +1,52 @@
+import logging
+import unittest
+
+import torch
+
+from models.attentions import ChannelAttention, channel_groups
+from benchmarks.attention import NaiveChannelAttention, run_benchmarks
+
+class TestChannelAttention(unittest.TestCase):
+
+    def test_channel_groups(self):
+        columns = ['E003-DNase_mean', 'E003-H3K27ac_mean', 'E004-DNase_mean', 'Align24mer_mean']
+        self.assertEqual(channel_groups(columns, ['DNase', 'H3K27ac']).tolist(), [0, 1, 0, 2])
+
+    def test_gates(self):
+        torch.manual_seed(0)
+        attention = ChannelAttention(12, reduction = 2)
+        x = torch.rand(5, 3, 12)
+        y = attention(x)
+        self.assertEqual(y.shape, x.shape)
+        gates = attention.gates(x)
+        self.assertTrue(((gates > 0) & (gates < 1)).all())
+        self.assertTrue(torch.allclose(y, x * gates[:, None, :]))
+        # the windows of an item share the gates, a window without neighbours too
+        self.assertTrue(torch.allclose(attention(x[:, 0]), x[:, 0] * attention.gates(x[:, :1])))
+
+    def test_grouped(self):
+        torch.manual_seed(0)
+        groups = torch.tensor([0, 0, 1, 1, 1, 2])
+        attention = ChannelAttention(6, groups = groups)
+        x = torch.rand(4, 2, 6)
+        gates = attention.gates(x)
+        # the channels of a group share their gate
+        self.assertTrue(torch.equal(gates[:, 0], gates[:, 1]))
+        self.assertTrue(torch.equal(gates[:, 2], gates[:, 4]))
+        self.assertEqual(tuple(attention.group_weights(x).shape), (4, 3))
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(attention(x), NaiveChannelAttention(attention)(x), atol = 1e-6))
+
+        with self.assertRaises(ValueError):
+            ChannelAttention(5, groups = groups)
+
+    def test_benchmark(self):
+        results = run_benchmarks(channels = 64, windows = [2], batch_sizes = [16], repeat = 1, logger = logging.getLogger('benchmarks'))
+        self.assertEqual(sorted(results['results']), ['channels/w2/b16', 'grouped/w2/b16'])
+        for r in results['results'].values():
+            for impl in ['fused', 'naive']:
+                self.assertGreater(r[impl]['backward_ms'], 0)
+                self.assertGreater(r[impl]['allocated_mb'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
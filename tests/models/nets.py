@@ -0,0 +1,45 @@
+import tempfile
+import unittest
+
+import torch
+
+from pathlib import Path
+
+from models.nets import DigDriverCNN, compile_model, export_torchscript
+
+class TestDigDriverCNN(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = DigDriverCNN(n_features = 12, n_heads = 3, n_resolutions = 2, conv_channels = [8], hidden = [16, 4],
+                                  groups = torch.arange(12) // 4)
+        self.x = torch.rand(6, 2, 5, 12)
+
+    def test_shapes(self):
+        self.assertEqual(tuple(self.model(self.x).shape), (6, 3))
+        self.assertEqual(tuple(self.model.embed(self.x).shape), (6, 4))
+        # one resolution without its axis
+        single = DigDriverCNN(n_features = 12, n_heads = 1, conv_channels = [8], hidden = [4])
+        self.assertEqual(tuple(single(self.x[:, 0]).shape), (6, 1))
+        with self.assertRaises(ValueError):
+            self.model(self.x[:, :1])
+        with self.assertRaises(ValueError):
+            DigDriverCNN(n_features = 12, n_heads = 1, kernel_size = 4)
+
+    def test_compile(self):
+        self.model.eval()
+        compiled = compile_model(self.model, backend = 'eager')
+        self.assertTrue(torch.allclose(compiled(self.x), self.model(self.x)))
+
+    def test_torchscript(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = Path(tmp).joinpath('model.pt')
+            export_torchscript(self.model, fname)
+            # the model is left in training mode
+            self.assertTrue(self.model.training)
+            loaded = torch.jit.load(str(fname))
+        self.model.eval()
+        self.assertTrue(torch.allclose(loaded(self.x), self.model(self.x), atol = 1e-5))
+
+if __name__ == '__main__':
+    unittest.main()
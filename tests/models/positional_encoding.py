@@ -0,0 +1,57 @@
+import math
+import unittest
+
+import torch
+
+from mini_utils.bio import Genome
+from models.encoding import GenomicLinearPositionalEncoding, RelativePositionalEncoding, TrigonometricPositionalEncoding
+
+class TestPositionalEncoding(unittest.TestCase):
+
+    def setUp(self):
+        self.genome = Genome(chrom_sizes = {'chr1': 1000000, 'chr2': 500000})
+
+    def test_trigonometric(self):
+        pe = TrigonometricPositionalEncoding(d_model = 4, resolutions = [100000], genome = self.genome)
+        # the windows of the largest chromosome
+        self.assertEqual(tuple(pe.table_0.shape), (10, 4))
+        x = pe.encode(torch.tensor([1]), torch.tensor([250000]), 100000)
+        t = 2
+        expected = [math.sin(t), math.cos(t), math.sin(t / 100), math.cos(t / 100)]
+        self.assertTrue(torch.allclose(x[0], torch.tensor(expected)))
+        # computed once, not saved with the model
+        self.assertEqual(len(pe.state_dict()), 0)
+
+    def test_linear(self):
+        pe = GenomicLinearPositionalEncoding(d_model = 2, resolutions = [100000], genome = self.genome)
+        x = pe.encode(torch.tensor([0]), torch.tensor([300000]), 100000)
+        self.assertTrue(torch.allclose(x[0], torch.tensor([3., 0.0003])))
+
+    def test_multi_resolution(self):
+        pe = TrigonometricPositionalEncoding(d_model = {100000: 4, 500000: 2}, resolutions = [100000, 500000], genome = self.genome)
+        chroms = torch.tensor([[0, 0, 1], [1, 0, 0]])
+        starts = torch.tensor([[0, 700000, 499999], [100000, 999999, 500000]])
+        x = pe(chroms, starts)
+        self.assertEqual(tuple(x.shape), (2, 3, 6))
+        self.assertTrue(torch.equal(x[..., :4], pe.encode(chroms, starts, 100000)))
+        self.assertTrue(torch.equal(x[..., 4:], pe.encode(chroms, starts, 500000)))
+
+        out = torch.empty(2, 3, 6)
+        self.assertIs(pe(chroms, starts, out = out), out)
+        self.assertTrue(torch.equal(out, x))
+
+    def test_relative(self):
+        pe = RelativePositionalEncoding(d_model = 2, resolutions = [100000], length = 10, genome = self.genome)
+        # a row per window of every chromosome
+        self.assertEqual(tuple(pe.table_0.shape), (15, 2))
+        # the windows at 40% of chr1 and of chr2
+        x = pe(torch.tensor([0, 1]), torch.tensor([400000, 200000]))
+        self.assertTrue(torch.allclose(x[0], x[1]))
+        self.assertTrue(torch.allclose(x[0], torch.tensor([math.sin(4.), math.cos(4.)])))
+
+    def test_odd_size(self):
+        with self.assertRaises(ValueError):
+            TrigonometricPositionalEncoding(d_model = 3, genome = self.genome)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import torch
+
+from models.gp import SparseGP, fit
+
+class TestSparseGP(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.z = torch.rand(4000, 2) * 6
+        self.f = torch.stack([torch.sin(self.z[:, 0]), torch.cos(self.z[:, 1])], dim = 1)
+        self.y = self.f + torch.tensor([0.1, 0.2]) * torch.randn(4000, 2)
+
+    def test_prior(self):
+        gp = SparseGP.from_embeddings(self.z, 16, n_outputs = 2)
+        # q(v) is the prior before the fit
+        self.assertAlmostEqual(gp.kl().item(), 0., places = 5)
+        mean, var = gp(self.z[:10])
+        self.assertEqual(tuple(mean.shape), (10, 2))
+        self.assertTrue(torch.allclose(mean, torch.zeros(10, 2)))
+        self.assertTrue(torch.allclose(var, torch.ones(10, 2), atol = 1e-3))
+
+    def test_fit(self):
+        gp = SparseGP.from_embeddings(self.z, 32, n_outputs = 2)
+        batches = [ (self.z[s: s + 256], self.y[s: s + 256]) for s in range(0, len(self.z), 256) ]
+        history = fit(gp, batches, len(self.z), epochs = 30, lr = 0.03)
+        self.assertLess(history[-1], history[0])
+
+        mean, var = gp.predict(self.z, batch_size = 1000)
+        self.assertEqual(tuple(var.shape), (4000, 2))
+        rmse = ((mean - self.f) ** 2).mean(dim = 0).sqrt()
+        self.assertTrue((rmse < 0.1).all())
+        # the noise of each output
+        self.assertTrue(torch.allclose(torch.exp(gp.log_noise).sqrt(), torch.tensor([0.1, 0.2]), atol = 0.05))
+
+        # the batches of the prediction don't change it
+        full_mean, full_var = gp.predict(self.z[:500], batch_size = 500)
+        mean, var = gp.predict(self.z[:500], batch_size = 64)
+        self.assertTrue(torch.allclose(mean, full_mean, atol = 1e-5))
+        self.assertTrue(torch.allclose(var, full_var, atol = 1e-5))
+
+if __name__ == '__main__':
+    unittest.main()
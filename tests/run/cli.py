@@ -0,0 +1,48 @@
+import h5py
+import logging
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from run.cli import make_parser, select_targets, build
+from tests.datasets.bigwig import write_bigwig
+
+class TestBuildCli(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        raw_path = self.root.joinpath('download', 'Raw_Mappability')
+        raw_path.mkdir(parents = True)
+        for i, mer in enumerate([24, 36, 40, 50, 75, 100]):
+            write_bigwig(raw_path.joinpath(f"wgEncodeCrgMapabilityAlign{mer}mer.bigWig"), value = i, n_intervals = 2, seed = i)
+        self.config = self.root.joinpath('datasets.yaml')
+        self.config.write_text(f"root:\n  download: \"{self.root.joinpath('download')}\"\n  h5: \"{self.root.joinpath('h5')}\"\n"
+                               "Mappability:\n  download: \"Raw_Mappability\"\n  h5: \"H5_Mappability\"\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_select_targets(self):
+        self.assertEqual(select_targets(['PCAWG']), ['ReferenceGenome', 'PCAWG'])
+        self.assertEqual(select_targets(['Epigenomics', 'Mappability']), ['Mappability', 'Epigenomics'])
+        with self.assertRaises(ValueError):
+            select_targets(['Mapability'])
+
+    def test_build(self):
+        argv = ['build', '--targets', 'Mappability', '--resolutions', '50000000', '--jobs', '2', '--config', str(self.config)]
+        summary = self.root.joinpath('h5', 'H5_Mappability', 'Mappability.h5')
+
+        self.assertEqual(build(make_parser().parse_args(argv + ['--dry-run']), logging.getLogger()), 0)
+        self.assertFalse(summary.exists())
+
+        # a quick build of one chromosome, then the whole genome
+        self.assertEqual(build(make_parser().parse_args(argv + ['--chromosomes', 'chr21']), logging.getLogger()), 0)
+        with h5py.File(summary, 'r') as h5fd:
+            self.assertEqual(list(h5fd.keys()), ['chr21', 'stats'])
+
+        self.assertEqual(build(make_parser().parse_args(argv), logging.getLogger()), 0)
+        with h5py.File(summary, 'r') as h5fd:
+            self.assertEqual(h5fd['chr1/50000000_0'].shape, (5, 6))
+            self.assertEqual(len(h5fd.keys()), 23 + 1)
@@ -0,0 +1,46 @@
+import os
+import h5py
+import logging
+import tempfile
+import unittest
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from mini_utils.work_queue import WorkQueue
+from run.cluster import submit_targets, work
+from tests.datasets.bigwig import write_bigwig
+
+class TestClusterBuild(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        raw_path = self.root.joinpath('download', 'Raw_Mappability')
+        raw_path.mkdir(parents = True)
+        for i, mer in enumerate([24, 36, 40, 50, 75, 100]):
+            write_bigwig(raw_path.joinpath(f"wgEncodeCrgMapabilityAlign{mer}mer.bigWig"), value = i, n_intervals = 2, seed = i)
+        self.paths = {'Mappability': (raw_path, self.root.joinpath('h5', 'H5_Mappability'))}
+        self.queue_root = self.root.joinpath('queue')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_nodes(self):
+        queue = WorkQueue(self.queue_root, logger = logging.getLogger())
+        # 6 downloads, 6 tracks x 23 chromosomes, the merge
+        self.assertEqual(submit_targets(queue, self.paths, ['Mappability'], [50000000]), 6 + 138 + 1)
+        self.assertEqual(submit_targets(queue, self.paths, ['Mappability'], [50000000]), 0)
+
+        # two nodes
+        with ProcessPoolExecutor(max_workers = 2) as executor:
+            futures = [ executor.submit(work, self.queue_root, self.paths, 'root', [50000000], poll = 0.05) for _ in range(2) ]
+            reports = [ f.result() for f in futures ]
+        self.assertEqual(sum([ len(r[WorkQueue.DONE]) for r in reports ]), 145)
+        self.assertEqual(sum([ len(r[WorkQueue.FAILED]) for r in reports ]), 0)
+
+        # the units are copied in the tracks by the merge
+        h5_path = self.paths['Mappability'][1]
+        self.assertEqual(os.listdir(h5_path.joinpath('units')), [])
+        with h5py.File(h5_path.joinpath('Mappability.h5'), 'r') as h5fd:
+            self.assertEqual(h5fd['chr1/50000000_0'].shape, (5, 6))
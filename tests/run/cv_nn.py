@@ -0,0 +1,68 @@
+import json
+import logging
+import tempfile
+import unittest
+
+import numpy as np
+
+from pathlib import Path
+
+from datasets import WindowGrid
+from mini_utils.bio import Genome
+from run.train_nn import load_config
+from run.cv_nn import cache_windows, chromosome_folds, cross_validate, fold_mask
+from tests.run.train_nn import COHORTS, write_training_inputs
+
+class TestCrossValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.config = load_config(write_training_inputs(self.root))
+        self.config['optim']['epochs'] = 1
+        self.config['cv']['folds'] = 3
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_folds(self):
+        grid = WindowGrid(10000000, 0, Genome().chrom_sizes)
+        folds = chromosome_folds(grid, 3)
+        self.assertEqual(sorted(sum(folds, [])), sorted(grid.chroms))
+        masks = np.stack([ fold_mask(grid, chroms) for chroms in folds ])
+        # each window is held out once, the folds have about the same windows
+        self.assertTrue((masks.sum(axis = 0) == 1).all())
+        self.assertLess(np.ptp(masks.sum(axis = 1)), grid.n_windows.max())
+        with self.assertRaises(ValueError):
+            chromosome_folds(grid, 1)
+
+    def test_cache(self):
+        cache = self.root.joinpath('cache')
+        meta = cache_windows(self.config['data'], cache, logging.getLogger())
+        self.assertEqual(meta['windows'], 316)
+        self.assertEqual(meta['heads'], COHORTS)
+        self.assertEqual(np.load(cache.joinpath('features.npy'), mmap_mode = 'r').shape, (316, len(meta['columns'])))
+        mtime = cache.joinpath('features.npy').stat().st_mtime_ns
+        # the cache is not written again
+        cache_windows(self.config['data'], cache, logging.getLogger())
+        self.assertEqual(cache.joinpath('features.npy').stat().st_mtime_ns, mtime)
+
+    def test_cross_validate(self):
+        reports = []
+        for jobs in [1, 2]:
+            self.config['cv']['jobs'] = jobs
+            reports.append(cross_validate(self.config, logging.getLogger()))
+        for report in reports:
+            self.assertEqual([ r['fold'] for r in report['folds'] ], [0, 1, 2])
+            self.assertEqual(sum([ r['test_windows'] for r in report['folds'] ]), 316)
+            for r in report['folds']:
+                self.assertEqual(r['train_windows'] + r['test_windows'], 316)
+                self.assertTrue(np.isfinite(r['loss']))
+            self.assertEqual(set(report['mean']['pearson']), set(COHORTS))
+        # the folds are seeded, the processes give the same metrics
+        self.assertAlmostEqual(reports[0]['mean']['loss'], reports[1]['mean']['loss'], places = 4)
+        written = json.loads(Path(self.config['output']).joinpath('cv.json').read_text())
+        self.assertEqual(len(written['folds']), 3)
+
+if __name__ == '__main__':
+    unittest.main()
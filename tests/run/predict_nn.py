@@ -0,0 +1,71 @@
+import h5py
+import logging
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+
+from pathlib import Path
+
+from datasets import WindowGrid
+from run.train_nn import load_config, train
+from run.predict_nn import load_model, predict
+from tests.run.train_nn import COHORTS, write_training_inputs
+
+class TestPredictNN(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        config = load_config(write_training_inputs(self.root))
+        config['optim']['epochs'] = 1
+        train(config, logging.getLogger())
+        self.model = self.root.joinpath('model', 'model.pt')
+        self.output = self.root.joinpath('predictions.h5')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_predict(self):
+        report = predict(self.model, self.output, resolutions = [50000000], batch_size = 7, block_windows = 10, logger = logging.getLogger())
+        grid = WindowGrid(10000000)
+        self.assertEqual(report['windows'], len(grid))
+
+        with h5py.File(self.output, 'r') as h5fd:
+            self.assertEqual(list(h5fd.attrs['heads']), COHORTS)
+            self.assertTrue(all([ h5fd[f"progress/{chr}"][:].all() for chr in grid.chroms ]))
+            rates = h5fd['Lymph-CLL/rates/chr1/10000000_0'][:]
+            coarse = h5fd['Lymph-CLL/rates/chr1/50000000_0'][:]
+        self.assertEqual(len(rates), grid.n_windows[0])
+        self.assertTrue((rates > 0).all())
+        # chr1 has 25 windows of 10 Mb, 5 of 50 Mb
+        self.assertTrue(np.allclose(coarse, rates.reshape(5, 5).sum(axis = 1)))
+
+        # the predictions of the model on the features of the first windows
+        checkpoint = torch.load(self.model, weights_only = False)
+        with h5py.File(self.root.joinpath('features.h5'), 'r') as fd:
+            x = torch.from_numpy(fd['chr1/10000000_0'][:3].astype(np.float32))
+        with torch.no_grad():
+            expected = torch.exp(load_model(checkpoint)(x))[:, COHORTS.index('Lymph-CLL')].numpy()
+        self.assertTrue(np.allclose(rates[:3], expected, rtol = 1e-5))
+
+        # nothing left to predict
+        self.assertEqual(predict(self.model, self.output, block_windows = 10, logger = logging.getLogger())['windows'], 0)
+
+    def test_resume_and_jobs(self):
+        predict(self.model, self.output, block_windows = 10, logger = logging.getLogger())
+        with h5py.File(self.output, 'r') as h5fd:
+            expected = h5fd['Breast-AdenoCa/rates/chr2/10000000_0'][:]
+        # an interrupted run, the blocks of chr2 are not written
+        with h5py.File(self.output, 'a') as h5fd:
+            h5fd['progress/chr2'][:] = False
+            h5fd['Breast-AdenoCa/rates/chr2/10000000_0'][:] = 0
+
+        report = predict(self.model, self.output, jobs = 2, block_windows = 10, logger = logging.getLogger())
+        self.assertEqual(report['windows'], WindowGrid(10000000).n_windows[1])
+        with h5py.File(self.output, 'r') as h5fd:
+            self.assertTrue(np.allclose(h5fd['Breast-AdenoCa/rates/chr2/10000000_0'][:], expected))
+
+if __name__ == '__main__':
+    unittest.main()
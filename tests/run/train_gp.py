@@ -0,0 +1,39 @@
+import logging
+import tempfile
+import unittest
+
+import torch
+
+from pathlib import Path
+
+from run.train_nn import load_config, train
+from run.train_gp import load_gp, train_gp
+from tests.run.train_nn import COHORTS, write_training_inputs
+
+class TestTrainGP(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        config = load_config(write_training_inputs(self.root))
+        config['optim']['epochs'] = 1
+        train(config, logging.getLogger())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_train_gp(self):
+        output = self.root.joinpath('model', 'gp.pt')
+        report = train_gp(self.root.joinpath('model', 'model.pt'), output, n_inducing = 16, epochs = 2, batch_size = 64,
+                          logger = logging.getLogger())
+        self.assertEqual(report['windows'], 316)
+        self.assertEqual(len(report['history']), 2)
+
+        gp = load_gp(output)
+        # the embeddings of the small model have 8 dimensions
+        mean, var = gp.predict(torch.zeros(3, 8))
+        self.assertEqual(tuple(mean.shape), (3, len(COHORTS)))
+        self.assertTrue((var > 0).all())
+
+if __name__ == '__main__':
+    unittest.main()
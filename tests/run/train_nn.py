@@ -0,0 +1,95 @@
+import math
+import logging
+import tempfile
+import unittest
+
+import torch
+
+from pathlib import Path
+
+from datasets import PCAWGDataset
+from benchmarks.synthetic import write_maf, write_summary
+from run.train_nn import Prefetcher, load_config, train
+
+COHORTS = ['Breast-AdenoCa', 'Lymph-CLL']
+
+def write_training_inputs(root: Path) -> Path:
+    """
+    a PCAWG dataset of 2 cohorts at 10 Mb, a summary of 4 features and the train.yaml of a small model
+    """
+    raw_path = root.joinpath('raw')
+    raw_path.mkdir()
+    for i, cohort in enumerate(COHORTS):
+        write_maf(raw_path.joinpath(f"{cohort}_SNV_MNV_INDEL.ICGC.annot.txt.gz"), 200, cohort = cohort, seed = i)
+    PCAWGDataset(h5_path = root.joinpath('h5'), raw_path = raw_path, designed_subsets = COHORTS,
+                 resolutions = [10000000], logger = logging.getLogger())
+    write_summary(root.joinpath('features.h5'), 10000000, n_columns = 4)
+
+    config = root.joinpath('train.yaml')
+    config.write_text(f"data:\n  raw_path: \"{raw_path}\"\n  h5_path: \"{root.joinpath('h5')}\"\n"
+                      f"  cohorts: {COHORTS}\n  resolution: 10000000\n  features: [\"{root.joinpath('features.h5')}\"]\n"
+                      "threads:\n  intra_op: 1\n"
+                      "loader:\n  batch_size: 64\n  workers: 0\n"
+                      "model:\n  hidden: [8]\n"
+                      "optim:\n  epochs: 2\n  accumulate: 2\n"
+                      f"output: \"{root.joinpath('model')}\"\n")
+    return config
+
+class TestTrainNN(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.config = write_training_inputs(self.root)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_config(self):
+        config = load_config(self.config)
+        self.assertEqual(config['loader']['batch_size'], 64)
+        # the values missing in the file
+        self.assertEqual(config['loader']['prefetch'], 8)
+        self.assertEqual(config['optim']['autocast'], 'bfloat16')
+
+    def test_train(self):
+        for workers in [0, 1]:
+            config = load_config(self.config)
+            config['loader']['workers'] = workers
+            history = train(config, logging.getLogger())
+            self.assertEqual(len(history), 2)
+            for h in history:
+                # 316 windows of 10 Mb in hg19, 5 batches, 3 optimizer steps
+                self.assertEqual(h['samples'], 316)
+                self.assertEqual(h['steps'], 3)
+                self.assertTrue(math.isfinite(h['loss']))
+                self.assertGreater(h['samples_per_sec'], 0)
+
+        checkpoint = torch.load(self.root.joinpath('model', 'model.pt'), weights_only = False)
+        self.assertEqual(checkpoint['heads'], COHORTS)
+        self.assertEqual(len(checkpoint['features']), 4)
+        self.assertTrue(self.root.joinpath('model', 'train.telemetry.json').is_file())
+
+    def test_cnn(self):
+        # the cnn needs the windows around each window, data.context is 0 by default
+        cnn = self.root.joinpath('cnn.yaml')
+        cnn.write_text(self.config.read_text().replace("model:\n", "model:\n  name: cnn\n"))
+        with self.assertRaises(ValueError):
+            load_config(cnn)
+        config = load_config(self.config)
+        config['data']['context'] = 1
+        config['model'].update(name = 'cnn', conv_channels = [8], hidden = [8])
+        config['optim']['epochs'] = 1
+        history = train(config, logging.getLogger())
+        self.assertEqual(history[0]['samples'], 316)
+        self.assertTrue(math.isfinite(history[0]['loss']))
+
+    def test_prefetcher_errors(self):
+        def batches():
+            yield torch.zeros(1), torch.zeros(1)
+            raise ValueError('unreadable batch')
+        with self.assertRaises(ValueError):
+            list(Prefetcher(batches(), depth = 1))
+
+if __name__ == '__main__':
+    unittest.main()